@@ -8,6 +8,10 @@ import json
 import sys
 import os
 from datetime import datetime
+import mahjong_advisor
+from mahjong_rules import compile_rules
+from mahjong_sync import state_mirror
+from mahjong_zobrist import state_matches
 
 # --- 配置和全局变量 (已修改) ---
 sio = socketio.Client()
@@ -22,15 +26,20 @@ _replacements = {
 last_refresh_time = time.time()
 current_user = {'name': '', 'server': '', 'connected': False, 'in_room': False, 'room_id': None, 'is_ready': False}
 current_room = {'name': 'Unknown', 'id': None, 'owner': 'Unknown', 'game': None, 'members': {}, 'messages': [], 'rules': {}, 'status': '', 'logs': []}
-room_list = []
+room_list = []  # 当前这一页的房间，大厅的增量事件直接改这个列表
+room_page = {'page': 1, 'pages': 1, 'total': 0, 'page_size': 20, 'filters': {}}
+ROOM_FILTERS = {'waiting': 'waiting', 'open': 'not_full', 'nopass': 'no_password'}  # list 命令的过滤词
 should_exit = threading.Event()
 displayed_actions = []
+pending_join = {}  # 房间在另一个服务器进程上时，改连过去后要加入的房间
 
 # 【核心修改】初始化 current_game_state 的新结构
 current_game_state = {
     'public': {},
     'private': {}
 }
+# 服务器只在开局和重新同步时发完整状态，之后发补丁 (见 mahjong_sync)，这里保存两路状态的本地镜像
+state_mirrors = {'public': state_mirror(), 'private': state_mirror()}
 
 # --- Public: ---
 # "status": self.status,
@@ -150,6 +159,14 @@ def print_room_list():
         password_icon = "🔒" if room['has_password'] else " "
         members_info = f"{room['members']}/{room['max_members']}"
         print(f"{i+1:<4} {room['name']:<20} {members_info:<8} {room['status']:<10} {password_icon}")
+    print(f"第 {room_page['page']}/{room_page['pages']} 页，共 {room_page['total']} 个房间")
+
+def _room_visible(room):
+    """房间是否符合当前列表的过滤条件"""
+    filters = room_page.get('filters', {})
+    return ((not filters.get('waiting') or room['status'] == 'waiting')
+            and (not filters.get('not_full') or room['members'] < room['max_members'])
+            and (not filters.get('no_password') or not room['has_password']))
 
 def print_game_view():
     public_state = current_game_state.get('public', {})
@@ -181,8 +198,11 @@ def print_game_view():
     joker_icon = _replacements.get(private_state.get('golden_tile', 'joker'), '🃏')
     print(f"牌墙剩余: {public_state.get('wall_count', 0)} 张 | 金牌: {joker_icon}")
     
+    # 服务器把一次操作内的多条播报合并成一个列表
     report = public_state.get('report')
-    if report: print(f"报告: {report}")
+    if isinstance(report, str): report = [report]
+    for line in report or ():
+        print(f"报告: {line}")
     
     if public_state.get('status') == 'finished':
         winner_id = public_state.get('winner_id')
@@ -269,6 +289,34 @@ def print_game_deck():
                 print(f"  {action_idx}: 吃 (Chow) with {pair_str}")
                 action_idx += 1
 
+def print_hint():
+    """本地计算出牌建议：向听数、有效牌张数，再用剩余时间做模拟"""
+    private_state = current_game_state.get('private', {})
+    public_state = current_game_state.get('public', {})
+    tiles = list(private_state.get('hands') or [])
+    if private_state.get('new'): tiles.append(private_state['new'])
+    if len(tiles) % 3 != 2:
+        print("❌ 现在不是你出牌的时候。")
+        return
+    visible = []
+    for player in public_state.get('players', []):
+        visible.extend(player.get('discarded', []))
+        for group in player.get('locked', []): visible.extend(group)
+    try:
+        ruleset = compile_rules(current_room.get('rules') or {})
+    except ValueError:
+        ruleset = None
+    counts, joker_count = mahjong_advisor.tile_counts(tiles)
+    unseen = mahjong_advisor.unseen_counts(tiles, visible, ruleset, private_state.get('golden_tile'))
+    ranked = mahjong_advisor.advise(counts, joker_count, unseen, ruleset, budget=0.2)
+    print("\n💡 出牌建议:")
+    for r in ranked[:3]:
+        tile = _replacements.get(r['tile'], r['tile'])
+        state = "听牌" if r['shanten'] == 0 else f"{r['shanten']} 向听"
+        rate = f"，模拟胡牌率 {r['win_rate']:.0%}" if 'win_rate' in r else ''
+        print(f"  打 {tile}: {state}，有效牌 {r['live']} 张{rate}")
+
+
 def print_room_info():
     if not current_user['in_room']: return
     if current_room.get('status') in ['playing', 'finished']:
@@ -300,12 +348,14 @@ def print_menu():
         config.list_items(config.config.get('name list',{}), "可用名称")
         config.list_items(config.config.get('server list',{}), "可用服务器")
     elif not current_user['in_room']:
-        print("  list - 刷新房间列表\n  create - 创建房间\n  join <房号> [密码] - 加入房间\n  disconnect - 断开连接\n  quit - 退出")
+        print("  list [页码] [waiting] [open] [nopass] - 查询房间列表 (只看等待中 / 未满 / 无密码的房间)\n  create - 创建房间\n  join <房号> [密码] - 加入房间\n  disconnect - 断开连接\n  quit - 退出")
     elif current_room.get('status') == 'playing':
         # --- 核心修改：根据有无待选操作，显示不同提示 ---
         if displayed_actions:
             print("  a <序号> - 执行一个操作 (例如: a 1 选择'过')")
+            print("  p - 过 (所有人都表态后立即结算，不必等到超时)")
         print("  d <序号> - 打出一张牌 (输入 'd' 打出新摸的牌)")
+        print("  hint - 出牌建议")
         print("  leave - 离开房间")
     else: # 等待或结束状态
         print("  chat <消息> - 发送聊天\n  ready - 切换准备状态\n  rules <JSON> - 修改规则(房主)\n  leave - 离开房间\n  quit - 退出")
@@ -318,8 +368,14 @@ def join_room_result(data):
     if data['success']:
         print(f"\n✅ {data['message']}")
         current_user.update({'in_room': True, 'room_id': data.get('id')})
-        global current_game_state
+        global current_game_state, state_mirrors
         current_game_state = {'public': {}, 'private': {}} # 重置为初始结构
+        state_mirrors = {'public': state_mirror(), 'private': state_mirror()}
+    elif data.get('redirect'):
+        # 多进程部署：房间归另一个进程所有，断开后连到该进程再加入
+        print(f"\n🔀 {data['message']}")
+        pending_join.update({'room_id': data['room_id'], 'password': data.get('password', '')})
+        threading.Thread(target=_redirect, args=(data['redirect'],), daemon=True).start()
     else:
         print(f"\n❌ {data['message']}")
     
@@ -336,21 +392,38 @@ def game_initialized(data):
     print("\n" + "="*20 + f"\n      🎉 游戏开始！🎉\n  你的座位: 【{my_seat}】\n  本局金牌: 【{_replacements.get(data.get('golden_tile'), data.get('golden_tile'))}】\n" + "="*20)
     refresh_display()
 
-@sio.event
-def game_state_update(data):
-    """收到公共状态，完全替换 public 部分"""
-    current_game_state['public'] = data
-    current_room['status'] = data.get('status', current_room['status'])
+def _on_state_frame(frame):
+    """关键帧和补丁共用：更新本地镜像，序号不连续或哈希对不上时请求关键帧"""
+    channel = frame.get('channel', 'public')
+    mirror = state_mirrors[channel]
+    if not mirror.receive(frame):
+        sio.emit('request_keyframe', {'channel': channel})
+        return
+    if channel == 'public':
+        if not state_matches({**mirror.state, 'state_hash': frame.get('state_hash')}):
+            print("⚠️ 本地牌局状态与服务器不一致 (状态哈希不同)，正在重新同步...")
+            sio.emit('request_keyframe', {'channel': channel})
+        data = dict(mirror.state)
+        data['report'] = frame.get('report')
+        current_game_state['public'] = data
+        current_room['status'] = data.get('status', current_room['status'])
+    else:
+        # 同时保留从 game_initialized 获得的初始信息
+        data = dict(mirror.state)
+        data['my_id'] = current_game_state['private'].get('my_id')
+        data['golden_tile'] = current_game_state['private'].get('golden_tile')
+        current_game_state['private'] = data
     refresh_display()
 
 @sio.event
-def private_state_update(data):
-    """收到私有状态，完全替换 private 部分"""
-    # 同时保留从 game_initialized 获得的初始信息
-    data['my_id'] = current_game_state['private'].get('my_id')
-    data['golden_tile'] = current_game_state['private'].get('golden_tile')
-    current_game_state['private'] = data
-    refresh_display()
+def state_keyframe(data):
+    """收到完整状态 (开局或重新同步)"""
+    _on_state_frame(data)
+
+@sio.event
+def state_patch(data):
+    """收到状态补丁"""
+    _on_state_frame(data)
 
 # --- 其他事件和函数 (无变化) ---
 @sio.event
@@ -366,21 +439,58 @@ def disconnect():
 def connect_error(data): print(f"\n❌ 连接错误: {data}")
 @sio.event
 def connection_rejected(data): print(f"\n❌ 连接被拒绝: {data.get('reason', '未知原因')}")
+def _redirect(server):
+    """不能在事件回调里断开重连，放在单独的线程里做"""
+    try:
+        sio.disconnect()
+        current_user['server'] = server
+        sio.connect(server, transports=['websocket'])
+    except Exception as e:
+        pending_join.clear()
+        print(f"❌ 连接失败: {e}")
 @sio.event
 def join_server_result(data):
     if data['success']:
         print(f"\n✅ {data['message']}")
         current_user['connected'] = True
-        global room_list
-        room_list = data.get('room_list', [])
+        if pending_join:
+            sio.emit('join_room', dict(pending_join))
+            pending_join.clear()
     else:
         print(f"\n❌ {data['message']}")
         sio.disconnect()
     refresh_display()
 @sio.event
-def room_list_update(data):
+def room_list_page(data):
+    """一页房间列表 (查询结果，或回到大厅时服务器补发的当前页)"""
     global room_list
-    room_list = data
+    room_list = data.get('rooms', [])
+    room_page.update({k: data[k] for k in ('page', 'pages', 'total', 'page_size', 'filters') if k in data})
+    if not current_user['in_room']: refresh_display()
+@sio.event
+def room_added(data):
+    if not _room_visible(data): return
+    room_page['total'] += 1
+    if len(room_list) < room_page['page_size']: room_list.append(data)
+    if not current_user['in_room']: refresh_display()
+@sio.event
+def room_updated(data):
+    """只带变化的字段；不再符合过滤条件的房间从当前页移除"""
+    for i, room in enumerate(room_list):
+        if room['id'] == data['id']:
+            room.update(data)
+            if not _room_visible(room):
+                del room_list[i]
+                room_page['total'] -= 1
+            break
+    if not current_user['in_room']: refresh_display()
+@sio.event
+def room_removed(data):
+    for i, room in enumerate(room_list):
+        if room['id'] == data['id']:
+            del room_list[i]
+            room_page['total'] -= 1
+            break
     if not current_user['in_room']: refresh_display()
 @sio.event
 def create_room_result(data):
@@ -414,18 +524,20 @@ def game_action_result(data):
 def room_deleted(data):
     print(f"\n🏠 {data['message']}")
     current_user.update({'in_room': False, 'room_id': None, 'is_ready': False})
-    global current_room, current_game_state
+    global current_room, current_game_state, state_mirrors
     current_room = {'name': 'Unknown', 'id': None, 'owner': 'Unknown', 'game': None, 'members': {}, 'messages': [], 'rules': {}, 'status': '', 'logs': []}
     current_game_state = {'public': {}, 'private': {}}
+    state_mirrors = {'public': state_mirror(), 'private': state_mirror()}
     refresh_display()
 @sio.event
 def leave_room_result(data):
     if data['success']:
         print(f"\n✅ {data['message']}")
         current_user.update({'in_room': False, 'room_id': None, 'is_ready': False})
-        global current_room, current_game_state
+        global current_room, current_game_state, state_mirrors
         current_room = {'name': 'Unknown', 'id': None, 'owner': 'Unknown', 'game': None, 'members': {}, 'messages': [], 'rules': {}, 'status': '', 'logs': []}
         current_game_state = {'public': {}, 'private': {}}
+        state_mirrors = {'public': state_mirror(), 'private': state_mirror()}
         refresh_display()
 @sio.event
 def chat_message(data):
@@ -493,7 +605,12 @@ def handle_command(command):
         return
 
     if not current_user['in_room']:
-        if cmd == 'list': sio.emit('request_room_list', {})
+        if cmd == 'list':
+            query = {'page': 1, 'page_size': room_page['page_size']}
+            for word in parts[1:]:
+                if word.isdigit(): query['page'] = int(word)
+                elif word in ROOM_FILTERS: query[ROOM_FILTERS[word]] = True
+            sio.emit('request_room_list', query)
         elif cmd == 'create':
             room_name = input("请输入房间名: ").strip()
             if room_name: sio.emit('create_room', {'name': room_name, 'password': input("请输入房间密码 (可选): ").strip()})
@@ -535,6 +652,11 @@ def handle_command(command):
                 except (ValueError, IndexError):
                     print("❌ 请输入有效的操作序号 (例如: a 1)")
                 
+            elif cmd in ('p', 'pass'):
+                if not displayed_actions:
+                    print("❌ 当前没有可供选择的操作。")
+                    return
+                sio.emit('game_action', {'action': 'pass'})
             elif cmd in ('d', 'discard'):
                 action_payload = {'action': 'discard'}
                 try:
@@ -544,8 +666,10 @@ def handle_command(command):
                     # 如果没有提供序号 (例如只输入 'd')，则设为 None
                     action_payload['tileindex'] = None
                 sio.emit('game_action', action_payload)
+            elif cmd in ('h', 'hint'):
+                print_hint()
             else:
-                print(f"❌ 游戏中未知命令: {cmd}。可用命令: a(操作), d(出牌), leave, chat。")
+                print(f"❌ 游戏中未知命令: {cmd}。可用命令: a(操作), p(过), d(出牌), hint(建议), leave, chat。")
         
         else: # 房间处于等待或结束状态
             if cmd in ('ready', 'r'):
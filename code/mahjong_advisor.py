@@ -0,0 +1,201 @@
+"""
+限时出牌建议。
+
+先按向听数和有效牌剩余张数给每种可打的牌排序 (这一步很快，结果一定先算好)，
+再在剩余时间里对排名靠前的几种做蒙特卡洛模拟：从未现身的牌里随机摸牌，
+按向听数贪心出牌，统计在若干巡内胡牌的比例，用胡牌率重新排序。
+模拟可以交给进程池 (multiprocessing.Pool) 跑，调用方只等到时间预算用完，超时的结果直接丢弃，
+因此不管模拟是否完成，在预算内总能拿到一个建议。
+
+在 eventlet 服务器里请通过 eventlet.tpool.execute(advise, ...) 调用，避免阻塞事件循环。
+"""
+
+import random
+import time
+
+from mahjong_hu import can_hu
+from mahjong_rules import compile_rules
+from mahjong_shanten import discard_shanten, isolation, shanten, useful_tiles
+from mahjong_tiles import NUM_KINDS, JOKER, JOKER_CODE, TILE_INDEX, tile_name
+
+DEFAULT_BUDGET = 0.05   # 秒
+DEFAULT_DRAWS = 10      # 每次模拟最多摸几张
+ROLLOUT_CANDIDATES = 4  # 只对排名前几的牌做模拟
+
+
+def unseen_counts(own_tiles, visible_tiles, ruleset=None, golden_tile=None):
+    """
+    从自己的角度看还没现身的牌：每种牌的总数减去自己的手牌和所有人的弃牌、明牌。
+    golden_tile 为翻出的金牌，所有同种牌都已变成金牌 (总数按 joker_count 计)。
+    返回长度 NUM_KINDS + 1 的 bytearray (金牌为 JOKER_CODE)。
+    """
+    ruleset = compile_rules(ruleset)
+    unseen = bytearray(NUM_KINDS + 1)
+    for name in ruleset.main_tiles:
+        unseen[TILE_INDEX[name]] = 4
+    if ruleset.has_joker and golden_tile in TILE_INDEX:
+        unseen[TILE_INDEX[golden_tile]] = 0
+        unseen[JOKER_CODE] = ruleset.joker_count
+    for tile in list(own_tiles) + list(visible_tiles):
+        code = JOKER_CODE if tile == JOKER else TILE_INDEX.get(tile)
+        if code is not None and unseen[code]: unseen[code] -= 1
+    return unseen
+
+
+def rank_discards(counts, joker_count, unseen=None, allow_all_pairs=False):
+    """
+    3n+2 张的手牌，对每种可打的牌给出打完后的向听数和有效牌。返回按 (向听数, -有效牌张数, 关联度) 排好的列表：
+        {'code', 'tile', 'shanten', 'useful' (有效牌编码列表), 'live' (有效牌还剩几张), 'isolation' (见 mahjong_shanten.isolation)}
+    """
+    buf = bytearray(counts)
+    after = discard_shanten(buf, joker_count, allow_all_pairs)
+    candidates = list(after)
+    ranked = []
+    for code in candidates:
+        current = after[code]
+        buf[code] -= 1
+        useful = useful_tiles(buf, joker_count, allow_all_pairs, current)
+        score = isolation(buf, code)
+        buf[code] += 1
+        live = sum(unseen[t] for t in useful) if unseen is not None else len(useful)
+        ranked.append({'code': code, 'tile': tile_name(code), 'shanten': current, 'useful': useful, 'live': live,
+                       'isolation': score})
+    if not candidates and joker_count:
+        # 手里只剩金牌
+        ranked.append({'code': JOKER_CODE, 'tile': JOKER, 'shanten': shanten(buf, joker_count - 1, allow_all_pairs),
+                       'useful': [], 'live': 0, 'isolation': isolation(buf, JOKER_CODE)})
+    ranked.sort(key=lambda r: (r['shanten'], -r['live'], r['isolation']))
+    return ranked
+
+
+def _greedy_discard(counts, joker_count, allow_all_pairs):
+    best, best_key = None, None
+    for code, value in discard_shanten(counts, joker_count, allow_all_pairs).items():
+        counts[code] -= 1
+        key = (value, isolation(counts, code))
+        counts[code] += 1
+        if best_key is None or key < best_key:
+            best, best_key = code, key
+    return best
+
+
+def _rollout(counts, joker_count, pool, draws, rng, allow_all_pairs, three_jokers_win=False):
+    """打完候选牌后的 3n+1 张手牌，随机摸 draws 张，胡了 (含规则允许的三金倒) 返回 True"""
+    counts = bytearray(counts)
+    pool = list(pool)
+    for _ in range(draws):
+        if not pool: return False
+        i = rng.randrange(len(pool))
+        pool[i], pool[-1] = pool[-1], pool[i]
+        code = pool.pop()
+        if code == JOKER_CODE:
+            joker_count += 1
+        else:
+            counts[code] += 1
+        if can_hu(counts, joker_count, three_jokers_win, allow_all_pairs):
+            return True
+        discard = _greedy_discard(counts, joker_count, allow_all_pairs)
+        if discard is None: return False
+        counts[discard] -= 1
+    return False
+
+
+def rollout_worker(args):
+    """
+    进程池任务：对每个候选在 budget 秒内轮流做模拟，返回 [(胡牌次数, 模拟次数), ...]。
+    参数打包成一个元组以便 Pool.map_async 使用。
+    """
+    counts, joker_count, unseen, candidates, draws, seed, budget, allow_all_pairs, three_jokers_win = args
+    rng = random.Random(seed)
+    deadline = time.perf_counter() + budget
+    pool = [code for code in range(NUM_KINDS + 1) for _ in range(unseen[code])]
+    hands = []
+    for code in candidates:
+        hand = bytearray(counts)
+        jokers = joker_count
+        if code == JOKER_CODE: jokers -= 1
+        else: hand[code] -= 1
+        hands.append((hand, jokers))
+    results = [[0, 0] for _ in candidates]
+    i = 0
+    while time.perf_counter() < deadline:
+        hand, jokers = hands[i]
+        results[i][0] += _rollout(hand, jokers, pool, draws, rng, allow_all_pairs, three_jokers_win)
+        results[i][1] += 1
+        i = (i + 1) % len(hands)
+    return [tuple(r) for r in results]
+
+
+def advise(counts, joker_count, unseen, ruleset=None, budget=DEFAULT_BUDGET, draws=DEFAULT_DRAWS,
+           pool=None, seed=None, candidates=ROLLOUT_CANDIDATES):
+    """
+    出牌建议，返回 rank_discards 的列表，排名前 candidates 的项多了 'wins' / 'rollouts' / 'win_rate'，
+    并按 (胡牌率, 原排名) 重新排序；第一项即建议打出的牌。
+    pool 为 multiprocessing.Pool 时模拟分给各进程；为 None 时在当前线程内模拟。
+    budget 是整个调用的硬时间上限 (秒)，排序本身的耗时也算在内。
+    """
+    start = time.perf_counter()
+    ruleset = compile_rules(ruleset)
+    ranked = rank_discards(counts, joker_count, unseen, ruleset.allow_all_pairs)
+    top = ranked[:candidates]
+    if len(top) < 2 or top[0]['shanten'] < 0:
+        return ranked
+    # 向听数明显落后的候选不值得模拟
+    top = [r for r in top if r['shanten'] <= top[0]['shanten'] + 1]
+    if len(top) < 2:
+        return ranked
+
+    remaining = budget - (time.perf_counter() - start)
+    if remaining <= 0.005:
+        return ranked
+    if seed is None: seed = random.getrandbits(32)
+    codes = [r['code'] for r in top]
+
+    def task(i, share):
+        return (bytes(counts), joker_count, bytes(unseen), codes, draws, seed + i, share, ruleset.allow_all_pairs,
+                ruleset.three_jokers_win)
+
+    totals = [[0, 0] for _ in top]
+    if pool is None:
+        chunks = [rollout_worker(task(0, remaining * 0.9))]
+    else:
+        workers = getattr(pool, '_processes', 1) or 1
+        # 进程池的调度和序列化也要时间，给每个任务留出余量
+        pending = pool.map_async(rollout_worker, [task(i, remaining * 0.6) for i in range(workers)])
+        try:
+            chunks = pending.get(timeout=max(budget - (time.perf_counter() - start), 0.001))
+        except Exception:
+            chunks = []  # 超时：只用向听数排序的结果
+    for chunk in chunks:
+        for i, (wins, trials) in enumerate(chunk):
+            totals[i][0] += wins
+            totals[i][1] += trials
+
+    for r, (wins, trials) in zip(top, totals):
+        r['wins'], r['rollouts'] = wins, trials
+        r['win_rate'] = wins / trials if trials else 0.0
+    order = {id(r): i for i, r in enumerate(ranked)}
+    top.sort(key=lambda r: (-r['win_rate'], order[id(r)]))
+    rest = [r for r in ranked if 'win_rate' not in r]
+    return top + rest
+
+
+def tile_counts(tiles):
+    """牌名列表 -> (计数向量, 金牌数)，不认识的牌 (花牌等) 忽略"""
+    counts = bytearray(NUM_KINDS)
+    joker_count = 0
+    for tile in tiles:
+        if tile == JOKER: joker_count += 1
+        elif tile in TILE_INDEX: counts[TILE_INDEX[tile]] += 1
+    return counts, joker_count
+
+
+def best_discard(tiles, visible_tiles=(), ruleset=None, golden_tile=None, budget=DEFAULT_BUDGET, pool=None):
+    """
+    牌名接口：tiles 为 3n+2 张手牌 (金牌记作 'joker')，visible_tiles 为场上已经现身的牌。
+    返回建议打出的牌名，手牌为空时返回 None。
+    """
+    counts, joker_count = tile_counts(tiles)
+    unseen = unseen_counts(tiles, visible_tiles, ruleset, golden_tile)
+    ranked = advise(counts, joker_count, unseen, ruleset, budget=budget, pool=pool)
+    return ranked[0]['tile'] if ranked else None
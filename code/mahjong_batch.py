@@ -0,0 +1,170 @@
+"""
+NumPy 批量胡牌判断，用于模拟和机器人：一次评估成千上万手牌。
+
+输入为 (N, 34) 的计数矩阵和 (N,) 的金牌数，返回胡牌布尔向量和 (N, 35) 的听牌掩码
+(第 35 列为金牌)。规则可以是规则字典或 mahjong_ruleset，与 mahjong_game 相同，结果与 mahjong_hu 的逐手判断完全一致。
+
+花色模式编码为 6 进制整数，查一张按需填充的稠密表 (缺的项交给 mahjong_hu 计算一次)，
+之后全部是数组运算。运行 python mahjong_batch.py 可以看到与逐手判断的速度对比。
+"""
+
+import time
+
+import numpy as np
+
+import mahjong_hu
+from mahjong_rules import compile_rules
+from mahjong_tiles import HONOR_START, NUM_KINDS, JOKER_CODE
+
+_BASE = 6  # 听牌时某种牌可能加到 5 张，因此用 6 进制
+_POWERS = _BASE ** np.arange(mahjong_hu.SUIT_SIZE, dtype=np.int64)
+_UNKNOWN = -1
+
+_dense_table = None  # (2, 6**9) int8，[0] 无将代价，[1] 含将代价
+_HONOR_COST = np.array(mahjong_hu._HONOR_COST, dtype=np.int16)
+
+
+def _table():
+    global _dense_table
+    if _dense_table is None:
+        _dense_table = np.full((2, _BASE ** mahjong_hu.SUIT_SIZE), _UNKNOWN, dtype=np.int8)
+    return _dense_table
+
+
+def _suit_codes(counts):
+    """(N, 9) -> (N,) 6 进制花色编码"""
+    return counts.astype(np.int64) @ _POWERS
+
+
+def _lookup(codes):
+    """花色编码 -> (无将代价, 含将代价)，表中没有的模式先逐个补上"""
+    table = _table()
+    missing = table[0, codes] == _UNKNOWN
+    if missing.any():
+        todo = np.unique(codes[missing])
+        digits = (todo[:, None] // _POWERS) % _BASE
+        for code, pattern in zip(todo.tolist(), digits.astype(np.uint8)):
+            table[:, code] = mahjong_hu._suit_entry(pattern.tobytes())
+    return table[0, codes].astype(np.int16), table[1, codes].astype(np.int16)
+
+
+def _honor_costs(honors):
+    costs = _HONOR_COST[honors]  # (N, 7, 2)
+    no_pair = costs[..., 0].sum(axis=1)
+    pair_extra = np.minimum((costs[..., 1] - costs[..., 0]).min(axis=1), 2)
+    return no_pair, no_pair + pair_extra
+
+
+def _combine(groups):
+    no_pair = sum(g[0] for g in groups)
+    pair_extra = np.full_like(no_pair, 2)
+    for g in groups:
+        np.minimum(pair_extra, g[1] - g[0], out=pair_extra)
+    return no_pair + pair_extra
+
+
+def _wins(cost, holes, hand_size, jokers, three_jokers_win, allow_all_pairs):
+    win = ((hand_size - 2) % 3 == 0) & (cost <= jokers)
+    if allow_all_pairs:
+        win |= (hand_size % 2 == 0) & (jokers >= holes) & ((jokers - holes) % 2 == 0)
+    if three_jokers_win:
+        win |= jokers >= 3
+    return win
+
+
+def evaluate_hands(counts, jokers, game_rules=None, with_waits=True):
+    """
+    counts: (N, 34) 计数矩阵 (每种 0~4 张)，jokers: (N,) 金牌数。
+    返回 (wins, waits)：wins 为 (N,) 布尔向量；waits 为 (N, 35) 布尔矩阵，
+    waits[i, t] 表示第 i 手牌再进编码为 t 的牌即可胡 (t == 34 为金牌)。with_waits=False 时 waits 为 None。
+    """
+    ruleset = compile_rules(game_rules)
+    three_jokers_win = ruleset.three_jokers_win
+    allow_all_pairs = ruleset.allow_all_pairs
+
+    counts = np.asarray(counts, dtype=np.int16)
+    jokers = np.asarray(jokers, dtype=np.int16)
+    if counts.size and (counts.min() < 0 or counts.max() > 4):
+        raise ValueError("每种牌的张数必须在 0~4 之间")
+    hand_size = counts.sum(axis=1) + jokers
+    holes = (counts & 1).sum(axis=1)
+
+    suit_codes = [_suit_codes(counts[:, g * 9:(g + 1) * 9]) for g in range(3)]
+    groups = [_lookup(code) for code in suit_codes]
+    groups.append(_honor_costs(counts[:, HONOR_START:NUM_KINDS]))
+    cost = _combine(groups)
+    wins = _wins(cost, holes, hand_size, jokers, three_jokers_win, allow_all_pairs)
+    if not with_waits:
+        return wins, None
+
+    # 进一张牌只改变它所在那一组，其余三组沿用
+    waits = np.zeros((len(counts), NUM_KINDS + 1), dtype=bool)
+    for code in range(NUM_KINDS):
+        group = min(code // 9, 3)
+        replaced = list(groups)
+        if group < 3:
+            replaced[group] = _lookup(suit_codes[group] + _POWERS[code % 9])
+        else:
+            honors = counts[:, HONOR_START:NUM_KINDS].copy()
+            honors[:, code - HONOR_START] += 1
+            replaced[group] = _honor_costs(honors)
+        new_holes = holes + np.where(counts[:, code] & 1, -1, 1)
+        waits[:, code] = _wins(_combine(replaced), new_holes, hand_size + 1, jokers,
+                               three_jokers_win, allow_all_pairs)
+    waits[:, JOKER_CODE] = _wins(cost, holes, hand_size + 1, jokers + 1, three_jokers_win, allow_all_pairs)
+    return wins, waits
+
+
+def random_hands(n, tiles=17, seed=0, max_jokers=4):
+    """从洗好的 136 张牌里各抽 tiles 张，随机选一种牌作金牌，返回 (counts, jokers)"""
+    rng = np.random.default_rng(seed)
+    wall = np.tile(np.repeat(np.arange(NUM_KINDS, dtype=np.int8), 4), (n, 1))
+    drawn = rng.permuted(wall, axis=1)[:, :tiles]
+    counts = np.zeros((n, NUM_KINDS), dtype=np.int16)
+    np.add.at(counts, (np.repeat(np.arange(n), tiles), drawn.ravel()), 1)
+    golden = rng.integers(0, NUM_KINDS, size=n)
+    rows = np.arange(n)
+    jokers = np.minimum(counts[rows, golden], max_jokers)
+    counts[rows, golden] = 0
+    return counts, jokers
+
+
+def _scalar(counts, jokers, game_rules):
+    ruleset = compile_rules(game_rules)
+    three_jokers_win = ruleset.three_jokers_win
+    allow_all_pairs = ruleset.allow_all_pairs
+    wins, waits = [], []
+    for row, j in zip(counts.astype(np.uint8), jokers.tolist()):
+        row = bytearray(row.tobytes())
+        wins.append(mahjong_hu.can_hu(row, j, three_jokers_win, allow_all_pairs))
+        waits.append(mahjong_hu.waiting_tiles(row, j, three_jokers_win, allow_all_pairs))
+    return wins, waits
+
+
+def benchmark(sizes=(1, 1000, 100000), game_rules=None, seed=0):
+    """逐手判断与批量判断的耗时对比，每个规模先核对结果一致"""
+    if game_rules is None:
+        game_rules = {'three_jokers_win': True, 'allow_all_pairs': False}
+    _table()  # 稠密表只分配一次，不计入计时
+    print(f"{'N':>8} | {'逐手 (s)':>10} | {'批量 (s)':>10} | {'加速比':>8}")
+    print("-" * 46)
+    results = []
+    for n in sizes:
+        counts, jokers = random_hands(n, tiles=16, seed=seed)
+        start = time.perf_counter()
+        scalar_wins, scalar_waits = _scalar(counts, jokers, game_rules)
+        scalar_time = time.perf_counter() - start
+        start = time.perf_counter()
+        wins, waits = evaluate_hands(counts, jokers, game_rules)
+        batch_time = time.perf_counter() - start
+        expected = np.zeros_like(waits)
+        for i, codes in enumerate(scalar_waits):
+            expected[i, list(codes)] = True
+        assert wins.tolist() == scalar_wins and (waits == expected).all(), "批量结果与逐手判断不一致"
+        print(f"{n:>8} | {scalar_time:>10.4f} | {batch_time:>10.4f} | {scalar_time / batch_time:>7.1f}x")
+        results.append({'n': n, 'scalar': scalar_time, 'batch': batch_time})
+    return results
+
+
+if __name__ == '__main__':
+    benchmark()
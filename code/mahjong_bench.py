@@ -0,0 +1,265 @@
+"""
+胡牌判断和对局主循环热点路径的基准测试，不需要网络。
+
+手牌语料由固定种子生成，每次运行完全相同：
+    plain      普通 14 张手牌 (一半能胡，一半差一张)
+    sixteen    福州麻将 17 张手牌 (16 张 + 进张)
+    jokers     带 3~4 张金牌、差一点胡不了的手牌 (不开三金倒，逼出最坏情况)
+    all_pairs  对子胡手牌
+
+测试项：can_hu (冷缓存 / 热缓存)、can_chow、_check_all_pairs、牌墙洗牌发牌、无头整局每秒局数。
+结果写成 JSON；--compare 与保存的基线对比，每次操作耗时变慢超过阈值的项标为回归，并以非零状态码退出。
+
+命令行示例：
+    python mahjong_bench.py --output baseline.json
+    python mahjong_bench.py --compare baseline.json --threshold 0.2
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+import mahjong_hu
+import mahjong_sim
+from mahjong_offline import FUZHOU_RULES, mahjong_game, mahjong_players
+from mahjong_tiles import HONOR_START, NUM_KINDS, TILE_NAMES, mahjong_hand, mahjong_wall
+
+CORPUS_SEED = 20240601
+CORPUS_SIZE = 500
+DEFAULT_OUTPUT = 'bench_output.json'
+
+
+# ---------- 手牌语料 ----------
+
+def _winning_counts(rng, melds):
+    """随机拼出 melds 组面子加一对将的计数向量 (每种牌不超过 4 张)"""
+    while True:
+        counts = bytearray(NUM_KINDS)
+        pair = rng.randrange(NUM_KINDS)
+        counts[pair] += 2
+        for _ in range(melds):
+            if rng.random() < 0.6:
+                suit, rank = rng.randrange(3), rng.randrange(7)
+                for d in range(3): counts[suit * 9 + rank + d] += 1
+            else:
+                counts[rng.randrange(NUM_KINDS)] += 3
+        if max(counts) <= 4:
+            return counts
+
+
+def _replace_one(rng, counts):
+    """把一张牌换成另一种牌，多半会让手牌差一张"""
+    held = [c for c in range(NUM_KINDS) if counts[c]]
+    counts[rng.choice(held)] -= 1
+    while True:
+        code = rng.randrange(NUM_KINDS)
+        if counts[code] < 4:
+            counts[code] += 1
+            return counts
+
+
+def _to_jokers(rng, counts, n):
+    """把 n 张真牌换成金牌"""
+    for _ in range(n):
+        held = [c for c in range(NUM_KINDS) if counts[c]]
+        counts[rng.choice(held)] -= 1
+    return counts, n
+
+
+def build_corpus(seed=CORPUS_SEED, size=CORPUS_SIZE):
+    """返回 {类别: [(counts, joker_count), ...]}"""
+    rng = random.Random(seed)
+    corpus = {'plain': [], 'sixteen': [], 'jokers': [], 'all_pairs': []}
+    for i in range(size):
+        counts = _winning_counts(rng, 4)
+        if i % 2: counts = _replace_one(rng, counts)
+        corpus['plain'].append((counts, 0))
+
+        counts = _winning_counts(rng, 5)
+        if i % 2: counts = _replace_one(rng, counts)
+        corpus['sixteen'].append(_to_jokers(rng, counts, rng.randrange(2)))
+
+        counts = _replace_one(rng, _replace_one(rng, _winning_counts(rng, 5)))
+        corpus['jokers'].append(_to_jokers(rng, counts, 3 + i % 2))
+
+        counts = bytearray(NUM_KINDS)
+        for code in rng.sample(range(NUM_KINDS), 7): counts[code] = 2
+        if i % 2: counts = _replace_one(rng, counts)
+        corpus['all_pairs'].append((counts, 0))
+    return corpus
+
+
+# ---------- 计时 ----------
+
+def _measure(func, ops, repeat):
+    """func() 执行 ops 次操作，重复 repeat 次取中位数"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    median = timings[len(timings) // 2]
+    return {
+        'ops': ops,
+        'repeat': repeat,
+        'ns_per_op': median / ops * 1e9,
+        'ops_per_second': ops / median if median > 0 else 0.0,
+        'best_ns_per_op': timings[0] / ops * 1e9,
+    }
+
+
+def _clear_caches():
+    """只清 LRU 缓存；花色表是进程级的，常驻服务中很快填满，不计入"""
+    mahjong_hu._cache.clear()
+
+
+def bench_can_hu(corpus, repeat, game_rules):
+    three_jokers_win = game_rules.get('three_jokers_win', False)
+    allow_all_pairs = game_rules.get('allow_all_pairs', True)
+    results = {}
+    for name, hands in corpus.items():
+        def run():
+            for counts, jokers in hands:
+                mahjong_hu.can_hu(counts, jokers, three_jokers_win, allow_all_pairs)
+
+        def cold():
+            _clear_caches()
+            run()
+
+        results[f'can_hu.{name}.cold'] = _measure(cold, len(hands), repeat)
+        run()
+        results[f'can_hu.{name}.warm'] = _measure(run, len(hands), repeat)
+    return results
+
+
+def bench_can_chow(corpus, repeat):
+    rules_def = mahjong_game().tile_definitions
+    players = []
+    for counts, jokers in corpus['sixteen']:
+        tiles = mahjong_hand()
+        tiles.counts[:] = counts
+        tiles.jokers = jokers
+        players.append(mahjong_players(0, 'bench', rules_def, tiles.tiles()))
+    suited = TILE_NAMES[:HONOR_START]
+
+    def run():
+        for player in players:
+            for tile in suited:
+                player.can_chow(tile)
+
+    return {'can_chow': _measure(run, len(players) * len(suited), repeat)}
+
+
+def bench_all_pairs(corpus, repeat):
+    player = mahjong_players(0, 'bench', mahjong_game().tile_definitions)
+    hands = corpus['all_pairs']
+
+    def run():
+        mahjong_hu._cache.clear()
+        for counts, jokers in hands:
+            player._check_all_pairs(counts, jokers)
+
+    return {'check_all_pairs': _measure(run, len(hands), repeat)}
+
+
+def bench_wall(repeat, rounds=200):
+    wall = mahjong_wall()
+
+    def run():
+        for seed in range(rounds):
+            wall.setup(seed, max_jokers=FUZHOU_RULES['joker_count'])
+            for _ in range(4):
+                wall.deal(FUZHOU_RULES['tiles_per_player'])
+
+    return {'wall.setup_and_deal': _measure(run, rounds, repeat)}
+
+
+def bench_games(repeat, games=50, policy='random'):
+    def run():
+        for seed in range(games):
+            mahjong_sim.play_game(seed, policies=(policy,) * 4, game_rules=FUZHOU_RULES)
+
+    result = _measure(run, games, repeat)
+    return {f'game.{policy}': result}
+
+
+BENCHMARKS = ('can_hu', 'can_chow', 'check_all_pairs', 'wall', 'game')
+
+
+def run_benchmarks(selected=BENCHMARKS, repeat=5, corpus_size=CORPUS_SIZE, games=50):
+    corpus = build_corpus(size=corpus_size)
+    results = {}
+    if 'can_hu' in selected:
+        results.update(bench_can_hu(corpus, repeat, {'three_jokers_win': False, 'allow_all_pairs': True}))
+    if 'can_chow' in selected:
+        results.update(bench_can_chow(corpus, repeat))
+    if 'check_all_pairs' in selected:
+        results.update(bench_all_pairs(corpus, repeat))
+    if 'wall' in selected:
+        results.update(bench_wall(repeat))
+    if 'game' in selected:
+        results.update(bench_games(repeat, games, 'random'))
+        results.update(bench_games(repeat, games, 'greedy'))
+    return {
+        'meta': {
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'corpus_seed': CORPUS_SEED,
+            'corpus_size': corpus_size,
+            'repeat': repeat,
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold):
+    """返回 [(名称, 基线 ns/op, 当前 ns/op, 变化比例, 是否回归)]，只比较两边都有的项"""
+    rows = []
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None: continue
+        change = result['ns_per_op'] / base['ns_per_op'] - 1 if base['ns_per_op'] else 0.0
+        rows.append((name, base['ns_per_op'], result['ns_per_op'], change, change > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="胡牌判断与对局主循环基准测试")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="结果 JSON 文件")
+    parser.add_argument('--compare', metavar='BASELINE', help="与基线 JSON 对比，发现回归时以状态码 1 退出")
+    parser.add_argument('--threshold', type=float, default=0.2, help="每次操作耗时变慢超过该比例算回归，默认 0.2")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--corpus-size', type=int, default=CORPUS_SIZE, help="每类手牌的数量")
+    parser.add_argument('--games', type=int, default=50, help="整局测试的局数")
+    parser.add_argument('--only', default=','.join(BENCHMARKS), help="逗号分隔的测试项: " + ' / '.join(BENCHMARKS))
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.only.split(','), args.repeat, args.corpus_size, args.games)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"{'测试项':<28} | {'ns/op':>12} | {'ops/s':>12}")
+    print("-" * 58)
+    for name, result in report['results'].items():
+        print(f"{name:<31} | {result['ns_per_op']:>12.0f} | {result['ops_per_second']:>12.0f}")
+    print(f"\n结果已写入 {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.threshold)
+        print(f"\n与基线 {args.compare} 对比 (阈值 {args.threshold:.0%}):")
+        for name, base, now, change, regressed in rows:
+            mark = "回归" if regressed else ""
+            print(f"{name:<31} | {base:>12.0f} -> {now:>12.0f} | {change:>+7.1%} {mark}")
+        if any(row[4] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,507 @@
+"""
+查表式胡牌判断。
+
+每门序数牌 (筒/条/万) 的 9 张计数组成一个花色模式，表中记录该模式
+拆成全部面子最少需要几张金牌 (无将)，以及拆成面子加一对将最少需要几张金牌 (含将)。
+字牌不能成顺子，直接按张数用闭式计算。整手牌只需 3 次查表加一次字牌求和，
+与金牌数量无关，不再回溯搜索。
+
+solve() 在同一张表上回溯出一种最优拆法 (每个面子、将，以及每张金牌代替的牌)，供界面展示胡牌牌型。
+每一步都只查表选一个代价吻合的分支，耗时与手牌张数成正比，与金牌数量无关。
+
+表按花色模式惰性填充，同一模式只计算一次，所有玩家、所有房间共用。
+有离线生成的表文件 (见 mahjong_tables) 时直接从映射的文件里读，不再计算。
+
+can_hu / check_all_pairs 前面还有一层有界 LRU 缓存，键是手牌的规范形式：
+三门花色互换、字牌互换、以及不碰到 1/9 边界的整体平移都不影响结果，
+加上金牌数和规则指纹 (three_jokers_win, allow_all_pairs)。
+"""
+
+from collections import OrderedDict
+from mahjong_tables import shared_tables
+from mahjong_tiles import HONOR_START, NUM_KINDS, JOKER_CODE, tile_name
+
+SUIT_SIZE = 9
+_INF = 99
+DEFAULT_CACHE_SIZE = 1 << 16
+
+
+def _honor_cost(c):
+    """单种字牌 c 张的代价 (无将, 含将)，字牌只能成刻子，因此是闭式"""
+    no_pair = -c % 3
+    if c == 0:
+        return no_pair, 2
+    with_pair = 1 + (-(c - 1) % 3)
+    if c >= 2:
+        with_pair = min(with_pair, -(c - 2) % 3)
+    return no_pair, with_pair
+
+
+_HONOR_COST = tuple(_honor_cost(c) for c in range(9))
+
+# 花色模式 (bytes, 长度 9) -> (无将最少金牌数, 含将最少金牌数)
+_suit_table = {}
+_tables = shared_tables()
+
+
+def _melds_cost(pattern):
+    """pattern 全部拆成面子所需的最少金牌数"""
+    entry = _suit_table.get(pattern)
+    if entry is not None:
+        return entry[0]
+    return _suit_entry(pattern)[0]
+
+
+def _suit_entry(pattern):
+    entry = _suit_table.get(pattern)
+    if entry is not None:
+        return entry
+    if _tables is not None:
+        entry = _tables.hu(pattern)
+        if entry is not None:
+            _suit_table[pattern] = entry
+            return entry
+    counts = bytearray(pattern)
+    first = next((i for i, n in enumerate(counts) if n), None)
+    if first is None:
+        entry = (0, 2)
+        _suit_table[pattern] = entry
+        return entry
+
+    # 最小的那张牌一定属于某个面子：刻子 (1~3 张真牌)，或以它为最小真牌的顺子
+    n = counts[first]
+    best = _INF
+    for used in (1, 2, 3):
+        if n >= used:
+            counts[first] -= used
+            best = min(best, 3 - used + _melds_cost(bytes(counts)))
+            counts[first] += used
+    counts[first] -= 1
+    if first + 1 < SUIT_SIZE and counts[first + 1]:
+        counts[first + 1] -= 1
+        best = min(best, 1 + _melds_cost(bytes(counts)))
+        if first + 2 < SUIT_SIZE and counts[first + 2]:
+            counts[first + 2] -= 1
+            best = min(best, _melds_cost(bytes(counts)))
+            counts[first + 2] += 1
+        counts[first + 1] += 1
+    if first + 2 < SUIT_SIZE and counts[first + 2]:
+        counts[first + 2] -= 1
+        best = min(best, 1 + _melds_cost(bytes(counts)))
+        counts[first + 2] += 1
+    counts[first] += 1
+
+    # 含将：将由两张金牌、一张真牌加一张金牌、或两张真牌组成
+    with_pair = best + 2
+    for i, c in enumerate(counts):
+        if c >= 1:
+            counts[i] -= 1
+            with_pair = min(with_pair, 1 + _melds_cost(bytes(counts)))
+            if c >= 2:
+                counts[i] -= 1
+                with_pair = min(with_pair, _melds_cost(bytes(counts)))
+                counts[i] += 1
+            counts[i] += 1
+
+    entry = (best, with_pair)
+    _suit_table[pattern] = entry
+    return entry
+
+
+def _group_entry(key, group):
+    if group == 3:
+        return _honor_entry(key[HONOR_START:NUM_KINDS])
+    start = group * SUIT_SIZE
+    return _suit_entry(bytes(key[start:start + SUIT_SIZE]))
+
+
+def _honor_entry(counts):
+    no_pair = 0
+    pair_extra = 2
+    for c in counts:
+        cost = _HONOR_COST[c]
+        no_pair += cost[0]
+        pair_extra = min(pair_extra, cost[1] - cost[0])
+    return no_pair, no_pair + pair_extra
+
+
+def group_entries(counts):
+    """34 槽计数向量 -> 三门序数牌与字牌各自的 (无将, 含将) 代价"""
+    key = bytes(counts)
+    return tuple(_group_entry(key, group) for group in range(4))
+
+
+def combine_entries(entries):
+    """各组代价合并：将只能落在其中一组 (空组做将即两张金牌)"""
+    no_pair = 0
+    pair_extra = 2
+    for entry in entries:
+        no_pair += entry[0]
+        extra = entry[1] - entry[0]
+        if extra < pair_extra: pair_extra = extra
+    return no_pair + pair_extra
+
+
+def hu_cost(counts):
+    """整手牌拆成 面子*n + 将 所需的最少金牌数"""
+    return combine_entries(group_entries(counts))
+
+
+class hand_cache:
+    """有界 LRU 缓存，记录命中、未命中和淘汰次数"""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+
+    def get(self, key):
+        """未命中返回 None"""
+        value = self._data.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        self._evict()
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        self._evict()
+
+    def clear(self):
+        self._data.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def _evict(self):
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': len(self._data), 'maxsize': self.maxsize}
+
+    def __len__(self):
+        return len(self._data)
+
+
+_cache = hand_cache()
+
+
+def configure_cache(maxsize):
+    """调整缓存容量，缩小时立即按 LRU 淘汰"""
+    _cache.resize(maxsize)
+
+
+def cache_stats():
+    return _cache.stats()
+
+
+def _canonical_suit(pattern):
+    """不碰 1、9 两端的花色模式整体平移到从 2 开始；碰到边界的保持原样"""
+    if pattern[0] or pattern[-1]:
+        return pattern
+    stripped = pattern.strip(b'\0')
+    return b'\0' + stripped + b'\0' * (SUIT_SIZE - 1 - len(stripped))
+
+
+def canonical_key(counts, joker_count, fingerprint):
+    key = bytes(counts)
+    suits = sorted((_canonical_suit(key[0:9]), _canonical_suit(key[9:18]), _canonical_suit(key[18:27])))
+    honors = bytes(sorted(key[HONOR_START:NUM_KINDS]))
+    return b''.join(suits) + honors, joker_count, fingerprint
+
+
+def _all_pairs(counts, joker_count):
+    holes = sum(count & 1 for count in counts)
+    return joker_count >= holes and (joker_count - holes) % 2 == 0
+
+
+def check_all_pairs(counts, joker_count=0):
+    cache_key = canonical_key(counts, joker_count, 'all_pairs')
+    result = _cache.get(cache_key)
+    if result is None:
+        result = _all_pairs(counts, joker_count)
+        _cache.put(cache_key, result)
+    return result
+
+
+def can_hu(counts, joker_count, three_jokers_win=False, allow_all_pairs=True):
+    """counts 为 34 槽计数向量 (不含金牌)，joker_count 为金牌数，结果经 LRU 缓存"""
+    if three_jokers_win and joker_count >= 3:
+        return True
+    cache_key = canonical_key(counts, joker_count, (bool(three_jokers_win), bool(allow_all_pairs)))
+    result = _cache.get(cache_key)
+    if result is None:
+        result = _evaluate_hu(counts, joker_count, allow_all_pairs)
+        _cache.put(cache_key, result)
+    return result
+
+
+def _evaluate_hu(counts, joker_count, allow_all_pairs):
+    hand_size = sum(counts) + joker_count
+    if allow_all_pairs:
+        # 对子胡的总数必须是偶数
+        if hand_size % 2 == 0 and _all_pairs(counts, joker_count):
+            return True
+
+    if (hand_size - 2) % 3 != 0:
+        return False
+    # 剩余的金牌数与 hand_size 同余，必然是 3 的倍数，可以自成刻子
+    return hu_cost(counts) <= joker_count
+
+
+def waiting_tiles(counts, joker_count, three_jokers_win=False, allow_all_pairs=True):
+    """
+    听牌集合：再进哪些牌就能胡 (牌编码，金牌记为 JOKER_CODE)。
+    加一张牌只会改变它所在那一组的代价，其余三组沿用，每种牌只需查一次表。
+    """
+    if three_jokers_win and joker_count >= 3:
+        return frozenset(range(NUM_KINDS + 1))
+
+    key = bytes(counts)
+    hand_size = sum(key) + joker_count + 1
+    waits = set()
+    if allow_all_pairs and hand_size % 2 == 0:
+        holes = sum(c & 1 for c in key)
+        for code in range(NUM_KINDS):
+            h = holes - 1 if key[code] & 1 else holes + 1
+            if joker_count >= h and (joker_count - h) % 2 == 0:
+                waits.add(code)
+
+    if (hand_size - 2) % 3 == 0:
+        entries = [_group_entry(key, group) for group in range(4)]
+        buf = bytearray(key)
+        for group in range(4):
+            base = entries[group]
+            start = group * SUIT_SIZE
+            end = NUM_KINDS if group == 3 else start + SUIT_SIZE
+            for code in range(start, end):
+                if code in waits: continue
+                buf[code] += 1
+                entries[group] = _group_entry(buf, group)
+                buf[code] -= 1
+                if combine_entries(entries) <= joker_count:
+                    waits.add(code)
+            entries[group] = base
+
+    if waits or can_hu(key, joker_count + 1, three_jokers_win, allow_all_pairs):
+        waits.add(JOKER_CODE)
+    return frozenset(waits)
+
+
+# ---------- 胡牌拆解 ----------
+# 面子和将都是 ((编码, 是否金牌), ...) 的元组，金牌那一项的编码即它代替的牌
+
+def _take(counts, i, n=1):
+    counts[i] -= n
+    return ((i, False),) * n
+
+
+def _suit_melds(pattern):
+    """花色模式拆成全部面子，金牌数恰为表中的最小值；返回 (面子列表, 需要补位的金牌项)"""
+    counts = bytearray(pattern)
+    melds = []
+    while any(counts):
+        cost = _melds_cost(bytes(counts))
+        first = next(i for i, n in enumerate(counts) if n)
+        meld = None
+        # 分支顺序与 _suit_entry 一致，选第一个代价吻合的
+        for used in (1, 2, 3):
+            if counts[first] >= used:
+                counts[first] -= used
+                ok = 3 - used + _melds_cost(bytes(counts)) == cost
+                counts[first] += used
+                if ok:
+                    meld = _take(counts, first, used) + ((first, True),) * (3 - used)
+                    break
+        if meld is None:
+            counts[first] -= 1
+            second, third = first + 1, first + 2
+            if second < SUIT_SIZE and counts[second]:
+                counts[second] -= 1
+                if third < SUIT_SIZE and counts[third]:
+                    counts[third] -= 1
+                    if _melds_cost(bytes(counts)) == cost:
+                        meld = ((first, False), (second, False), (third, False))
+                    else:
+                        counts[third] += 1
+                if meld is None and 1 + _melds_cost(bytes(counts)) == cost:
+                    # 金牌补在两头：优先补高的一张，9 已到边界时补低的一张
+                    joker = third if third < SUIT_SIZE else first - 1
+                    meld = tuple(sorted(((first, False), (second, False), (joker, True))))
+                if meld is None:
+                    counts[second] += 1
+            if meld is None and third < SUIT_SIZE and counts[third]:
+                counts[third] -= 1
+                if 1 + _melds_cost(bytes(counts)) == cost:
+                    meld = ((first, False), (second, True), (third, False))
+                else:
+                    counts[third] += 1
+            if meld is None:
+                counts[first] += 1
+                raise AssertionError("花色表与拆解不一致")
+        melds.append(meld)
+    return melds
+
+
+def _suit_pair(pattern):
+    """含将的拆法：返回 (将, 剩余模式)，将为 None 表示两张金牌单独做将"""
+    target = _suit_entry(pattern)[1]
+    counts = bytearray(pattern)
+    for i, c in enumerate(counts):
+        if c >= 2:
+            counts[i] -= 2
+            if _melds_cost(bytes(counts)) == target:
+                return ((i, False), (i, False)), bytes(counts)
+            counts[i] += 2
+    for i, c in enumerate(counts):
+        if c >= 1:
+            counts[i] -= 1
+            if 1 + _melds_cost(bytes(counts)) == target:
+                return ((i, False), (i, True)), bytes(counts)
+            counts[i] += 1
+    return None, pattern
+
+
+def _honor_melds(counts, with_pair):
+    """字牌只成刻子；with_pair 时把将放在多花金牌最少的那种字牌上"""
+    pair_at = None
+    if with_pair:
+        best = 2
+        for i, c in enumerate(counts):
+            extra = _HONOR_COST[c][1] - _HONOR_COST[c][0]
+            if extra < best:
+                best, pair_at = extra, i
+    melds, pair = [], None
+    for i, c in enumerate(counts):
+        if i == pair_at:
+            if c >= 2 and -(c - 2) % 3 == _HONOR_COST[c][1]:
+                pair, c = ((i, False), (i, False)), c - 2
+            else:
+                pair, c = ((i, False), (i, True)), c - 1
+        while c > 0:
+            real = min(c, 3)
+            melds.append(((i, False),) * real + ((i, True),) * (3 - real))
+            c -= real
+    return melds, pair
+
+
+def _shift(items, offset):
+    return tuple((code + offset, joker) for code, joker in items)
+
+
+def _free_code(used, need):
+    """找一种加上 need 张后仍不超过 4 张的牌，给整组金牌 (金牌刻子、金牌将) 指定代替的牌"""
+    return next(code for code in range(NUM_KINDS) if used[code] + need <= 4)
+
+
+def _finish(kind, melds, pair, counts):
+    used = bytearray(counts)
+    for group in melds + ([pair] if pair else []):
+        for code, joker in group:
+            if joker and code is not None: used[code] += 1
+    return {
+        'type': kind,
+        'melds': melds,
+        'pair': pair,
+        'jokers_as': [code for group in melds + ([pair] if pair else []) for code, joker in group if joker],
+    }, used
+
+
+def _solve_standard(counts, joker_count):
+    key = bytes(counts)
+    entries = [_group_entry(key, group) for group in range(4)]
+    # 将落在哪一组：对每组 "含将 - 无将" 的额外代价取最小，空组做将即两张金牌
+    pair_group, pair_extra = None, 2
+    for group, entry in enumerate(entries):
+        if entry[1] - entry[0] < pair_extra:
+            pair_group, pair_extra = group, entry[1] - entry[0]
+    if sum(e[0] for e in entries) + pair_extra > joker_count:
+        return None
+
+    melds, pair = [], None
+    for group in range(3):
+        start = group * SUIT_SIZE
+        pattern = key[start:start + SUIT_SIZE]
+        if group == pair_group:
+            suit_pair, pattern = _suit_pair(pattern)
+            pair = _shift(suit_pair, start) if suit_pair else None
+        melds.extend(_shift(meld, start) for meld in _suit_melds(pattern))
+    honor_melds, honor_pair = _honor_melds(key[HONOR_START:NUM_KINDS], pair_group == 3)
+    melds.extend(_shift(meld, HONOR_START) for meld in honor_melds)
+    if pair_group == 3: pair = _shift(honor_pair, HONOR_START)
+
+    solution, used = _finish('standard', melds, pair, counts)
+    spare = joker_count - len(solution['jokers_as'])
+    if pair is None:
+        code = _free_code(used, 2)
+        used[code] += 2
+        solution['pair'] = ((code, True), (code, True))
+        spare -= 2
+    while spare >= 3:
+        code = _free_code(used, 3)
+        used[code] += 3
+        melds.append(((code, True),) * 3)
+        spare -= 3
+    solution['jokers_as'] = [code for group in melds + [solution['pair']] for code, joker in group if joker]
+    return solution
+
+
+def _solve_all_pairs(counts, joker_count):
+    if not _all_pairs(counts, joker_count):
+        return None
+    pairs = []
+    for code, c in enumerate(counts):
+        for _ in range(c // 2):
+            pairs.append(((code, False), (code, False)))
+        if c & 1:
+            pairs.append(((code, False), (code, True)))
+    solution, used = _finish('all_pairs', pairs, None, counts)
+    for _ in range((joker_count - len(solution['jokers_as'])) // 2):
+        code = _free_code(used, 2)
+        used[code] += 2
+        pairs.append(((code, True), (code, True)))
+    solution['jokers_as'] = [code for pair in pairs for code, joker in pair if joker]
+    return solution
+
+
+def solve(counts, joker_count, three_jokers_win=False, allow_all_pairs=True):
+    """
+    求一种胡牌拆法，不能胡返回 None。结果为字典：
+        type       'standard' (面子 + 将) / 'all_pairs' (对子胡) / 'three_jokers' (三金倒)
+        melds      面子列表 (对子胡时为对子列表)，每项为 ((编码, 是否金牌), ...)
+        pair       将，对子胡和三金倒时为 None
+        jokers_as  每张金牌代替的牌编码
+    能正常拆出面子时优先给出面子拆法，三金倒只在拆不出时才作为结果。
+    """
+    hand_size = sum(counts) + joker_count
+    solution = None
+    if (hand_size - 2) % 3 == 0:
+        solution = _solve_standard(counts, joker_count)
+    if solution is None and allow_all_pairs and hand_size % 2 == 0:
+        solution = _solve_all_pairs(counts, joker_count)
+    if solution is None and three_jokers_win and joker_count >= 3:
+        solution = {'type': 'three_jokers', 'melds': [], 'pair': None, 'jokers_as': []}
+    return solution
+
+
+def describe(solution, names=None):
+    """拆法转成可读的牌名分组，金牌代替的牌用方括号标出；names 可传入牌名到显示字符的映射"""
+    if solution is None: return ''
+    names = names or {}
+
+    def show(group):
+        return ''.join(f"[{names.get(tile_name(code), tile_name(code))}]" if joker
+                       else names.get(tile_name(code), tile_name(code)) for code, joker in group)
+
+    groups = list(solution['melds']) + ([solution['pair']] if solution['pair'] else [])
+    return ' '.join(show(group) for group in groups)
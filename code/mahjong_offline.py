@@ -1,24 +1,174 @@
 import random
-from collections import Counter
+from bisect import bisect_left, bisect_right
+import mahjong_hu
+from mahjong_rules import TILE_DEFINITIONS, compile_rules
+from mahjong_tiles import TILE_INDEX, TILE_NAMES, NUM_KINDS, JOKER_CODE, mahjong_hand, mahjong_wall, claim_index, tile_code, tile_name, get_tile_index
+from mahjong_zobrist import zobrist_hash
 
 class mahjong_players:
-    def __init__(self, user_id, name, rules_def, tiles=None):
+    def __init__(self, user_id, name, rules_def, tiles=None, game_rules=None):
         self.user_id = user_id
         self.name = f"玩家 {user_id + 1} ({name})"
-        self.tiles = tiles if tiles is not None else []
         self.rules = rules_def  # 这是麻将牌的排序和数值定义
+        self.index = get_tile_index(rules_def)
+        self.ruleset = compile_rules(game_rules)  # 规则字典或编译好的 mahjong_ruleset
+        self.waits = frozenset()  # 听牌集合 (牌编码)，即能胡的触发集合
+        self.claims = claim_index(self.index.chow_codes)  # 能碰、能杠、能吃的触发集合
+        self.policy = None  # 无头模式下代替 input() 做决定的策略对象，None 表示由控制台输入
+        self.verbose = True
+        self.display_order = None  # 自定义摆放顺序：有序手牌下标的一个排列，None 表示按牌序显示
+        self.zobrist = None  # 所在对局的 zobrist_hash，手牌、明牌、弃牌变化时同步更新
+        self.hand = None
+        self.tiles = tiles if tiles is not None else []
         self.new_tile = None
         self.locked_tiles = []
+        self.discarded = []  # 自己打出且没有被别人拿走的牌
+
+    @property
+    def tiles(self):
+        """
+        按牌序排好的手牌牌名列表，只用于显示和按序号出牌；所有判断都基于 self.hand 计数向量。
+        只在整手设置时排序一次，之后摸牌二分插入、出牌和吃碰杠按下标删除，始终保持有序。
+        """
+        return self._tiles
+
+    @tiles.setter
+    def tiles(self, tiles):
+        self._tiles = sorted(tiles, key=self._sort_key)
+        self._keys = [self._sort_key(t) for t in self._tiles]  # 与 _tiles 平行的牌序数值，供二分查找
+        self.display_order = None
+        old = self.hand
+        self.hand = mahjong_hand(self._tiles)
+        if self.zobrist is not None:
+            if old is None: self.zobrist.set_hand(self.user_id, self.hand.counts, self.hand.jokers)
+            else: self.zobrist.set_hand(self.user_id, self.hand.counts, self.hand.jokers, old.counts, old.jokers)
+        self.claims.rebuild(self.hand)
+        self._update_waits()
+
+    def _sort_key(self, tile):
+        return self.rules.get(tile, -1)
+
+    def add_tile(self, tile):
+        """摸牌。听牌集合保持摸牌前的状态，用于判断这张牌是否自摸，出牌后再更新"""
+        key = self._sort_key(tile)
+        i = bisect_right(self._keys, key)
+        self._keys.insert(i, key)
+        self._tiles.insert(i, tile)
+        self.hand.add(tile)
+        code = tile_code(tile)
+        self.claims.update(self.hand, code)
+        if self.zobrist is not None: self._hash_tile(code, 1)
+        if self.display_order is not None:
+            # 新牌放在自定义顺序的最后
+            self.display_order = [j + (j >= i) for j in self.display_order] + [i]
+        return i
+
+    def _remove_at(self, i):
+        tile = self._tiles.pop(i)
+        del self._keys[i]
+        self.hand.remove(tile)
+        code = tile_code(tile)
+        self.claims.update(self.hand, code)
+        if self.zobrist is not None: self._hash_tile(code, -1)
+        if self.display_order is not None:
+            self.display_order = [j - (j > i) for j in self.display_order if j != i]
+        return tile
+
+    def reset(self, rules_def=None, game_rules=None):
+        """
+        新一局：清空手牌、明牌和弃牌，玩家对象本身复用。
+        牌的定义变了才重建牌序索引和吃碰杠索引，规则由 compile_rules 按指纹复用。
+        对局哈希由 mahjong_game 整体复位，这里清空手牌时不再逐张更新。
+        """
+        if rules_def is not None and rules_def != self.rules:
+            self.rules = rules_def
+            self.index = get_tile_index(rules_def)
+            self.claims = claim_index(self.index.chow_codes)
+        if game_rules is not None:
+            self.ruleset = compile_rules(game_rules)
+        zobrist, self.zobrist = self.zobrist, None
+        self.tiles = []
+        self.zobrist = zobrist
+        self.new_tile = None
+        self.locked_tiles.clear()
+        self.discarded.clear()
+
+    def _hash_tile(self, code, delta):
+        new = self.hand.jokers if code == JOKER_CODE else self.hand.counts[code]
+        self.zobrist.tile(self.user_id, code, new - delta, new)
+
+    def _lock(self, meld):
+        self.locked_tiles.append(meld)
+        if self.zobrist is not None: self.zobrist.meld(self.user_id, [tile_code(t) for t in meld])
+
+    def _remove_tile(self, tile, n=1):
+        """按牌名删除 n 张，同种牌在有序手牌中是连续的，二分找到位置即可"""
+        for _ in range(n):
+            i = bisect_left(self._keys, self._sort_key(tile))
+            if i >= len(self._tiles) or self._tiles[i] != tile:
+                raise ValueError(f"手牌中没有足够的 {tile}")
+            self._remove_at(i)
+
+    def set_display_order(self, order):
+        """设置自定义摆放顺序 (有序手牌下标的排列)，不影响内部的有序手牌"""
+        order = list(order)
+        if sorted(order) != list(range(len(self._tiles))):
+            raise ValueError("自定义顺序必须是手牌下标的一个排列")
+        self.display_order = order
+
+    def _move_tile(self, args):
+        """控制台的 'm 序号 位置'：把显示中的第几张牌挪到第几位，只改自定义顺序"""
+        try:
+            src, dst = (int(a) - 1 for a in args)
+        except ValueError:
+            print("输入无效，格式为 'm 序号 位置'。")
+            return
+        n = len(self._tiles)
+        if not (0 <= src < n and 0 <= dst < n):
+            print(f"序号和位置都应在 1 到 {n} 之间。")
+            return
+        order = list(self.display_order) if self.display_order is not None else list(range(n))
+        order.insert(dst, order.pop(src))
+        self.set_display_order(order)
+
+    def display_tiles(self):
+        if self.display_order is None:
+            return list(self._tiles)
+        return [self._tiles[j] for j in self.display_order]
+
+    def _update_waits(self):
+        """手牌为 3n+1 张时重算听牌集合；多出一张 (吃碰后待出牌) 时清空"""
+        if self.hand.size % 3 != 1:
+            self.waits = frozenset()
+            return
+        self.waits = mahjong_hu.waiting_tiles(
+            self.hand.counts, self.hand.jokers,
+            three_jokers_win=self.ruleset.three_jokers_win,
+            allow_all_pairs=self.ruleset.allow_all_pairs,
+        )
+
+    def wins_with(self, tile):
+        """进这张牌 (点炮或自摸) 能否胡牌，只查听牌集合"""
+        return tile_code(tile) in self.waits
+
+    @property
+    def waiting_tiles(self):
+        return [tile_name(code) for code in sorted(self.waits)]
+
+    def _log(self, *args):
+        if self.verbose: print(*args)
 
     def sort_tiles(self):
-        self.tiles.sort(key=lambda t: self.rules.get(t, -1))
+        """手牌本身始终有序，这里只是取消自定义摆放，恢复按牌序显示"""
+        self.display_order = None
 
     def get_player_input(self, game_replacements, can_zimo=False):
         """
         获取玩家输入。can_zimo标志位用于判断是否显示“自摸”选项。
         """
         while True:
-            hand_str = ' '.join(game_replacements.get(t, t) for t in self.tiles)
+            shown = self.display_tiles()
+            hand_str = ' '.join(game_replacements.get(t, t) for t in shown)
             print(f"\n--- {self.name} 的回合 ---")
             
             locked_str = ' '.join(''.join(game_replacements.get(t,t) for t in meld) for meld in self.locked_tiles)
@@ -28,10 +178,10 @@ class mahjong_players:
             if self.new_tile:
                 print(f"新摸的牌是: {game_replacements.get(self.new_tile, self.new_tile)}")
             
-            numbered_hand = [f"({i+1}) {game_replacements.get(t, t)}" for i, t in enumerate(self.tiles)]
+            numbered_hand = [f"({i+1}) {game_replacements.get(t, t)}" for i, t in enumerate(shown)]
             print(" ".join(numbered_hand))
 
-            prompt = f"请选择要打出的牌的序号 (1-{len(self.tiles)})"
+            prompt = f"请选择要打出的牌的序号 (1-{len(self.tiles)})，'m 序号 位置'移动牌，'s'恢复牌序"
             if can_zimo:
                 prompt += "，或输入'hu'来宣布自摸: "
             else:
@@ -42,168 +192,154 @@ class mahjong_players:
             if choice == 'hu' and can_zimo:
                 return 'hu' # 返回一个特殊字符串表示自摸
 
+            if choice.startswith('m '):
+                self._move_tile(choice.split()[1:])
+                continue
+            if choice == 's':
+                self.sort_tiles()
+                continue
+
             try:
                 choice_idx = int(choice) - 1
                 if 0 <= choice_idx < len(self.tiles):
-                    return choice_idx # 返回要打的牌的索引
+                    if self.display_order is not None:
+                        choice_idx = self.display_order[choice_idx]
+                    return choice_idx # 返回要打的牌在有序手牌中的索引
                 else:
                     print(f"输入无效，请输入1到{len(self.tiles)}之间的数字。")
             except ValueError:
                 print("输入无效，请输入正确的指令。")
 
     def discard_tile(self, tile_index):
-        discarded = self.tiles.pop(tile_index)
+        discarded = self._remove_at(tile_index)
         self.new_tile = None
-        # 注意：此处不排序，因为出牌后手牌是未排序状态，等待下次摸牌再排序
+        self._update_waits()
+        self.discarded.append(discarded)
+        if self.zobrist is not None: self.zobrist.discard(self.user_id, tile_code(discarded))
         return discarded
 
-    # ... can_pong, can_kong, can_chow 等函数保持不变 ...
+    def take_discard(self):
+        """最后打出的牌被别人吃碰杠走"""
+        tile = self.discarded.pop()
+        if self.zobrist is not None: self.zobrist.take_discard(self.user_id, tile_code(tile))
+        return tile
+
     def can_pong(self, tile):
-        return self.tiles.count(tile) >= 2
+        return tile_code(tile) in self.claims.pong
 
     def can_kong(self, tile):
-        return self.tiles.count(tile) >= 3
-    
-    # can_chow 保持不变
+        return tile_code(tile) in self.claims.kong
+
     def can_chow(self, tile):
-        if 'joker' in tile or tile[0] in 'eswnbfz':
+        code = TILE_INDEX.get(tile)
+        if code is None:
             return []
-        possible_chows = []
-        tile_val = self.rules.get(tile)
-        if tile_val is None: return []
-        tile_suit = tile[-1]
-        # (tile-2, tile-1) + tile
-        t1_val, t2_val = tile_val - 2, tile_val - 1
-        c1 = next((t for t, v in self.rules.items() if v == t1_val and t[-1] == tile_suit), None)
-        c2 = next((t for t, v in self.rules.items() if v == t2_val and t[-1] == tile_suit), None)
-        if c1 in self.tiles and c2 in self.tiles: possible_chows.append(tuple(sorted([c1, c2], key=lambda t: self.rules.get(t))))
-        # (tile-1, tile+1) + tile
-        t1_val, t2_val = tile_val - 1, tile_val + 1
-        c1 = next((t for t, v in self.rules.items() if v == t1_val and t[-1] == tile_suit), None)
-        c2 = next((t for t, v in self.rules.items() if v == t2_val and t[-1] == tile_suit), None)
-        if c1 in self.tiles and c2 in self.tiles: possible_chows.append(tuple(sorted([c1, c2], key=lambda t: self.rules.get(t))))
-        # tile + (tile+1, tile+2)
-        t1_val, t2_val = tile_val + 1, tile_val + 2
-        c1 = next((t for t, v in self.rules.items() if v == t1_val and t[-1] == tile_suit), None)
-        c2 = next((t for t, v in self.rules.items() if v == t2_val and t[-1] == tile_suit), None)
-        if c1 in self.tiles and c2 in self.tiles: possible_chows.append(tuple(sorted([c1, c2], key=lambda t: self.rules.get(t))))
-        return list(set(possible_chows))
+        counts = self.hand.counts
+        return [(TILE_NAMES[c1], TILE_NAMES[c2]) for c1, c2 in self.index.chow_codes[code]
+                if counts[c1] and counts[c2]]
+
+    def _with_tile(self, tile):
+        """手牌再加上 tile 后的 (计数向量, 金牌数)，不改动手牌；未知的牌名抛 ValueError，与 mahjong_hand 一致"""
+        counts = self.hand.counts
+        joker_count = self.hand.jokers
+        if tile:
+            code = tile_code(tile)
+            if code is None: raise ValueError(f"未知的牌: {tile}")
+            if code == JOKER_CODE:
+                joker_count += 1
+            else:
+                counts = bytearray(counts); counts[code] += 1
+        return counts, joker_count
 
     def can_hu(self, tile=None, game_rules=None):
-        if game_rules is None: game_rules = {}
-        temp_hand = self.tiles + ([tile] if tile else [])
-        counts = Counter(temp_hand)
-        joker_count = counts.pop('joker', 0)
-        
-        if game_rules.get('three_jokers_win', False) and joker_count >= 3:
-            return True
+        ruleset = self.ruleset if game_rules is None else compile_rules(game_rules)
+        counts, joker_count = self._with_tile(tile)
+        return mahjong_hu.can_hu(
+            counts, joker_count,
+            three_jokers_win=ruleset.three_jokers_win,
+            allow_all_pairs=ruleset.allow_all_pairs,
+        )
+
+    def solve_hu(self, tile=None):
+        """胡牌拆法 (见 mahjong_hu.solve)，tile 为点炮的牌，None 表示用当前手牌 (自摸后)"""
+        counts, joker_count = self._with_tile(tile)
+        return mahjong_hu.solve(
+            counts, joker_count,
+            three_jokers_win=self.ruleset.three_jokers_win,
+            allow_all_pairs=self.ruleset.allow_all_pairs,
+        )
 
-        hand_size = sum(counts.values()) + joker_count
-        
-        if game_rules.get('allow_all_pairs', True):
-             # 对子胡的总数必须是偶数
-            if hand_size % 2 == 0 and self._check_all_pairs(counts.copy(), joker_count):
-                return True
-        
-        if (hand_size - 2) % 3 != 0:
-            return False
-
-        sorted_tiles = sorted(counts.keys(), key=lambda t: self.rules.get(t, -1))
-        for pair_tile in sorted_tiles:
-            if counts[pair_tile] >= 2:
-                remaining_counts = counts.copy()
-                remaining_counts[pair_tile] -= 2
-                if remaining_counts[pair_tile] == 0: del remaining_counts[pair_tile]
-                if self._can_form_all_melds(remaining_counts, joker_count):
-                    return True
-            if counts[pair_tile] >= 1 and joker_count > 0:
-                remaining_counts = counts.copy()
-                del remaining_counts[pair_tile]
-                if self._can_form_all_melds(remaining_counts, joker_count - 1):
-                    return True
-        return False
     def perform_pong(self, tile):
         """执行碰牌操作"""
-        print(f"{self.name} 执行 碰!")
+        self._log(f"{self.name} 执行 碰!")
         # 创建碰的明牌组
         meld = sorted([tile, tile, tile], key=lambda t: self.rules.get(t))
-        self.locked_tiles.append(meld)
+        self._lock(meld)
         # 从手牌中移除两张
-        self.tiles.remove(tile)
-        self.tiles.remove(tile)
+        self._remove_tile(tile, 2)
+        self._update_waits()
 
     def perform_kong(self, tile):
         """执行杠牌操作"""
-        print(f"{self.name} 执行 杠!")
+        self._log(f"{self.name} 执行 杠!")
         meld = sorted([tile, tile, tile, tile], key=lambda t: self.rules.get(t))
-        self.locked_tiles.append(meld)
+        self._lock(meld)
         # 从手牌中移除三张
-        for _ in range(3):
-            self.tiles.remove(tile)
+        self._remove_tile(tile, 3)
+        self._update_waits()
 
     def perform_chow(self, tile, chow_pair):
         """执行吃牌操作"""
-        print(f"{self.name} 执行 吃!")
+        self._log(f"{self.name} 执行 吃!")
         meld = sorted(list(chow_pair) + [tile], key=lambda t: self.rules.get(t))
-        self.locked_tiles.append(meld)
+        self._lock(meld)
         # 从手牌中移除吃掉的组合
         for card in chow_pair:
-            self.tiles.remove(card)
+            self._remove_tile(card)
+        self._update_waits()
 
     def _check_all_pairs(self, counts, joker_count=0):
-        holes = sum(count % 2 for count in counts.values())
-        return joker_count >= holes and (joker_count - holes) % 2 == 0
-    
-    # _can_form_all_melds 保持不变...
-    def _can_form_all_melds(self, counts, joker_count):
-        if not any(counts.values()):
-            return True
-        first_tile = sorted(counts.keys(), key=lambda t: self.rules.get(t, -1))[0]
-        # 刻子
-        if counts[first_tile] >= 3:
-            new_counts = counts.copy(); new_counts[first_tile] -= 3
-            if new_counts[first_tile] == 0: del new_counts[first_tile]
-            if self._can_form_all_melds(new_counts, joker_count): return True
-        if counts[first_tile] >= 2 and joker_count >= 1:
-            new_counts = counts.copy(); new_counts[first_tile] -= 2
-            if new_counts[first_tile] == 0: del new_counts[first_tile]
-            if self._can_form_all_melds(new_counts, joker_count - 1): return True
-        if counts[first_tile] >= 1 and joker_count >= 2:
-            new_counts = counts.copy(); del new_counts[first_tile]
-            if self._can_form_all_melds(new_counts, joker_count - 2): return True
-        # 顺子
-        tile_val = self.rules.get(first_tile); tile_suit = first_tile[-1]
-        # 筒顺子
-        if tile_suit in 'otw' and first_tile[0] not in '89':
-            t2_name = next((k for k,v in self.rules.items() if v == tile_val + 1 and k[-1] == tile_suit), None)
-            t3_name = next((k for k,v in self.rules.items() if v == tile_val + 2 and k[-1] == tile_suit), None)
-            if t2_name and t3_name:
-                jokers_needed = (1 if counts.get(t2_name, 0) == 0 else 0) + (1 if counts.get(t3_name, 0) == 0 else 0)
-                if joker_count >= jokers_needed:
-                    new_counts = counts.copy(); new_counts[first_tile] -= 1
-                    if new_counts[first_tile] == 0: del new_counts[first_tile]
-                    if counts.get(t2_name, 0) > 0: new_counts[t2_name] -= 1; 
-                    if new_counts.get(t2_name) == 0: del new_counts[t2_name]
-                    if counts.get(t3_name, 0) > 0: new_counts[t3_name] -= 1; 
-                    if new_counts.get(t3_name) == 0: del new_counts[t3_name]
-                    if self._can_form_all_melds(new_counts, joker_count - jokers_needed): return True             
-        return False
+        return mahjong_hu.check_all_pairs(counts, joker_count)
+
+FUZHOU_RULES = {
+    'rules_name': '福州麻将 (Fuzhou Mahjong)',
+    'players_number': 4,
+    'tiles_per_player': 16,
+    'has_joker': True,
+    'joker_count': 4,
+    'three_jokers_win': True,
+    'allow_all_pairs': False,
+    'items_to_remove': {'back', 'spring', 'summer', 'autumn', 'winter', 'plum', 'orchid', 'bamboo', 'chrysanthemum'}
+}
 
 class mahjong_game:
-    def __init__(self):
+    def __init__(self, seed=None, verbose=True):
+        # 对局种子，未指定时随机生成并记录下来，用同一个种子和开局骰子可以完全复现一局
+        self.seed = seed if seed is not None else random.getrandbits(32)
+        self.rng = random.Random(self.seed)
+        self.dice = None
+        self.verbose = verbose  # False 时不输出任何内容，用于无头模拟
+        self.winner_index = None
+        self.win_type = None     # 'zimo' / 'dianpao' / 'three_jokers' (拆不出面子、只靠三金倒胡的牌)
+        self.turn_count = 0
         self.players = []
         self.discarded_pile = []
+        self.zobrist = zobrist_hash()  # 对局状态哈希，摸牌、出牌、吃碰杠、换人时增量更新
         self.current_player_index = 0
+        # 连续对局：庄家、连庄次数、圈风 (0~3 为东南西北) 和第几局
+        self.dealer = 0
+        self.first_dealer = None
+        self.dealer_streak = 0
+        self.round_wind = 0
+        self.hand_number = 0
         self.game_over = False
-        self.wall = []
+        self.wall = mahjong_wall(())
+        self._wall_tiles = ()  # 当前牌墙缓冲区对应的牌种，规则不变时下一局原地洗牌
         self.game_rules = {}
-        self.tile_definitions = {
-            '1o': 2, '2o': 3, '3o': 4, '4o': 5, '5o': 6, '6o': 7, '7o': 8, '8o': 9, '9o': 10,
-            '1t': 12, '2t': 13, '3t': 14, '4t': 15, '5t': 16, '6t': 17, '7t': 18, '8t': 19, '9t': 20,
-            '1w': 22, '2w': 23, '3w': 24, '4w': 25, '5w': 26, '6w': 27, '7w': 28, '8w': 29, '9w': 30,
-            'e': 32, 's': 34, 'w': 36, 'n': 38, 'b': 42, 'f': 44, 'z': 46,
-            'joker': 0, 'back': 99
-        }
+        self.ruleset = compile_rules()
+        self.tile_totals = bytearray(NUM_KINDS + 1)  # 每种牌在本局中的总张数 (金牌为 JOKER_CODE)
+        self.visible = bytearray(NUM_KINDS + 1)      # 已经亮出的张数 (弃牌 + 明牌)
+        self.tile_definitions = dict(TILE_DEFINITIONS)
         self._replacements = {
             '1o': '🀙', '2o': '🀚', '3o': '🀛', '4o': '🀜', '5o': '🀝', '6o': '🀞', '7o': '🀟', '8o': '🀠', '9o': '🀡',
             '1t': '🀐', '2t': '🀑', '3t': '🀒', '4t': '🀓', '5t': '🀔', '6t': '🀕', '7t': '🀖', '8t': '🀗', '9t': '🀘',
@@ -211,80 +347,168 @@ class mahjong_game:
             'e': '🀀', 's': '🀁', 'w': '🀂', 'n': '🀃', 'b': '🀆', 'f': '🀅', 'z': '🀄', 'joker': '🃏', 'back': '🀫'
         }
 
-    def _apply_rules_and_setup_wall(self):
+    def _log(self, *args, **kwargs):
+        if self.verbose: print(*args, **kwargs)
+
+    @property
+    def current_player_index(self):
+        return self._current_player_index
+
+    @current_player_index.setter
+    def current_player_index(self, index):
+        self._current_player_index = index
+        self.zobrist.set_turn(index)
+
+    @staticmethod
+    def _win_type(player, base, tile=None):
+        """胡牌时判定胜法：只有三金倒一种拆法时记为 'three_jokers'，否则为 base (自摸 / 点炮)"""
+        solution = player.solve_hu(tile)
+        if solution is not None and solution['type'] == 'three_jokers':
+            return 'three_jokers'
+        return base
+
+    def next_dealer(self):
+        """下一局的庄家：庄家胡牌或流局时连庄，闲家胡牌时由庄家的下家坐庄"""
+        if self.winner_index is None or self.winner_index == self.dealer:
+            return self.dealer
+        return (self.dealer + 1) % 4
+
+    def reset(self, seed=None, dealer=None, new_match=False):
+        """
+        为下一局复位，之后照常调用 start_game。玩家对象、牌墙缓冲区、计数数组和哈希都原地复用，
+        只清空本局状态；同一个种子和庄家得到的对局与新建 mahjong_game 完全相同。
+        seed 默认由上一局的随机数生成器给出，dealer 默认按 next_dealer 连庄或轮庄。
+        new_match 为 True 时开始一场新的比赛：连庄次数、第几局、圈风和首个庄家回到初始值，与新建对局的结果完全相同。
+        """
+        if dealer is None:
+            dealer = self.next_dealer()
+        if new_match:
+            self.dealer_streak = 0
+            self.round_wind = 0
+            self.hand_number = 0
+            self.first_dealer = None
+        elif dealer == self.dealer:
+            self.dealer_streak += 1
+        else:
+            self.dealer_streak = 0
+            if dealer == self.first_dealer:
+                self.round_wind = (self.round_wind + 1) % 4  # 轮庄一圈，换圈风
+        if not new_match:
+            self.hand_number += 1
+
+        self.seed = seed if seed is not None else self.rng.getrandbits(32)
+        self.rng.seed(self.seed)
+        self.dice = None
+        self.winner_index = None
+        self.win_type = None
+        self.turn_count = 0
+        self.game_over = False
+        self.discarded_pile.clear()
+        self.visible[:] = bytes(NUM_KINDS + 1)
+        self.current_player_index = dealer
+
+    @property
+    def state_hash(self):
+        """整个局面的 64 位哈希 (含各家手牌)"""
+        return self.zobrist.value
+
+    @property
+    def public_hash(self):
+        """只含公开信息的哈希，与客户端用 mahjong_zobrist.public_state_hash 算出的相同"""
+        return self.zobrist.public
+
+    def _apply_rules_and_setup_wall(self, dice=None):
         """
         [重构] 根据游戏规则准备牌墙。替代旧的Fuzhou_rules。
+        洗牌、翻金、限制金牌数在 mahjong_wall.setup 中一次完成，洗牌种子由对局种子和开局骰子决定。
         """
-        print("--- 应用游戏规则并准备牌墙 ---")
+        self._log("--- 应用游戏规则并准备牌墙 ---")
         
-        # 根据规则移除不需要的牌种
-        items_to_remove = self.game_rules.get('items_to_remove', {'back'})
-        self.tile_definitions = {name: val for name, val in self.tile_definitions.items() if name not in items_to_remove}
-
-        # 洗牌
-        main_tiles = [name for name, val in self.tile_definitions.items() if val < 50 and name != 'joker']
-        self.wall = [name for name in main_tiles for _ in range(4)]
-        random.shuffle(self.wall)
-        print(f"牌墙洗牌完成，共 {len(self.wall)} 张牌。")
-
-        # 根据规则处理金牌
-        if self.game_rules.get('has_joker', True):
-            gold_dice = random.randint(2, 12)
-            gold_tile_name = self.wall[-gold_dice]
-            print("翻出的金牌是:", self._replacements.get(gold_tile_name, gold_tile_name))
-            self.wall = ['joker' if tile == gold_tile_name else tile for tile in self.wall]
-            joker_count = self.wall.count('joker')
-            # 确保不多于规则允许的金牌数
-            max_jokers = self.game_rules.get('joker_count', 4)
-            while self.wall.count('joker') > max_jokers:
-                self.wall.remove('joker')
-            print(f"牌墙中共有 {self.wall.count('joker')} 张金牌 (Joker)。")
+        # 移除不需要的牌种 (规则编译时已经算好)
+        self.tile_definitions = dict(self.ruleset.tile_definitions)
+
+        # 开局骰子 (第一次骰子结果会作为随机种子，真的会影响出牌)
+        self.dice = dice if dice is not None else self.rng.randint(2, 12)
+        if self._wall_tiles != self.ruleset.main_tiles:
+            self.wall = mahjong_wall(self.ruleset.main_tiles)
+            self._wall_tiles = self.ruleset.main_tiles
+        golden_tile = self.wall.setup(
+            self.seed * 16 + self.dice,
+            has_joker=self.ruleset.has_joker,
+            max_jokers=self.ruleset.joker_count,  # 确保不多于规则允许的金牌数
+        )
+        self.zobrist.reset(self.wall.head, self.wall.tail, self.current_player_index)
+        self._log(f"牌墙洗牌完成，共 {len(self.wall)} 张牌。")
+        if golden_tile is not None:
+            self._log("翻出的金牌是:", self._replacements.get(golden_tile, golden_tile))
+            self._log(f"牌墙中共有 {self.wall.count('joker')} 张金牌 (Joker)。")
+
+        self.tile_totals[:] = bytes(NUM_KINDS + 1)
+        for code in self.wall.codes[self.wall.head:self.wall.tail]:
+            self.tile_totals[code] += 1
 
     def deal_tiles(self):
-        print("\n--- 开始发牌 ---")
-        tiles_per_player = self.game_rules.get('tiles_per_player', 13)
+        self._log("\n--- 开始发牌 ---")
+        tiles_per_player = self.ruleset.tiles_per_player
         for player in self.players:
-            player.tiles = self.wall[:tiles_per_player]
-            self.wall = self.wall[tiles_per_player:]
-            player.sort_tiles()
+            player.tiles = self.wall.deal(tiles_per_player)
+            self.zobrist.wall(self.wall.head, self.wall.tail)
             hand_str = ' '.join(self._replacements.get(t, t) for t in player.tiles)
-            print(f"{player.name} 的初始手牌: {hand_str}")
-        print(f"\n牌墙剩余: {len(self.wall)} 张")
-        print("牌墙：", ' '.join(self._replacements.get(t, t) for t in self.wall), "...")
-
-    def draw_tile(self, player):
-        if not self.wall:
+            self._log(f"{player.name} 的初始手牌: {hand_str}")
+        self._log(f"\n牌墙剩余: {len(self.wall)} 张")
+        self._log("牌墙：", ' '.join(self._replacements.get(t, t) for t in self.wall), "...")
+
+    def draw_tile(self, player, from_back=False):
+        """摸牌；from_back=True 为杠后从牌墙尾部补张"""
+        new_tile = self.wall.draw_back() if from_back else self.wall.draw()
+        if new_tile is None:
             return None
-        new_tile = self.wall.pop(0)
+        self.zobrist.wall(self.wall.head, self.wall.tail)
         player.new_tile = new_tile
-        player.tiles.append(new_tile)
-        player.sort_tiles()
+        player.add_tile(new_tile)
         return new_tile
 
+    def _reveal(self, tiles):
+        for tile in tiles:
+            self.visible[tile_code(tile)] += 1
+
+    def live_wait_count(self, player):
+        """玩家听的牌还剩多少张没现身 (扣除弃牌、明牌和自己的手牌)"""
+        live = 0
+        for code in player.waits:
+            own = player.hand.jokers if code == JOKER_CODE else player.hand.counts[code]
+            live += max(0, self.tile_totals[code] - self.visible[code] - own)
+        return live
+
     def check_for_claims_and_act(self, discarded_tile, discarder_index):
         """
         [已整合胡牌判断] 检查其他玩家的操作。
         """
         possible_actions = []
         next_player_index = (discarder_index + 1) % 4
-        
+        code = tile_code(discarded_tile)
+
         for i, player in enumerate(self.players):
             if i == discarder_index: continue
+            # 每个玩家的触发集合随手牌增量维护，这里只做集合成员判断
+            claims = player.claims
+            can_hu = code in player.waits
+            can_pong = code in claims.pong
+            can_chow = i == next_player_index and code in claims.chow
+            if not (can_hu or can_pong or can_chow): continue
 
             # *** 核心修改：在这里加入“点炮胡”的判断 ***
             # 优先级最高
-            if player.can_hu(discarded_tile, self.game_rules):
+            if can_hu:
                 possible_actions.append({'type': 'hu', 'player_index': i, 'priority': 3})
 
-            if player.can_kong(discarded_tile):
+            if code in claims.kong:
                 possible_actions.append({'type': 'kong', 'player_index': i, 'priority': 2})
-            if player.can_pong(discarded_tile):
+            if can_pong:
                 possible_actions.append({'type': 'pong', 'player_index': i, 'priority': 2})
-            if i == next_player_index:
-                chows = player.can_chow(discarded_tile)
-                if chows:
-                    for chow_pair in chows:
-                        possible_actions.append({'type': 'chow', 'player_index': i, 'priority': 1, 'chow_pair': chow_pair})
+            if can_chow:
+                for chow_pair in player.can_chow(discarded_tile):
+                    possible_actions.append({'type': 'chow', 'player_index': i, 'priority': 1, 'chow_pair': chow_pair})
         
         if not possible_actions:
             return False
@@ -295,79 +519,110 @@ class mahjong_game:
         highest_priority = possible_actions[0]['priority']
         top_actions = [a for a in possible_actions if a['priority'] == highest_priority]
         
-        print("\n--- 操作提示 ---")
-        action_map = {}
-        for idx, action in enumerate(top_actions):
-            # ... (此部分UI逻辑不变) ...
-            player = self.players[action['player_index']]; action_type = action['type']
-            action_key = f"{idx + 1}"; action_map[action_key] = action
-            if action_type == 'chow':
-                chow_str = ' '.join(self._replacements.get(t,t) for t in action['chow_pair'])
-                print(f"{action_key}: {player.name} 可以 吃 ({chow_str})")
-            else:
-                print(f"{action_key}: {player.name} 可以 {action_type.capitalize()}!")
-
-        choice = input("有玩家可以操作，请输入序号执行操作，或按 Enter 跳过: ")
-        if choice in action_map:
-            chosen_action = action_map[choice]
+        if all(self.players[a['player_index']].policy is not None for a in top_actions):
+            # 无头模式：按顺序询问每个可操作玩家的策略，第一个接受的执行
+            chosen_action = next((a for a in top_actions
+                                  if self.players[a['player_index']].policy.choose_claim(self, a, discarded_tile)), None)
+        else:
+            chosen_action = self._ask_claim(top_actions)
+
+        if chosen_action is not None:
             actor = self.players[chosen_action['player_index']]
             action_type = chosen_action['type']
 
             # *** 核心修改：处理胡牌 ***
             if action_type == 'hu':
-                print(f"🎉🎉🎉 {actor.name} 胡牌！赢家是 {actor.name}！ 🎉🎉🎉")
-                print(f"明牌: {' '.join(''.join(self._replacements.get(t,t) for t in meld) for meld in actor.locked_tiles)}")
-                print(f"手牌: {' '.join(self._replacements.get(t, t) for t in actor.tiles)}")
+                self._log(f"🎉🎉🎉 {actor.name} 胡牌！赢家是 {actor.name}！ 🎉🎉🎉")
+                self._log(f"明牌: {' '.join(''.join(self._replacements.get(t,t) for t in meld) for meld in actor.locked_tiles)}")
+                self._log(f"手牌: {' '.join(self._replacements.get(t, t) for t in actor.tiles)}")
+                if self.verbose:
+                    self._log(f"牌型: {mahjong_hu.describe(actor.solve_hu(discarded_tile), self._replacements)}")
 
                 self.game_over = True
+                self.winner_index = chosen_action['player_index']
+                self.win_type = self._win_type(actor, 'dianpao', discarded_tile)
                 return True # 表示有人行动且游戏结束
 
             # ... (其他动作处理不变) ...
-            elif action_type == 'pong': actor.perform_pong(discarded_tile)
+            self.players[discarder_index].take_discard()
+            if action_type == 'pong':
+                actor.perform_pong(discarded_tile)
+                self._reveal([discarded_tile] * 2)
             elif action_type == 'kong':
                 actor.perform_kong(discarded_tile)
+                self._reveal([discarded_tile] * 3)
                 # 杠牌后，立刻为该玩家从牌墙补一张牌
-                print(f"{actor.name} 从牌墙补张...")
-                self.draw_tile(actor)
-            elif action_type == 'chow': actor.perform_chow(discarded_tile, chosen_action['chow_pair'])
+                self._log(f"{actor.name} 从牌墙补张...")
+                self.draw_tile(actor, from_back=True)
+            elif action_type == 'chow':
+                actor.perform_chow(discarded_tile, chosen_action['chow_pair'])
+                self._reveal(chosen_action['chow_pair'])
             
             self.current_player_index = chosen_action['player_index']
             return True
 
-        print("玩家选择跳过。")
+        self._log("玩家选择跳过。")
         return False
 
-    def start_game(self):
+    def _ask_claim(self, top_actions):
+        """控制台询问操作，返回选中的操作或 None"""
+        print("\n--- 操作提示 ---")
+        action_map = {}
+        for idx, action in enumerate(top_actions):
+            player = self.players[action['player_index']]; action_type = action['type']
+            action_key = f"{idx + 1}"; action_map[action_key] = action
+            if action_type == 'chow':
+                chow_str = ' '.join(self._replacements.get(t,t) for t in action['chow_pair'])
+                print(f"{action_key}: {player.name} 可以 吃 ({chow_str})")
+            else:
+                print(f"{action_key}: {player.name} 可以 {action_type.capitalize()}!")
+
+        choice = input("有玩家可以操作，请输入序号执行操作，或按 Enter 跳过: ")
+        return action_map.get(choice)
+
+    def _choose_discard(self, player, can_zimo=False):
+        """返回要打出的牌的序号，或 'hu' 表示自摸"""
+        if player.policy is None:
+            return player.get_player_input(self._replacements, can_zimo=can_zimo)
+        return player.policy.choose_discard(self, player, can_zimo)
+
+    def start_game(self, game_rules=None, policies=None, dice=None):
         """
         [重构] 游戏启动入口，设定规则并开始游戏。
+        policies 为每个座位的策略对象列表 (None 表示该座位由控制台输入)，全部给出时即为无头模式。
+        dice 为开局骰子点数，不指定时由对局种子掷出。
+        连续对局时先调用 reset()，再调用本方法，上一局的玩家对象会被复用。
         """
-        self.game_rules = {
-            'rules_name': '福州麻将 (Fuzhou Mahjong)',
-            'players_number': 4,
-            'tiles_per_player': 16,
-            'has_joker': True,
-            'joker_count': 4,
-            'three_jokers_win': True,
-            'allow_all_pairs': False,
-            'items_to_remove': {'back', 'spring', 'summer', 'autumn', 'winter', 'plum', 'orchid', 'bamboo', 'chrysanthemum'}
-        }
-        print(f"--- 载入规则: {self.game_rules['rules_name']} ---")
+        self.ruleset = compile_rules(FUZHOU_RULES if game_rules is None else game_rules)
+        self.game_rules = self.ruleset.as_dict()
+        self._log(f"--- 载入规则: {self.ruleset.rules_name} ---")
 
-        self._apply_rules_and_setup_wall()
+        self._apply_rules_and_setup_wall(dice)
         
-        player_names = ["张三", "李四", "王五", "赵六"]
-        for i in range(4):
-            player = mahjong_players(i, player_names[i], self.tile_definitions)
-            self.players.append(player)
+        if self.players:
+            for i, player in enumerate(self.players):
+                player.reset(self.tile_definitions, self.ruleset)
+                if policies is not None: player.policy = policies[i]
+        else:
+            player_names = ["张三", "李四", "王五", "赵六"]
+            for i in range(4):
+                player = mahjong_players(i, player_names[i], self.tile_definitions, game_rules=self.ruleset)
+                player.verbose = self.verbose
+                player.zobrist = self.zobrist
+                if policies is not None: player.policy = policies[i]
+                self.players.append(player)
         self.deal_tiles()
         
-        banker = self.players[self.current_player_index]
-        print(f"\n--- 游戏开始，庄家是 {banker.name} ---")
-        self.game_loop()
+        self.dealer = self.current_player_index
+        if self.first_dealer is None: self.first_dealer = self.dealer
+        banker = self.players[self.dealer]
+        streak = f" (连庄 {self.dealer_streak} 次)" if self.dealer_streak else ""
+        self._log(f"\n--- 游戏开始，庄家是 {banker.name}{streak} ---")
+        return self.game_loop()
 
     def game_loop(self):
         """
-        [已整合胡牌判断] 游戏主循环。
+        [已整合胡牌判断] 游戏主循环。返回本局结果。
         """
         player_just_claimed = False
 
@@ -376,31 +631,40 @@ class mahjong_game:
 
             if not player_just_claimed:
                 if self.draw_tile(current_player) is None: break
-                print(f"牌墙剩余: {len(self.wall)} 张")
-                print(f"{current_player.name} 摸到了: {self._replacements.get(current_player.new_tile)}")
+                self._log(f"牌墙剩余: {len(self.wall)} 张")
+                self._log(f"{current_player.name} 摸到了: {self._replacements.get(current_player.new_tile)}")
                 
                 # *** 核心修改：在这里加入“自摸”判断 ***
-                if current_player.can_hu(None, self.game_rules):
-                    choice = current_player.get_player_input(self._replacements, can_zimo=True)
+                if current_player.wins_with(current_player.new_tile):
+                    choice = self._choose_discard(current_player, can_zimo=True)
                     if choice == 'hu':
-                        print(f"🎉🎉🎉 {current_player.name} 自摸胡牌！ 🎉🎉🎉")
+                        self._log(f"🎉🎉🎉 {current_player.name} 自摸胡牌！ 🎉🎉🎉")
+                        if self.verbose:
+                            self._log(f"牌型: {mahjong_hu.describe(current_player.solve_hu(), self._replacements)}")
                         self.game_over = True
+                        self.winner_index = self.current_player_index
+                        self.win_type = self._win_type(current_player, 'zimo')
                         break # 游戏结束，跳出主循环
                     # 如果玩家可以自摸但选择不胡，则正常出牌
                     discarded_tile = current_player.discard_tile(choice)
                 else:
                     # 不能自摸，正常出牌
-                    choice_idx = current_player.get_player_input(self._replacements)
+                    choice_idx = self._choose_discard(current_player)
                     discarded_tile = current_player.discard_tile(choice_idx)
             else:
                 # 吃碰杠之后，不需要摸牌，直接出牌
                 player_just_claimed = False
-                print(f"\n轮到 {current_player.name} 出牌。")
-                choice_idx = current_player.get_player_input(self._replacements)
+                self._log(f"\n轮到 {current_player.name} 出牌。")
+                choice_idx = self._choose_discard(current_player)
                 discarded_tile = current_player.discard_tile(choice_idx)
             
-            print(f"{current_player.name} 打出了: {self._replacements.get(discarded_tile, discarded_tile)}")
+            self._log(f"{current_player.name} 打出了: {self._replacements.get(discarded_tile, discarded_tile)}")
             self.discarded_pile.append(discarded_tile)
+            self._reveal([discarded_tile])
+            self.turn_count += 1
+            if current_player.waits and self.verbose:
+                waiting_str = ' '.join(self._replacements.get(t, t) for t in current_player.waiting_tiles)
+                self._log(f"{current_player.name} 听牌: {waiting_str} (还剩 {self.live_wait_count(current_player)} 张)，你即将获得胜利 请不要忘记选择你的胜利音乐")
             
             action_taken = self.check_for_claims_and_act(discarded_tile, self.current_player_index)
 
@@ -411,14 +675,21 @@ class mahjong_game:
                 self.current_player_index = (self.current_player_index + 1) % 4
         
         if not self.game_over:
-             print("-" * 40 + "\n牌墙已摸完，流局！\n" + "-" * 40)
+             self._log("-" * 40 + "\n牌墙已摸完，流局！\n" + "-" * 40)
+        return {
+            'winner': self.winner_index,
+            'win_type': self.win_type,
+            'turns': self.turn_count,
+            'wall_remaining': len(self.wall),
+        }
 
 # --- 测试 ---
-game = mahjong_game()
-game.start_game()
-# player = mahjong_players(0, "测试玩家", game.tile_definitions)
-# player.tiles = ['7t','9t','joker','1w']
-# player.sort_tiles()
-# print(player.can_hu('1w', game.game_rules))  # 测试胡牌判断
+if __name__ == '__main__':
+    game = mahjong_game()
+    game.start_game()
+    # player = mahjong_players(0, "测试玩家", game.tile_definitions)
+    # player.tiles = ['7t','9t','joker','1w']
+    # player.sort_tiles()
+    # print(player.can_hu('1w', game.game_rules))  # 测试胡牌判断
 
 
@@ -0,0 +1,273 @@
+"""
+对局结果的列式存储，用于事后统计 (三金倒结束的比例、各规则胡牌时牌墙平均剩余张数等)。
+
+每局一条定长记录，按列分别写成原始小端数组，存放在按行数切分的块目录里：
+
+    outcomes/
+        schema.json              版本、列名和类型、每块行数
+        rulesets.json            规则编号 -> 规则名和规则内容
+        chunk_000000/winner.bin  每列一个文件，可直接 numpy.memmap
+        chunk_000000/turns.bin
+        ...
+
+写入只用标准库 (array)，服务器不需要 numpy；记录先缓存在内存里，攒够 flush_every 条或 close() 时追加到文件。
+一块写满 chunk_rows 行后开新块。块的行数取各列文件行数的最小值，写到一半中断时多出来的部分在下次打开时截掉。
+同一个目录同时只能有一个写入者 (模拟在主进程里汇总后写入)。
+
+查询 (需要 numpy) 逐块映射并累加，不会把全部记录读进内存：
+    python mahjong_outcomes.py outcomes --by ruleset
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from array import array
+
+from mahjong_rules import compile_rules
+
+STORE_VERSION = 1
+CHUNK_ROWS = 1 << 16
+FLUSH_EVERY = 1024
+
+# (列名, numpy 类型, array 类型码)
+COLUMNS = (
+    ('ruleset', '<u8', 'Q'),        # 规则编号 (规则指纹的 64 位摘要)
+    ('winner', '<i1', 'b'),         # 赢家座位，流局为 -1
+    ('win_type', '<u1', 'B'),       # 见 WIN_TYPES
+    ('dealer', '<i1', 'b'),         # 庄家座位，未知为 -1
+    ('turns', '<u2', 'H'),          # 出牌巡数
+    ('jokers', '<u1', 'B'),         # 赢家手里的金牌数，流局为 0
+    ('wall_remaining', '<u2', 'H'),
+    ('duration', '<f4', 'f'),       # 秒
+)
+WIN_TYPES = ('draw', 'zimo', 'dianpao', 'three_jokers')
+WIN_TYPE_CODES = {name: i for i, name in enumerate(WIN_TYPES)}
+DEFAULT_PATH = os.environ.get('MAHJONG_OUTCOMES', 'outcomes')
+
+_ids = {}
+
+
+def ruleset_id(ruleset):
+    """规则集 -> 64 位编号，不同进程、不同次运行得到的编号相同"""
+    ruleset = compile_rules(ruleset)
+    rid = _ids.get(ruleset.fingerprint)
+    if rid is None:
+        digest = hashlib.blake2b(repr(ruleset.fingerprint).encode('utf-8'), digest_size=8).digest()
+        rid = _ids[ruleset.fingerprint] = int.from_bytes(digest, 'little')
+    return rid
+
+
+def win_type_code(win_type):
+    """引擎判定的 win_type ('zimo' / 'dianpao' / 'three_jokers'，流局为 None) -> 编码，不从手牌重新推断"""
+    if win_type is None: return WIN_TYPE_CODES['draw']
+    code = WIN_TYPE_CODES.get(win_type)
+    if code is None or win_type == 'draw':
+        raise ValueError(f"未知的胜法: {win_type}")
+    return code
+
+
+def _chunk_dir(root, index):
+    return os.path.join(root, f"chunk_{index:06d}")
+
+
+def _chunk_rows(directory):
+    """块内的有效行数：各列文件行数的最小值"""
+    rows = None
+    for name, dtype, _ in COLUMNS:
+        path = os.path.join(directory, name + '.bin')
+        n = os.path.getsize(path) // int(dtype[2:]) if os.path.exists(path) else 0
+        rows = n if rows is None else min(rows, n)
+    return rows or 0
+
+
+def _chunks(root):
+    if not os.path.isdir(root): return []
+    return sorted(os.path.join(root, d) for d in os.listdir(root) if d.startswith('chunk_'))
+
+
+class outcome_recorder:
+    """追加写入对局结果；可作为上下文管理器使用，退出时写完缓存"""
+
+    def __init__(self, path=DEFAULT_PATH, chunk_rows=CHUNK_ROWS, flush_every=FLUSH_EVERY):
+        self.path = path
+        self.flush_every = flush_every
+        os.makedirs(path, exist_ok=True)
+        schema_path = os.path.join(path, 'schema.json')
+        if os.path.exists(schema_path):
+            with open(schema_path, encoding='utf-8') as f:
+                schema = json.load(f)
+            if schema.get('version') != STORE_VERSION or [c[0] for c in schema['columns']] != [c[0] for c in COLUMNS]:
+                raise ValueError(f"{path} 中的结果文件版本或列与当前程序不符")
+            chunk_rows = schema['chunk_rows']
+        else:
+            with open(schema_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': STORE_VERSION, 'columns': [c[:2] for c in COLUMNS], 'chunk_rows': chunk_rows}, f)
+        self.chunk_rows = chunk_rows
+        self._rulesets_path = os.path.join(path, 'rulesets.json')
+        self._rulesets = {}
+        if os.path.exists(self._rulesets_path):
+            with open(self._rulesets_path, encoding='utf-8') as f:
+                self._rulesets = json.load(f)
+        self._buffers = {name: array(code) for name, _, code in COLUMNS}
+        self._pending = 0
+
+        chunks = _chunks(path)
+        self._chunk = len(chunks) - 1 if chunks else 0
+        self._rows = _chunk_rows(chunks[-1]) if chunks else 0
+        if chunks: self._repair(chunks[-1])
+
+    def _repair(self, directory):
+        """截掉中断写入留下的半截行"""
+        for name, dtype, _ in COLUMNS:
+            path = os.path.join(directory, name + '.bin')
+            size = self._rows * int(dtype[2:])
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                with open(path, 'r+b') as f: f.truncate(size)
+
+    def record(self, ruleset, winner, win_type, turns, jokers=0, wall_remaining=0, duration=0.0, dealer=None):
+        """追加一条记录。ruleset 为规则字典或规则集，win_type 为引擎判定的 'zimo' / 'dianpao' / 'three_jokers' / None"""
+        ruleset = compile_rules(ruleset)
+        rid = ruleset_id(ruleset)
+        key = format(rid, '016x')
+        if key not in self._rulesets:
+            rules = ruleset.as_dict()
+            rules['items_to_remove'] = sorted(rules['items_to_remove'])
+            self._rulesets[key] = rules
+            with open(self._rulesets_path, 'w', encoding='utf-8') as f:
+                json.dump(self._rulesets, f, ensure_ascii=False)
+        values = (rid, -1 if winner is None else winner, win_type_code(win_type),
+                  -1 if dealer is None else dealer, turns, jokers, wall_remaining, duration)
+        for (name, _, _), value in zip(COLUMNS, values):
+            self._buffers[name].append(value)
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+
+    def record_game(self, game, result=None, duration=0.0):
+        """从单机版 mahjong_game (或 mahjong_sim 的结果字典) 记录一局"""
+        winner = game.winner_index
+        jokers = game.players[winner].hand.jokers if winner is not None else 0
+        if result is not None: duration = result.get('duration', duration)
+        self.record(game.ruleset, winner, game.win_type, game.turn_count, jokers, len(game.wall), duration, game.dealer)
+
+    def flush(self):
+        """把缓存的记录追加到文件，块写满时换下一块"""
+        start = 0
+        while start < self._pending:
+            n = min(self._pending - start, self.chunk_rows - self._rows)
+            if n <= 0:
+                self._chunk += 1
+                self._rows = 0
+                continue
+            directory = _chunk_dir(self.path, self._chunk)
+            os.makedirs(directory, exist_ok=True)
+            for name, _, _ in COLUMNS:
+                with open(os.path.join(directory, name + '.bin'), 'ab') as f:
+                    f.write(self._buffers[name][start:start + n].tobytes())
+            self._rows += n
+            start += n
+        for buffer in self._buffers.values():
+            del buffer[:]
+        self._pending = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ---------- 查询 (需要 numpy) ----------
+
+def iter_chunks(path=DEFAULT_PATH):
+    """逐块返回 {列名: numpy.memmap}，只映射不读入"""
+    import numpy as np
+
+    for directory in _chunks(path):
+        rows = _chunk_rows(directory)
+        if not rows: continue
+        yield {name: np.memmap(os.path.join(directory, name + '.bin'), dtype=dtype, mode='r', shape=(rows,))
+               for name, dtype, _ in COLUMNS}
+
+
+def rulesets(path=DEFAULT_PATH):
+    """规则编号 (16 位十六进制) -> 规则字典"""
+    try:
+        with open(os.path.join(path, 'rulesets.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def summarize(path=DEFAULT_PATH, by='ruleset', where=None):
+    """
+    按 by 列 (ruleset / winner / dealer / win_type / jokers) 分组汇总。
+    where 为可选的过滤函数，接收一块的列字典，返回布尔掩码，例如 lambda c: c['turns'] > 20。
+    每组返回局数、各胜法局数、三金倒比例、平均巡数、胡牌时牌墙平均剩余张数、平均时长。
+    """
+    import numpy as np
+
+    groups = {}
+    for chunk in iter_chunks(path):
+        mask = np.ones(len(chunk['winner']), dtype=bool) if where is None else np.asarray(where(chunk), dtype=bool)
+        keys = chunk[by][mask]
+        win_type = chunk['win_type'][mask]
+        turns = chunk['turns'][mask].astype(np.int64)
+        wall = chunk['wall_remaining'][mask].astype(np.int64)
+        duration = chunk['duration'][mask].astype(np.float64)
+        won = win_type != WIN_TYPE_CODES['draw']
+        values, inverse = np.unique(keys, return_inverse=True)
+        size = len(values)
+        games = np.bincount(inverse, minlength=size)
+        type_counts = [np.bincount(inverse[win_type == code], minlength=size) for code in range(len(WIN_TYPES))]
+        turn_sum = np.bincount(inverse, weights=turns, minlength=size)
+        wall_sum = np.bincount(inverse[won], weights=wall[won], minlength=size)
+        duration_sum = np.bincount(inverse, weights=duration, minlength=size)
+        for i, value in enumerate(values.tolist()):
+            g = groups.setdefault(value, {'games': 0, 'types': [0] * len(WIN_TYPES), 'turns': 0.0, 'wall': 0.0,
+                                          'duration': 0.0})
+            g['games'] += int(games[i])
+            for code in range(len(WIN_TYPES)):
+                g['types'][code] += int(type_counts[code][i])
+            g['turns'] += float(turn_sum[i])
+            g['wall'] += float(wall_sum[i])
+            g['duration'] += float(duration_sum[i])
+
+    names = rulesets(path) if by == 'ruleset' else {}
+    result = {}
+    for value, g in sorted(groups.items()):
+        games = g['games']
+        wins = games - g['types'][WIN_TYPE_CODES['draw']]
+        if by == 'ruleset':
+            key = format(value, '016x')
+            label = f"{names.get(key, {}).get('rules_name', '?')} [{key}]"
+        elif by == 'win_type':
+            label = WIN_TYPES[value]
+        else:
+            label = str(value)
+        result[label] = {
+            'games': games,
+            **{name: g['types'][code] for code, name in enumerate(WIN_TYPES)},
+            'three_jokers_rate': g['types'][WIN_TYPE_CODES['three_jokers']] / games,
+            'draw_rate': g['types'][WIN_TYPE_CODES['draw']] / games,
+            'avg_turns': g['turns'] / games,
+            'avg_wall_at_win': g['wall'] / wins if wins else 0.0,
+            'avg_duration': g['duration'] / games,
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="汇总对局结果")
+    parser.add_argument('path', nargs='?', default=DEFAULT_PATH)
+    parser.add_argument('--by', default='ruleset', choices=['ruleset', 'winner', 'dealer', 'win_type', 'jokers'])
+    args = parser.parse_args()
+    print(json.dumps(summarize(args.path, args.by), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+编译后的只读规则集。
+
+规则字典 (单机版的 FUZHOU_RULES 风格键名，或服务器房间里 "golden tile number" 这样带空格的键名)
+只在创建时校验一次，编译成 mahjong_ruleset：移除 items_to_remove 后的牌序定义、摸牌用的牌种、
+金牌设置、手牌张数、各种等待时间，以及该规则对应的吃牌索引和胡牌缓存指纹。
+热点路径直接读属性，不再每次查字典。
+
+内容相同的规则只编译一次，所有房间、所有对局共用同一个实例；fingerprint 可以直接作缓存键。
+"""
+
+from types import MappingProxyType
+
+from mahjong_tiles import get_tile_index
+
+# 全部牌的牌序定义 (牌名 -> 牌序数值)，同一门相邻牌相差 1，>= 50 的不进牌墙
+TILE_DEFINITIONS = MappingProxyType({
+    '1o': 2, '2o': 3, '3o': 4, '4o': 5, '5o': 6, '6o': 7, '7o': 8, '8o': 9, '9o': 10,
+    '1t': 12, '2t': 13, '3t': 14, '4t': 15, '5t': 16, '6t': 17, '7t': 18, '8t': 19, '9t': 20,
+    '1w': 22, '2w': 23, '3w': 24, '4w': 25, '5w': 26, '6w': 27, '7w': 28, '8w': 29, '9w': 30,
+    'e': 32, 's': 34, 'w': 36, 'n': 38, 'b': 42, 'f': 44, 'z': 46,
+    'joker': 0, 'back': 99
+})
+
+# 未给出的规则取这些值，与引擎原先 game_rules.get(...) 的默认值一致
+DEFAULTS = {
+    'rules_name': '自定义规则',
+    'players_number': 4,
+    'tiles_per_player': 13,
+    'has_joker': True,
+    'joker_count': 4,
+    'three_jokers_win': False,
+    'allow_all_pairs': True,
+    'items_to_remove': frozenset({'back'}),
+    'stand_delay': 20,
+    'special_delay': 5,
+}
+
+# 服务器房间规则的键名 -> 引擎键名
+ROOM_KEYS = {
+    'rules': 'rules_name',
+    'max players': 'players_number',
+    'tiles number': 'tiles_per_player',
+    'golden tile': 'has_joker',
+    'golden tile number': 'joker_count',
+    'three golden win': 'three_jokers_win',
+    'allow seven pairs': 'allow_all_pairs',
+    'stand delay': 'stand_delay',
+    'special delay': 'special_delay',
+    'items_to_remove': 'items_to_remove',
+}
+
+
+def _check_int(key, value, low, high):
+    if isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+        raise ValueError(f"规则 {key} 必须是 {low}~{high} 之间的整数，收到 {value!r}")
+    return value
+
+
+def _check_bool(key, value):
+    if not isinstance(value, bool):
+        raise ValueError(f"规则 {key} 必须是 true/false，收到 {value!r}")
+    return value
+
+
+def _check_delay(key, value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 < value <= 600:
+        raise ValueError(f"规则 {key} 必须是 0~600 秒之间的数，收到 {value!r}")
+    return value
+
+
+def _check_items(key, value):
+    if isinstance(value, str) or not all(isinstance(name, str) for name in value):
+        raise ValueError(f"规则 {key} 必须是牌名列表，收到 {value!r}")
+    return frozenset(value)
+
+
+_VALIDATORS = {
+    'rules_name': lambda key, value: str(value),
+    'players_number': lambda key, value: _check_int(key, value, 2, 4),
+    'tiles_per_player': lambda key, value: _check_int(key, value, 1, 16),
+    'has_joker': _check_bool,
+    'joker_count': lambda key, value: _check_int(key, value, 0, 4),
+    'three_jokers_win': _check_bool,
+    'allow_all_pairs': _check_bool,
+    'items_to_remove': _check_items,
+    'stand_delay': _check_delay,
+    'special_delay': _check_delay,
+}
+
+
+def normalize_rules(rules):
+    """两种键名的规则字典 -> 校验过的引擎键名字典 (缺的键取默认值)，不认识的键或非法值抛 ValueError"""
+    normalized = dict(DEFAULTS)
+    for key, value in rules.items():
+        name = ROOM_KEYS.get(key, key)
+        validator = _VALIDATORS.get(name)
+        if validator is None:
+            raise ValueError(f"未知的规则: {key}")
+        normalized[name] = validator(key, value)
+    return normalized
+
+
+class mahjong_ruleset:
+    """编译后的规则，只读；用 compile_rules 获取，不要直接构造"""
+    __slots__ = ('rules_name', 'players_number', 'tiles_per_player', 'has_joker', 'joker_count',
+                 'three_jokers_win', 'allow_all_pairs', 'items_to_remove', 'stand_delay', 'special_delay',
+                 'tile_definitions', 'main_tiles', 'index', 'hu_fingerprint', 'fingerprint')
+
+    def __init__(self, normalized, fingerprint):
+        for key, value in normalized.items():
+            object.__setattr__(self, key, value)
+        tile_definitions = {name: value for name, value in TILE_DEFINITIONS.items()
+                            if name not in self.items_to_remove}
+        object.__setattr__(self, 'tile_definitions', MappingProxyType(tile_definitions))
+        # 进牌墙的牌种
+        object.__setattr__(self, 'main_tiles', tuple(name for name, value in tile_definitions.items()
+                                                     if value < 50 and name != 'joker'))
+        object.__setattr__(self, 'index', get_tile_index(tile_definitions))
+        # 与 mahjong_hu.can_hu 缓存键里的规则指纹相同
+        object.__setattr__(self, 'hu_fingerprint', (self.three_jokers_win, self.allow_all_pairs))
+        object.__setattr__(self, 'fingerprint', fingerprint)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("mahjong_ruleset 是只读的")
+
+    def as_dict(self):
+        """引擎键名的规则字典 (items_to_remove 为集合)"""
+        return {key: getattr(self, key) for key in DEFAULTS}
+
+    def __repr__(self):
+        return f"mahjong_ruleset({self.rules_name!r})"
+
+
+_rulesets = {}
+
+
+def _fingerprint(normalized):
+    return tuple(sorted((key, tuple(sorted(value)) if isinstance(value, frozenset) else value)
+                        for key, value in normalized.items()))
+
+
+def compile_rules(rules=None):
+    """
+    rules 可以是规则字典 (两种键名都可以) 或已经编译好的 mahjong_ruleset。
+    内容相同的规则返回同一个实例。
+    """
+    if isinstance(rules, mahjong_ruleset):
+        return rules
+    normalized = normalize_rules(rules or {})
+    fingerprint = _fingerprint(normalized)
+    ruleset = _rulesets.get(fingerprint)
+    if ruleset is None:
+        ruleset = _rulesets[fingerprint] = mahjong_ruleset(normalized, fingerprint)
+    return ruleset
@@ -0,0 +1,204 @@
+"""
+向听数 (离听牌还差几张) 与有效牌。
+
+与 mahjong_hu 的花色表思路相同，但允许手里有用不上的牌：每门花色模式记录
+"用 k 个面子 (k = 0~MAX_MELDS)、有无将，最多能用上几张真牌"，面子可以是残缺的 (缺的位置由摸牌或金牌补)。
+字牌只成刻子，按同样的方式单独成组。整手牌把 n 个面子和一个将分配到四组，取能用上的真牌最多的分法：
+    还缺的张数 = 3n + 2 - 用上的真牌 - 金牌
+    向听数     = 还缺的张数 - 1    (0 为听牌，-1 为已经胡牌)
+
+表按模式惰性填充，同一模式只计算一次；有离线生成的表文件 (见 mahjong_tables) 时序数牌直接读文件。整手的结果按 mahjong_hu 的规范形式再缓存一层 LRU。
+"""
+
+from functools import lru_cache
+
+from mahjong_hu import canonical_key, hand_cache
+from mahjong_tables import shared_tables
+from mahjong_tiles import HONOR_START, NUM_KINDS, JOKER_CODE
+
+SUIT_SIZE = 9
+MAX_MELDS = 5  # 福州麻将 16 张 = 5 个面子 + 1 对将
+_WIDTH = (MAX_MELDS + 1) * 2
+_NEG = -99
+
+_cache = hand_cache()
+
+# (模式, 是否序数牌) -> 长度 _WIDTH 的元组，下标 k * 2 + p 为 k 个面子、p 个将最多用上的真牌数
+_fit_table = {}
+_tables = shared_tables()
+
+
+def _fit(pattern, suited):
+    key = (pattern, suited)
+    entry = _fit_table.get(key)
+    if entry is not None:
+        return entry
+    if suited and _tables is not None:
+        entry = _tables.fit(pattern)
+        if entry is not None:
+            _fit_table[key] = entry
+            return entry
+    counts = bytearray(pattern)
+    first = next((i for i, n in enumerate(counts) if n), None)
+    if first is None:
+        entry = (0,) * _WIDTH
+        _fit_table[key] = entry
+        return entry
+
+    best = [_NEG] * _WIDTH
+
+    def consider(used, removed, melds, pairs):
+        """用掉 removed 中的牌组成 melds 个面子、pairs 个将，其余交给子模式"""
+        for i in removed: counts[i] -= 1
+        sub = _fit(bytes(counts), suited)
+        for i in removed: counts[i] += 1
+        for k in range(melds, MAX_MELDS + 1):
+            for p in range(pairs, 2):
+                value = used + sub[(k - melds) * 2 + p - pairs]
+                if value > best[k * 2 + p]: best[k * 2 + p] = value
+
+    # 最小的这张牌：不用、放进刻子、放进将、或放进以它为最小真牌的顺子
+    consider(0, (first,), 0, 0)
+    n = counts[first]
+    for used in range(1, min(n, 3) + 1):
+        consider(used, (first,) * used, 1, 0)
+    for used in range(1, min(n, 2) + 1):
+        consider(used, (first,) * used, 0, 1)
+    if suited:
+        second, third = first + 1, first + 2
+        if second < SUIT_SIZE and counts[second]:
+            consider(2, (first, second), 1, 0)
+            if third < SUIT_SIZE and counts[third]:
+                consider(3, (first, second, third), 1, 0)
+        if third < SUIT_SIZE and counts[third]:
+            consider(2, (first, third), 1, 0)
+
+    entry = tuple(best)
+    _fit_table[key] = entry
+    return entry
+
+
+def group_fits(counts):
+    """34 槽计数向量 -> 三门序数牌和字牌各自的用牌表"""
+    key = bytes(counts)
+    fits = [_fit(key[g * SUIT_SIZE:(g + 1) * SUIT_SIZE], True) for g in range(3)]
+    fits.append(_fit(bytes(sorted(key[HONOR_START:NUM_KINDS], reverse=True)), False))
+    return fits
+
+
+def combine_fits(fits, melds):
+    """把 melds 个面子和一个将分到各组，返回最多能用上的真牌数 (对面子数做 max-plus 背包)"""
+    return _combine(*fits, min(melds, MAX_MELDS))
+
+
+@lru_cache(maxsize=1 << 16)
+def _combine(*args):
+    """用牌表都是 _fit_table 里的同一批元组，同样的四组组合反复出现 (模拟、打牌评估)，结果缓存"""
+    *fits, melds = args
+    no_pair = [0] + [_NEG] * melds    # no_pair[k]: 前几组共 k 个面子、无将
+    with_pair = [_NEG] * (melds + 1)  # with_pair[k]: 前几组共 k 个面子、含将
+    for fit in fits:
+        f0 = fit[0::2]
+        f1 = fit[1::2]
+        new0 = [_NEG] * (melds + 1)
+        new1 = [_NEG] * (melds + 1)
+        for k in range(melds + 1):
+            a0 = no_pair[k]
+            a1 = with_pair[k]
+            for j in range(melds - k + 1):
+                v = a0 + f0[j]
+                if v > new0[k + j]: new0[k + j] = v
+                v = max(a1 + f0[j], a0 + f1[j])
+                if v > new1[k + j]: new1[k + j] = v
+        no_pair, with_pair = new0, new1
+    return with_pair[melds]
+
+
+def _pairs_shanten(counts, joker_count, hand_size):
+    """对子胡的向听数，目标为 hand_size 向上取偶后的对子数"""
+    target = (hand_size + 1) // 2
+    full = sum(c // 2 for c in counts)
+    singles = sum(c & 1 for c in counts)
+    pairs = min(full, target)
+    used = 2 * pairs + min(singles + 2 * (full - pairs), target - pairs)
+    return max(2 * target - used - joker_count, 0) - 1
+
+
+def shanten(counts, joker_count=0, allow_all_pairs=False):
+    """
+    向听数：0 为听牌，-1 为已经胡牌。手牌张数 (真牌 + 金牌) 应为 3n+1 或 3n+2，
+    n 由张数决定，已经吃碰杠的面子不在 counts 里。
+    """
+    cache_key = canonical_key(counts, joker_count, ('shanten', bool(allow_all_pairs)))
+    result = _cache.get(cache_key)
+    if result is not None:
+        return result
+    hand_size = sum(counts) + joker_count
+    melds = hand_size // 3
+    used = combine_fits(group_fits(counts), melds)
+    result = max(3 * melds + 2 - used - joker_count, 0) - 1
+    if allow_all_pairs and hand_size >= 13:
+        result = min(result, _pairs_shanten(counts, joker_count, hand_size))
+    _cache.put(cache_key, result)
+    return result
+
+
+def discard_shanten(counts, joker_count=0, allow_all_pairs=False):
+    """
+    3n+2 张的手牌，打出每种牌后的向听数 {编码: 向听数}。
+    打一张牌只改变它所在那一组的用牌表，其余三组沿用，每种牌只合并一次。
+    """
+    key = bytes(counts)
+    hand_size = sum(key) + joker_count - 1
+    melds = hand_size // 3
+    fits = group_fits(key)
+    buf = bytearray(key)
+    result = {}
+    for code in range(NUM_KINDS):
+        if not buf[code]: continue
+        group = min(code // SUIT_SIZE, 3)
+        buf[code] -= 1
+        replaced = list(fits)
+        if group < 3:
+            start = group * SUIT_SIZE
+            replaced[group] = _fit(bytes(buf[start:start + SUIT_SIZE]), True)
+        else:
+            replaced[group] = _fit(bytes(sorted(buf[HONOR_START:NUM_KINDS], reverse=True)), False)
+        value = max(3 * melds + 2 - combine_fits(replaced, melds) - joker_count, 0) - 1
+        if allow_all_pairs and hand_size >= 13:
+            value = min(value, _pairs_shanten(buf, joker_count, hand_size))
+        buf[code] += 1
+        result[code] = value
+    return result
+
+
+def useful_tiles(counts, joker_count=0, allow_all_pairs=False, current=None):
+    """3n+1 张的手牌再进哪些牌能减少向听数 (牌编码，金牌为 JOKER_CODE)"""
+    if current is None:
+        current = shanten(counts, joker_count, allow_all_pairs)
+    buf = bytearray(counts)
+    useful = []
+    for code in range(NUM_KINDS):
+        if buf[code] >= 4: continue
+        buf[code] += 1
+        if shanten(buf, joker_count, allow_all_pairs) < current:
+            useful.append(code)
+        buf[code] -= 1
+    if shanten(buf, joker_count + 1, allow_all_pairs) < current:
+        useful.append(JOKER_CODE)
+    return useful
+
+
+def isolation(counts, code):
+    """
+    打出 code 之后 (counts 为打完后的手牌)，这张牌与手里剩下的牌的关联度：同种牌每张 3 分，
+    同花色相邻的牌 2 分、隔一张的 1 分。向听数相同时先打关联度低的；金牌不该打，给最大值。
+    """
+    if code >= NUM_KINDS: return 99
+    score = counts[code] * 3
+    if code < HONOR_START:
+        rank = code % SUIT_SIZE
+        for d in (-2, -1, 1, 2):
+            if 0 <= rank + d < SUIT_SIZE and counts[code + d]:
+                score += 3 - abs(d)
+    return score
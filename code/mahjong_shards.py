@@ -0,0 +1,215 @@
+"""
+多进程部署：按房间 id 一致性哈希把房间分给各个工作进程，进程之间通过消息代理转发。
+
+    python server.py --workers 4             启动本地代理和 4 个工作进程 (端口 5000~5003)
+
+每个工作进程是一个完整的 eventlet 服务器，只保存自己的房间和连到自己的用户：
+    - 建房时生成归本进程所有的房间 id；加入别的进程的房间时，服务器回复该进程的地址，客户端改连过去再加入
+    - 发给大厅或别的进程上的用户的消息经 socket.io 的客户端管理器转发 (client_manager)
+    - 房间列表的摘要在 'rooms' 频道上广播，每个进程都有一份全部房间的目录，用于分页查询
+
+client_manager(url) 按地址创建管理器，目前只有 unix:///路径 (这里的本地代理，单机多核部署和测试用)。
+换成 Redis 等消息队列时，需要同时提供 python-socketio 的管理器 (RedisManager 等) 和房间目录的发布订阅。
+
+本地代理是一个 UNIX socket 上的广播站：每帧为 4 字节长度 + pickle 的 (频道, 数据)，频道为 None 的帧是订阅 (数据为频道列表)。
+收到的每一帧原样转发给订阅了该频道的所有连接 (包括发送者，socket.io 的管理器依赖这一点)，只发布不订阅的连接收不到任何帧。
+每个连接有自己的发送队列和写线程，多个发布者同时转发时帧不会交错，慢的订阅者也不会拖住其他发布者。
+只用于本机互相信任的进程。
+"""
+
+import bisect
+import hashlib
+import os
+import pickle
+import queue
+import socket
+import socketserver
+import struct
+import threading
+
+REPLICAS = 160
+_FRAME = struct.Struct('>I')
+
+
+class hash_ring:
+    """一致性哈希环：每个节点放 replicas 个虚拟点，增删一个节点只影响约 1/n 的房间"""
+
+    def __init__(self, nodes=(), replicas=REPLICAS):
+        self.replicas = replicas
+        self._points = []
+        self._nodes = []
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.blake2b(str(key).encode('utf-8'), digest_size=8).digest(), 'big')
+
+    def add(self, node):
+        for i in range(self.replicas):
+            point = self._hash(f"{node}#{i}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._nodes.insert(index, node)
+
+    def remove(self, node):
+        keep = [(p, n) for p, n in zip(self._points, self._nodes) if n != node]
+        self._points = [p for p, _ in keep]
+        self._nodes = [n for _, n in keep]
+
+    def owner(self, key):
+        """key (房间 id) 所属的节点"""
+        if not self._points: raise LookupError("哈希环上没有节点")
+        index = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._nodes[index]
+
+    def __len__(self):
+        return len(set(self._nodes))
+
+
+# ---------- 本地消息代理 ----------
+
+def _recv_exact(sock, n):
+    data = b''
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk: return None
+        data += chunk
+    return data
+
+
+def _recv_frame(sock):
+    header = _recv_exact(sock, _FRAME.size)
+    if header is None: return None
+    return _recv_exact(sock, _FRAME.unpack(header)[0])
+
+
+def _write_frames(sock, frames):
+    """一个连接的写线程：帧只在这里整帧写出；收到 None 或连接断开时结束"""
+    while True:
+        frame = frames.get()
+        if frame is None: return
+        try:
+            sock.sendall(frame)
+        except OSError:
+            return  # 断开的连接由它自己的处理线程移除
+
+
+class _relay(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        frames = None
+        try:
+            while True:
+                payload = _recv_frame(self.request)
+                if payload is None: break
+                channel, data = pickle.loads(payload)
+                if channel is None:
+                    if frames is None:
+                        frames = queue.SimpleQueue()
+                        threading.Thread(target=_write_frames, args=(self.request, frames), daemon=True).start()
+                    with server.lock:
+                        server.subscribers[self.request] = (frozenset(data), frames)
+                    continue
+                frame = _FRAME.pack(len(payload)) + payload
+                with server.lock:
+                    targets = [q for channels, q in server.subscribers.values() if channel in channels]
+                for q in targets:
+                    q.put(frame)
+        finally:
+            with server.lock:
+                server.subscribers.pop(self.request, None)
+            if frames is not None: frames.put(None)
+
+
+class broker(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """本地消息代理；serve_forever() 阻塞运行，start() 在后台线程里运行"""
+    daemon_threads = True
+
+    def __init__(self, path):
+        if os.path.exists(path): os.unlink(path)
+        self.lock = threading.Lock()
+        self.subscribers = {}  # 连接 -> (订阅的频道, 发送队列)
+        super().__init__(path, _relay)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class broker_client:
+    """连到本地代理的一个连接：publish() 发布，listen() 逐条返回订阅频道上的数据"""
+
+    def __init__(self, path):
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.lock = threading.Lock()
+        self.channels = frozenset()
+
+    def publish(self, channel, data):
+        payload = pickle.dumps((channel, data))
+        with self.lock:
+            self.sock.sendall(_FRAME.pack(len(payload)) + payload)
+
+    def subscribe(self, *channels):
+        """订阅之后发布的帧保证在订阅生效之后到达代理 (同一个连接按顺序处理)"""
+        self.channels = frozenset(channels)
+        self.publish(None, list(channels))
+
+    def listen(self, *channels):
+        """channels 为空时沿用 subscribe() 订阅的频道"""
+        if channels: self.subscribe(*channels)
+        while True:
+            payload = _recv_frame(self.sock)
+            if payload is None: return
+            channel, data = pickle.loads(payload)
+            if channel in self.channels:
+                yield data
+
+    def close(self):
+        self.sock.close()
+
+
+# ---------- socket.io 客户端管理器 ----------
+
+_manager_class = None
+
+
+def _broker_manager():
+    """python-socketio 的 PubSubManager 子类，走本地代理 (用到时才导入 socketio)"""
+    global _manager_class
+    if _manager_class is None:
+        import socketio
+
+        class broker_manager(socketio.PubSubManager):
+            name = 'mahjong-broker'
+
+            def __init__(self, path, channel='socketio', write_only=False, logger=None):
+                self.path = path
+                self._publisher = None
+                super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+            def _publish(self, data):
+                if self._publisher is None:
+                    self._publisher = broker_client(self.path)
+                self._publisher.publish(self.channel, pickle.dumps(data))
+
+            def _listen(self):
+                yield from broker_client(self.path).listen(self.channel)
+
+        _manager_class = broker_manager
+    return _manager_class
+
+
+def broker_path(url):
+    """unix:///路径 -> 路径，其他地址抛 ValueError"""
+    if not url.startswith('unix://'):
+        raise ValueError(f"不支持的消息代理地址: {url}")
+    return url[len('unix://'):]
+
+
+def client_manager(url, channel='socketio'):
+    """按消息代理地址创建 socket.io 的客户端管理器"""
+    return _broker_manager()(broker_path(url), channel=channel)
@@ -0,0 +1,227 @@
+"""
+无头自对弈模拟。
+
+每个座位由一个策略对象驱动 (random / greedy / 自定义)，关闭全部控制台输出，
+可以用进程池并行跑 M 局，每局有独立的种子，最后汇总各座位胜率、流局率、平均巡数和每秒局数。
+用来在上线前平衡房间规则 (金牌张数、三金倒等)。
+
+策略对象需要实现两个方法：
+    choose_discard(game, player, can_zimo) -> 手牌序号，或 'hu' 表示自摸
+    choose_claim(game, action, discarded_tile) -> 是否执行该吃/碰/杠/胡
+
+每个进程只建一个 mahjong_game，之后每局用 reset() 复位后复用 (玩家对象、牌墙缓冲区不再反复创建)。
+--rounds 大于 1 时每张桌按连庄 / 轮庄连续打若干局，下一局的种子由上一局的随机数生成器给出。
+
+命令行示例：
+    python mahjong_sim.py --games 10000 --processes 8 --policy greedy --rules '{"joker_count": 3}'
+    python mahjong_sim.py --games 1000 --rounds 16
+    python mahjong_sim.py --games 100000 --record outcomes   (结果写入列式存储，见 mahjong_outcomes)
+"""
+
+import argparse
+import json
+import time
+from collections import Counter
+from multiprocessing import Pool
+
+import mahjong_hu
+from mahjong_offline import FUZHOU_RULES, mahjong_game
+from mahjong_outcomes import outcome_recorder
+from mahjong_rules import compile_rules
+from mahjong_shanten import isolation
+from mahjong_tiles import TILE_INDEX, TILE_NAMES
+
+
+class random_policy:
+    """随机出牌；能胡就胡，其余操作一半概率接受"""
+
+    def choose_discard(self, game, player, can_zimo):
+        if can_zimo: return 'hu'
+        return game.rng.randrange(len(player.tiles))
+
+    def choose_claim(self, game, action, discarded_tile):
+        return action['type'] == 'hu' or game.rng.random() < 0.5
+
+
+def _best_discard(counts, joker_count, ruleset):
+    """
+    在 3n+2 张的计数向量上选一张打出：优先打完后听牌最多的，其次打关联度最低的。
+    返回 (编码, 听牌种数)。
+    """
+    three_jokers_win = ruleset.three_jokers_win
+    allow_all_pairs = ruleset.allow_all_pairs
+    best = None
+    for code, n in enumerate(counts):
+        if not n: continue
+        counts[code] -= 1
+        waits = mahjong_hu.waiting_tiles(counts, joker_count, three_jokers_win, allow_all_pairs)
+        key = (len(waits), -isolation(counts, code))
+        counts[code] += 1
+        if best is None or key > best[0]:
+            best = (key, code)
+    if best is None:
+        return None, 0
+    return best[1], best[0][0]
+
+
+class greedy_policy:
+    """贪心：能胡就胡；出牌选打完听牌最多、关联度最低的牌；吃碰杠只在做完后能听牌时才接受"""
+
+    def choose_discard(self, game, player, can_zimo):
+        if can_zimo: return 'hu'
+        code, _ = _best_discard(bytearray(player.hand.counts), player.hand.jokers, game.ruleset)
+        if code is None:  # 手里只剩金牌
+            return len(player.tiles) - 1
+        return player.tiles.index(TILE_NAMES[code])
+
+    def choose_claim(self, game, action, discarded_tile):
+        if action['type'] in ('hu', 'kong'):
+            return True  # 杠后补张，不改变手牌形状
+        player = game.players[action['player_index']]
+        counts = bytearray(player.hand.counts)
+        if action['type'] == 'chow':
+            for tile in action['chow_pair']: counts[TILE_INDEX[tile]] -= 1
+        else:
+            counts[TILE_INDEX[discarded_tile]] -= 2
+        _, waits = _best_discard(counts, player.hand.jokers, game.ruleset)
+        return waits > 0
+
+
+POLICIES = {'random': random_policy, 'greedy': greedy_policy}
+
+
+def _seats(policies):
+    return [POLICIES[p]() if isinstance(p, str) else p() for p in policies]
+
+
+def _play(game, policies, game_rules):
+    dealer = game.current_player_index
+    start = time.perf_counter()
+    result = game.start_game(game_rules=game_rules, policies=policies)
+    result['duration'] = time.perf_counter() - start
+    result['dealer'] = dealer
+    result['dealer_streak'] = game.dealer_streak
+    result['jokers'] = game.players[game.winner_index].hand.jokers if game.winner_index is not None else 0
+    result['seed'] = game.seed
+    return result
+
+
+def play_game(seed, policies=('greedy',) * 4, game_rules=None, dealer=0, game=None):
+    """
+    跑一局无头对局，返回结果字典 (winner / win_type / turns / wall_remaining / duration)。
+    传入 game 时按新比赛复位后复用该对象，结果与新建对局相同 (包括连庄次数)。
+    """
+    if game is None:
+        game = mahjong_game(seed=seed, verbose=False)
+        game.current_player_index = dealer
+    else:
+        game.reset(seed, dealer, new_match=True)
+    return _play(game, _seats(policies), game_rules)
+
+
+def play_match(seed, rounds, policies=('greedy',) * 4, game_rules=None, dealer=0, game=None):
+    """同一张桌连续打 rounds 局，庄家按上一局结果连庄或轮庄，返回每局的结果列表 (复用的 game 从新比赛开始)"""
+    seats = _seats(policies)
+    if game is None:
+        game = mahjong_game(seed=seed, verbose=False)
+        game.current_player_index = dealer
+    else:
+        game.reset(seed, dealer, new_match=True)
+    results = [_play(game, seats, game_rules)]
+    for _ in range(rounds - 1):
+        game.reset()
+        results.append(_play(game, seats, game_rules))
+    return results
+
+
+_worker_game = None  # 每个进程复用的对局对象
+
+
+def _game():
+    global _worker_game
+    if _worker_game is None:
+        _worker_game = mahjong_game(seed=0, verbose=False)
+    return _worker_game
+
+
+def _play_one(args):
+    return play_game(*args, game=_game())
+
+
+def _play_match_one(args):
+    return play_match(*args, game=_game())
+
+
+def run_games(games, policies=('greedy',) * 4, game_rules=None, processes=None, base_seed=0, chunksize=16, rounds=1,
+              record=None):
+    """
+    并行跑 games 局。第 i 局的种子为 base_seed + i，庄家按局轮换。
+    rounds 大于 1 时第 i 张桌以 base_seed + i 开局，连续打 rounds 局 (连庄 / 轮庄)，共 games * rounds 局。
+    processes=1 时在当前进程内顺序执行 (便于调试)。record 为结果存储目录时每局追加一条记录。返回汇总统计。
+    """
+    if rounds > 1:
+        worker = _play_match_one
+        tasks = [(base_seed + i, rounds, tuple(policies), game_rules, i % 4) for i in range(games)]
+    else:
+        worker = _play_one
+        tasks = [(base_seed + i, tuple(policies), game_rules, i % 4) for i in range(games)]
+    start = time.perf_counter()
+    if processes == 1:
+        results = [worker(task) for task in tasks]
+    else:
+        with Pool(processes) as pool:
+            results = pool.map(worker, tasks, chunksize=chunksize)
+    if rounds > 1:
+        results = [r for match in results for r in match]
+    elapsed = time.perf_counter() - start
+    if record is not None:
+        ruleset = compile_rules(FUZHOU_RULES if game_rules is None else game_rules)
+        with outcome_recorder(record) as recorder:
+            for r in results:
+                recorder.record(ruleset, r['winner'], r['win_type'], r['turns'], r['jokers'], r['wall_remaining'],
+                                r['duration'], r['dealer'])
+    return summarize(results, elapsed)
+
+
+def summarize(results, elapsed):
+    games = len(results)
+    seat_wins = Counter(r['winner'] for r in results if r['winner'] is not None)
+    dealer_wins = sum(1 for r in results if r['winner'] is not None and r['winner'] == r['dealer'])
+    win_types = Counter(r['win_type'] for r in results if r['winner'] is not None)
+    draws = sum(1 for r in results if r['winner'] is None)
+    return {
+        'games': games,
+        'seat_win_rate': [seat_wins[i] / games for i in range(4)] if games else [0.0] * 4,
+        'dealer_win_rate': dealer_wins / games if games else 0.0,
+        'draw_rate': draws / games if games else 0.0,
+        'win_types': dict(win_types),
+        'avg_turns': sum(r['turns'] for r in results) / games if games else 0.0,
+        'games_per_second': games / elapsed if elapsed > 0 else 0.0,
+        'elapsed': elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="福州麻将无头自对弈模拟")
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--processes', type=int, default=None, help="进程数，默认为 CPU 核数，1 表示单进程")
+    parser.add_argument('--policy', default='greedy', help="四个座位的策略，逗号分隔或一个名字通用: random / greedy")
+    parser.add_argument('--seed', type=int, default=0, help="第一局的种子")
+    parser.add_argument('--rounds', type=int, default=1, help="每张桌连续打几局 (连庄 / 轮庄)，1 表示每局独立")
+    parser.add_argument('--record', default=None, help="把每局结果追加到该目录的列式存储 (见 mahjong_outcomes)")
+    parser.add_argument('--rules', default='{}', help="覆盖默认福州规则的 JSON，例如 '{\"joker_count\": 3}'")
+    args = parser.parse_args()
+
+    policies = args.policy.split(',')
+    if len(policies) == 1: policies *= 4
+    game_rules = dict(FUZHOU_RULES)
+    game_rules.update(json.loads(args.rules))
+    compile_rules(game_rules)  # 先在主进程里校验，规则写错时立即报错
+
+    stats = run_games(args.games, policies, game_rules, processes=args.processes, base_seed=args.seed,
+                      rounds=args.rounds, record=args.record)
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+"""
+可撤销的紧凑对局状态，供机器人和出牌建议做搜索。
+
+mahjong_game / mahjong_players 的出牌、吃碰杠都是原地修改牌名列表，无法撤销，
+搜索时只能整份深拷贝。这里的 game_state 只保存整数：每家的计数向量和金牌数、
+明牌面子、弃牌堆、牌墙游标、轮到谁、每家的听牌位掩码和 64 位 Zobrist 哈希 (键与 mahjong_zobrist 相同)。
+
+着法编码为一个整数 (见 encode_move)。apply(move) 把撤销所需的旧值压入预先分配好的栈，
+undo() 弹栈还原，两者都是 O(1)；听牌掩码在出牌后重算，撤销时直接从栈里恢复。
+"""
+
+import mahjong_hu
+from mahjong_rules import compile_rules
+from mahjong_tiles import NUM_KINDS, JOKER_CODE, TILE_INDEX, tile_name
+from mahjong_zobrist import (SEATS, MELD_PONG, MELD_KONG, MELD_CHOW, HAND_KEYS, HAND_SIZE_KEYS, MELD_KEYS,
+                             DISCARD_KEYS, HEAD_KEYS, REMAIN_KEYS, SEAT_KEYS, meld_of, meld_slot)
+
+# 着法类型
+MOVE_DRAW = 0       # 当前玩家从牌墙头部摸牌
+MOVE_DRAW_BACK = 1  # 当前玩家杠后从牌墙尾部补张
+MOVE_DISCARD = 2    # 当前玩家打出 code
+MOVE_PONG = MELD_PONG  # seat 碰最后一张弃牌
+MOVE_KONG = MELD_KONG  # seat 杠最后一张弃牌
+MOVE_CHOW = MELD_CHOW  # seat 吃最后一张弃牌，code 为顺子最小的一张
+MOVE_HU = 6         # seat 胡牌 (自摸或点炮)
+MOVE_NAMES = ('draw', 'draw_back', 'discard', 'pong', 'kong', 'chow', 'hu')
+
+DEFAULT_STACK = 1024
+_STACK_WIDTH = 6  # 每步压栈: 着法, 旧座位, 旧待抢弃牌, 旧哈希, 旧公开哈希, 旧听牌掩码
+PENDING_KONG = -2
+
+
+def encode_move(kind, seat=0, code=0):
+    return kind | seat << 4 | code << 8
+
+
+def decode_move(move):
+    """-> (类型, 座位, 编码)"""
+    return move & 15, (move >> 4) & 15, move >> 8
+
+
+def describe_move(move):
+    kind, seat, code = decode_move(move)
+    tile = tile_name(code) if code <= JOKER_CODE else '-'
+    return f"{MOVE_NAMES[kind]}(seat={seat}, {tile})"
+
+
+def _mask(codes):
+    mask = 0
+    for code in codes: mask |= 1 << code
+    return mask
+
+
+class game_state:
+    """
+    counts[seat] 为计数向量 (金牌在 JOKER_CODE 槽)，melds[seat] 为面子编码列表 (类型 << 8 | 编码)，
+    discards 为全场按顺序的弃牌 (座位 << 8 | 编码)，discard_counts[seat] 为每家的弃牌数，wall / head / tail 为牌墙编码和游标 (与 mahjong_wall 相同)，
+    seat 为下一个行动的玩家，pending 为可以被吃碰杠胡的最后一张弃牌 (没有时为 -1，杠后等补张时为 PENDING_KONG)，
+    waits[seat] 为听牌位掩码 (第 i 位表示再进编码 i 的牌能胡)，winner 为赢家 (未结束为 -1)。
+    hash 覆盖全部状态；public_hash 只覆盖其他玩家也能看到的部分 (手牌只算张数)。
+    """
+    __slots__ = ('counts', 'sizes', 'melds', 'discards', 'discard_counts', 'wall', 'head', 'tail', 'seat', 'pending',
+                 'waits', 'winner', 'hash', 'public_hash', 'ruleset', '_stack', '_depth')
+
+    def __init__(self, wall_codes, head, tail, ruleset=None, stack_size=DEFAULT_STACK):
+        self.ruleset = compile_rules(ruleset)
+        self.counts = [bytearray(NUM_KINDS + 1) for _ in range(SEATS)]
+        self.sizes = [0] * SEATS
+        self.melds = [[] for _ in range(SEATS)]
+        self.discards = []
+        self.discard_counts = [0] * SEATS
+        self.wall = wall_codes
+        self.head = head
+        self.tail = tail
+        self.seat = 0
+        self.pending = -1
+        self.waits = [0] * SEATS
+        self.winner = -1
+        self._stack = [0] * (stack_size * _STACK_WIDTH)
+        self._depth = 0
+        self.hash, self.public_hash = self.compute_hashes()
+
+    @classmethod
+    def from_game(cls, game, stack_size=DEFAULT_STACK):
+        """从 mahjong_game 的当前局面构造，哈希与引擎的 game.zobrist 相同"""
+        state = cls(game.wall.codes, game.wall.head, game.wall.tail, game.ruleset, stack_size)
+        for seat, player in enumerate(game.players):
+            counts = state.counts[seat]
+            counts[:NUM_KINDS] = player.hand.counts
+            counts[JOKER_CODE] = player.hand.jokers
+            state.sizes[seat] = player.hand.size
+            for meld in player.locked_tiles:
+                kind, code = meld_of(TILE_INDEX[t] for t in meld)
+                state.melds[seat].append(kind << 8 | code)
+            state._update_waits(seat)
+            state.discards.extend(seat << 8 | TILE_INDEX.get(t, JOKER_CODE) for t in player.discarded)
+            state.discard_counts[seat] = len(player.discarded)
+        state.seat = game.current_player_index
+        state.winner = -1 if game.winner_index is None else game.winner_index
+        state.hash, state.public_hash = state.compute_hashes()
+        return state
+
+    # ---------- 哈希 ----------
+
+    def compute_hashes(self):
+        """从头计算两个哈希，用于校验增量更新"""
+        full = public = 0
+        for seat in range(SEATS):
+            for code, n in enumerate(self.counts[seat]):
+                full ^= HAND_KEYS[seat][code][n]
+            public ^= HAND_SIZE_KEYS[seat][self.sizes[seat]]
+            for i, meld in enumerate(self.melds[seat]):
+                public ^= MELD_KEYS[seat][i][meld_slot(meld >> 8, meld & 255)]
+        positions = [0] * SEATS
+        for entry in self.discards:
+            seat = entry >> 8
+            public ^= DISCARD_KEYS[seat][positions[seat]][entry & 255]
+            positions[seat] += 1
+        public ^= REMAIN_KEYS[self.tail - self.head] ^ SEAT_KEYS[self.seat]
+        full ^= HEAD_KEYS[self.head]
+        return full ^ public, public
+
+    def _change(self, seat, code, delta):
+        """手牌中 code 增减 delta 张，同时更新两个哈希"""
+        counts = self.counts[seat]
+        keys = HAND_KEYS[seat][code]
+        n = counts[code]
+        size = self.sizes[seat]
+        size_keys = HAND_SIZE_KEYS[seat]
+        public = size_keys[size] ^ size_keys[size + delta]
+        self.hash ^= keys[n] ^ keys[n + delta] ^ public
+        self.public_hash ^= public
+        counts[code] = n + delta
+        self.sizes[seat] = size + delta
+
+    def _public(self, key):
+        self.hash ^= key
+        self.public_hash ^= key
+
+    def _set_seat(self, seat):
+        self._public(SEAT_KEYS[self.seat] ^ SEAT_KEYS[seat])
+        self.seat = seat
+
+    def _add_meld(self, seat, kind, code):
+        melds = self.melds[seat]
+        self._public(MELD_KEYS[seat][len(melds)][meld_slot(kind, code)])
+        melds.append(kind << 8 | code)
+
+    def _pop_meld(self, seat):
+        melds = self.melds[seat]
+        meld = melds.pop()
+        self._public(MELD_KEYS[seat][len(melds)][meld_slot(meld >> 8, meld & 255)])
+
+    def _push_discard(self, seat, code):
+        index = self.discard_counts[seat]
+        self._public(DISCARD_KEYS[seat][index][code])
+        self.discard_counts[seat] = index + 1
+        self.discards.append(seat << 8 | code)
+
+    def _pop_discard(self):
+        entry = self.discards.pop()
+        seat = entry >> 8
+        index = self.discard_counts[seat] - 1
+        self.discard_counts[seat] = index
+        self._public(DISCARD_KEYS[seat][index][entry & 255])
+
+    # ---------- 听牌 ----------
+
+    def _update_waits(self, seat):
+        counts = self.counts[seat]
+        if self.sizes[seat] % 3 != 1:
+            self.waits[seat] = 0
+            return
+        self.waits[seat] = _mask(mahjong_hu.waiting_tiles(
+            counts[:NUM_KINDS], counts[JOKER_CODE],
+            three_jokers_win=self.ruleset.three_jokers_win,
+            allow_all_pairs=self.ruleset.allow_all_pairs,
+        ))
+
+    def _wins(self, seat):
+        """seat 手里 3n+2 张是否已经胡牌"""
+        counts = self.counts[seat]
+        return mahjong_hu.can_hu(counts[:NUM_KINDS], counts[JOKER_CODE],
+                                 self.ruleset.three_jokers_win, self.ruleset.allow_all_pairs)
+
+    # ---------- 着法 ----------
+
+    def legal_moves(self):
+        """当前局面的全部合法着法"""
+        if self.winner >= 0:
+            return []
+        seat = self.seat
+        if self.pending == PENDING_KONG:
+            return [encode_move(MOVE_DRAW_BACK, seat)] if self.head < self.tail else []
+        moves = []
+        if self.sizes[seat] % 3 == 2:
+            # 摸牌或吃碰后必须出牌，摸牌后还可以自摸
+            last = self._stack[(self._depth - 1) * _STACK_WIDTH] & 15 if self._depth else MOVE_DRAW
+            if last in (MOVE_DRAW, MOVE_DRAW_BACK) and self._wins(seat):
+                moves.append(encode_move(MOVE_HU, seat, NUM_KINDS + 1))
+            counts = self.counts[seat]
+            for code in range(NUM_KINDS + 1):
+                if counts[code]: moves.append(encode_move(MOVE_DISCARD, seat, code))
+            return moves
+        if self.head < self.tail:
+            moves.append(encode_move(MOVE_DRAW, seat))
+        code = self.pending
+        if code >= 0:
+            discarder = (seat - 1) % SEATS
+            for other in range(SEATS):
+                if other == discarder: continue
+                counts = self.counts[other]
+                if self.waits[other] >> code & 1:
+                    moves.append(encode_move(MOVE_HU, other, code))
+                if counts[code] >= 2:
+                    moves.append(encode_move(MOVE_PONG, other, code))
+                if counts[code] >= 3:
+                    moves.append(encode_move(MOVE_KONG, other, code))
+                if other == seat and code < 27:
+                    rank = code % 9
+                    for low in range(max(rank - 2, 0), min(rank, 6) + 1):
+                        start = code - rank + low
+                        if all(counts[c] for c in range(start, start + 3) if c != code):
+                            moves.append(encode_move(MOVE_CHOW, other, start))
+        return moves
+
+    def apply(self, move):
+        """执行一步着法 (不检查合法性，着法应来自 legal_moves)"""
+        kind, seat, code = move & 15, (move >> 4) & 15, move >> 8
+        stack = self._stack
+        base = self._depth * _STACK_WIDTH
+        actor = self.seat if kind in (MOVE_DRAW, MOVE_DRAW_BACK, MOVE_DISCARD) else seat
+        stack[base] = move
+        stack[base + 1] = self.seat
+        stack[base + 2] = self.pending
+        stack[base + 3] = self.hash
+        stack[base + 4] = self.public_hash
+        stack[base + 5] = self.waits[actor]
+        self._depth += 1
+
+        if kind == MOVE_DRAW:
+            remain = self.tail - self.head
+            self._public(REMAIN_KEYS[remain] ^ REMAIN_KEYS[remain - 1])
+            self.hash ^= HEAD_KEYS[self.head] ^ HEAD_KEYS[self.head + 1]
+            self._change(actor, self.wall[self.head], 1)
+            self.head += 1
+            self.pending = -1
+        elif kind == MOVE_DRAW_BACK:
+            remain = self.tail - self.head
+            self._public(REMAIN_KEYS[remain] ^ REMAIN_KEYS[remain - 1])
+            self.tail -= 1
+            self._change(actor, self.wall[self.tail], 1)
+            self.pending = -1
+        elif kind == MOVE_DISCARD:
+            self._change(actor, code, -1)
+            self._push_discard(actor, code)
+            self._update_waits(actor)
+            self.pending = code
+            self._set_seat((actor + 1) % SEATS)
+        elif kind == MOVE_HU:
+            if code <= NUM_KINDS:  # 点炮：把弃牌拿进手里
+                self._pop_discard()
+                self._change(actor, code, 1)
+            self.winner = actor
+            self.pending = -1
+        else:
+            # 吃碰杠：弃牌进面子，手里拿出其余的牌，轮到该玩家出牌
+            self._pop_discard()
+            discarded = self.pending
+            if kind == MOVE_CHOW:
+                for c in range(code, code + 3):
+                    if c != discarded: self._change(actor, c, -1)
+            else:
+                self._change(actor, code, -(3 if kind == MOVE_KONG else 2))
+            self._add_meld(actor, kind, code)
+            self.waits[actor] = 0
+            self.pending = PENDING_KONG if kind == MOVE_KONG else -1
+            self._set_seat(actor)
+
+    def undo(self):
+        """撤销最后一步着法"""
+        self._depth -= 1
+        base = self._depth * _STACK_WIDTH
+        stack = self._stack
+        move = stack[base]
+        kind, seat, code = move & 15, (move >> 4) & 15, move >> 8
+        prev_seat = stack[base + 1]
+        actor = prev_seat if kind in (MOVE_DRAW, MOVE_DRAW_BACK, MOVE_DISCARD) else seat
+
+        if kind == MOVE_DRAW:
+            self.head -= 1
+            self._change(actor, self.wall[self.head], -1)
+        elif kind == MOVE_DRAW_BACK:
+            self._change(actor, self.wall[self.tail], -1)
+            self.tail += 1
+        elif kind == MOVE_DISCARD:
+            self.discards.pop()
+            self.discard_counts[actor] -= 1
+            self._change(actor, code, 1)
+        elif kind == MOVE_HU:
+            if code <= NUM_KINDS:
+                self._change(actor, code, -1)
+                self._restore_discard(prev_seat, code)
+            self.winner = -1
+        else:
+            self.melds[actor].pop()
+            discarded = stack[base + 2]
+            if kind == MOVE_CHOW:
+                for c in range(code, code + 3):
+                    if c != discarded: self._change(actor, c, 1)
+            else:
+                self._change(actor, code, 3 if kind == MOVE_KONG else 2)
+            self._restore_discard(prev_seat, discarded)
+
+        self.seat = prev_seat
+        self.pending = stack[base + 2]
+        self.hash = stack[base + 3]
+        self.public_hash = stack[base + 4]
+        self.waits[actor] = stack[base + 5]
+
+    def _restore_discard(self, prev_seat, code):
+        """撤销吃碰杠胡时把弃牌放回，出牌的是拿牌前轮到的玩家的上家"""
+        discarder = (prev_seat - 1) % SEATS
+        self.discards.append(discarder << 8 | code)
+        self.discard_counts[discarder] += 1
+
+    @property
+    def depth(self):
+        return self._depth
@@ -0,0 +1,150 @@
+"""
+带序号的增量状态同步。
+
+服务器每次状态变化不再下发整份 getgamestate() 快照，而是和上次发出的状态比较，只发补丁：
+
+    关键帧  {'channel', 'seq', 'state'}             加入、开局或客户端请求重新同步时发送完整状态
+    补丁    {'channel', 'seq', 'ops'}               之后每次只发变化
+
+补丁是操作列表，每个操作为一个短列表，path 为从状态根开始的键 / 下标列表：
+
+    ['s', path, value]   设置 (例如 ['s', ['wall_count'], 81])
+    ['p', path, items]   列表末尾追加 (例如 ['p', ['players', 2, 'discarded'], ['5t']])
+    ['t', path, n]       列表截断为 n 项 (被吃碰杠走的弃牌、重排过的手牌)
+    ['d', path]          删除键
+
+弃牌堆只追加，所以每回合的补丁大小与对局进行了多久无关。
+seq 每帧加一；客户端 (state_mirror) 发现序号不连续或没有基准状态时返回 False，应请求关键帧。
+帧里还可以带不属于状态本身的 'report' (本次的播报) 和 'state_hash' (见 mahjong_zobrist)。
+"""
+
+
+def _copy(value):
+    """只含 dict / list / 标量的状态深拷贝 (比 copy.deepcopy 快，元组转成列表与 JSON 一致)"""
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_copy(v) for v in value]
+    return value
+
+
+def diff(old, new, path=()):
+    """old -> new 的补丁操作列表"""
+    if isinstance(new, tuple): new = list(new)
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key, value in new.items():
+            if key in old:
+                ops.extend(diff(old[key], value, path + (key,)))
+            else:
+                ops.append(['s', list(path + (key,)), _copy(value)])
+        for key in old:
+            if key not in new:
+                ops.append(['d', list(path + (key,))])
+        return ops
+    if isinstance(old, list) and isinstance(new, list):
+        if len(old) == len(new) and old and all(isinstance(v, dict) for v in new):
+            # 等长的字典列表 (各家玩家) 逐项比较
+            ops = []
+            for i, (a, b) in enumerate(zip(old, new)):
+                ops.extend(diff(a, b, path + (i,)))
+            return ops
+        if old == new:
+            return []
+        # 公共前缀不变，截掉其余部分再追加新的尾部
+        prefix = 0
+        limit = min(len(old), len(new))
+        if new[:len(old)] == old:
+            prefix = len(old)
+        else:
+            while prefix < limit and old[prefix] == new[prefix]:
+                prefix += 1
+        ops = []
+        if prefix < len(old):
+            ops.append(['t', list(path), prefix])
+        if prefix < len(new):
+            ops.append(['p', list(path), _copy(new[prefix:])])
+        return ops
+    if old == new and type(old) is type(new):
+        return []
+    return [['s', list(path), _copy(new)]]
+
+
+def apply_ops(state, ops):
+    """把补丁应用到状态上 (原地修改)，返回新的根 (根本身被整体替换时)"""
+    for op in ops:
+        kind, path = op[0], op[1]
+        if kind in ('p', 't'):
+            target = state
+            for key in path: target = target[key]
+            if kind == 'p': target.extend(_copy(op[2]))
+            else: del target[op[2]:]
+            continue
+        if not path:
+            if kind == 's': state = _copy(op[2])
+            continue
+        target = state
+        for key in path[:-1]: target = target[key]
+        key = path[-1]
+        if kind == 's':
+            target[key] = _copy(op[2])
+        elif kind == 'd':
+            target.pop(key, None)
+    return state
+
+
+class state_channel:
+    """服务器端的一路状态流 (公开状态或某个座位的私有状态)：记住最后发出的状态和序号"""
+    __slots__ = ('name', 'seq', 'state')
+
+    def __init__(self, name):
+        self.name = name
+        self.seq = 0
+        self.state = None
+
+    def reset(self):
+        """下一帧强制为关键帧 (开局)；序号继续递增，客户端始终看到单调的序号"""
+        self.state = None
+
+    def update(self, state):
+        """记录新状态，返回要发送的帧：没有基准状态时为关键帧，否则为补丁"""
+        self.seq += 1
+        if self.state is None:
+            self.state = _copy(state)
+            return self.keyframe()
+        ops = diff(self.state, state)
+        self.state = apply_ops(self.state, ops)
+        return {'channel': self.name, 'seq': self.seq, 'ops': ops}
+
+    def keyframe(self):
+        """当前状态的关键帧 (客户端请求重新同步)，序号不变"""
+        if self.state is None: return None
+        return {'channel': self.name, 'seq': self.seq, 'state': _copy(self.state)}
+
+
+class state_mirror:
+    """客户端的一路状态：接收关键帧和补丁"""
+    __slots__ = ('seq', 'state')
+
+    def __init__(self):
+        self.seq = None
+        self.state = None
+
+    def keyframe(self, frame):
+        self.seq = frame['seq']
+        self.state = _copy(frame['state'])
+
+    def patch(self, frame):
+        """应用补丁；序号不连续或还没有关键帧时不应用，返回 False (应请求关键帧)"""
+        if self.state is None or frame['seq'] != self.seq + 1:
+            return False
+        self.state = apply_ops(self.state, frame['ops'])
+        self.seq = frame['seq']
+        return True
+
+    def receive(self, frame):
+        """关键帧或补丁都可以交给这里，返回是否已经同步"""
+        if 'state' in frame:
+            self.keyframe(frame)
+            return True
+        return self.patch(frame)
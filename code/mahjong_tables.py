@@ -0,0 +1,216 @@
+"""
+离线生成的花色表文件，运行时用 mmap 映射。
+
+mahjong_shanten 的用牌表和 mahjong_hu 的胡牌代价表都按花色模式惰性填充，
+服务器重启或新开进程时要重新算一遍。这里把全部 5^9 种花色模式 (每种牌 0~4 张) 一次算好写成二进制文件：
+
+    文件头 16 字节: 魔数 b'MJTB' | 版本 (u16) | MAX_MELDS (u8) | 每条记录字节数 (u8) | 记录条数 (u32) | 保留 (u32)
+    记录按 5 进制编码排列: 编码 = sum(counts[i] * 5**i)
+    每条记录 14 字节: 用牌表 12 字节 (k 个面子、p 个将，下标 k * 2 + p) + 胡牌代价 (无将, 含将) 2 字节
+
+运行时 load() / shared_tables() 只映射文件，不读入内存，启动几乎不花时间，多个进程共享同一份物理页。
+文件不存在、版本或参数不符时返回 None，调用方退回到进程内惰性计算。
+
+生成文件 (需要 numpy，只在生成时用到)：
+    python mahjong_tables.py [--output mahjong_tables.bin]
+默认路径为本文件同目录下的 mahjong_tables.bin，可用环境变量 MAHJONG_TABLES 指定。
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import time
+
+TABLE_VERSION = 1
+MAGIC = b'MJTB'
+HEADER = struct.Struct('<4sHBBII')
+SUIT_SIZE = 9
+BASE = 5
+PATTERNS = BASE ** SUIT_SIZE
+MAX_MELDS = 5  # 与 mahjong_shanten.MAX_MELDS 相同
+FIT_WIDTH = (MAX_MELDS + 1) * 2
+RECORD_SIZE = FIT_WIDTH + 2
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mahjong_tables.bin')
+_POWERS = tuple(BASE ** i for i in range(SUIT_SIZE))
+
+
+class suit_tables:
+    """映射到内存的花色表，只读"""
+    __slots__ = ('path', '_file', '_map')
+
+    def __init__(self, path, file, mapped):
+        self.path = path
+        self._file = file
+        self._map = mapped
+
+    @staticmethod
+    def code(pattern):
+        """花色模式 (长度 9 的 bytes) -> 记录编码，有超过 4 张的牌时返回 None"""
+        code = 0
+        for c, power in zip(pattern, _POWERS):
+            if c >= BASE: return None
+            code += c * power
+        return code
+
+    def fit(self, pattern):
+        """mahjong_shanten 的用牌表，模式不在表中时返回 None"""
+        code = self.code(pattern)
+        if code is None: return None
+        offset = HEADER.size + code * RECORD_SIZE
+        return tuple(self._map[offset:offset + FIT_WIDTH])
+
+    def hu(self, pattern):
+        """mahjong_hu 的 (无将, 含将) 代价，模式不在表中时返回 None"""
+        code = self.code(pattern)
+        if code is None: return None
+        offset = HEADER.size + code * RECORD_SIZE + FIT_WIDTH
+        return self._map[offset], self._map[offset + 1]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+_shared = None
+_shared_loaded = False
+
+
+def shared_tables():
+    """进程内共用的表文件映射 (只尝试加载一次)，没有可用的表文件时为 None"""
+    global _shared, _shared_loaded
+    if not _shared_loaded:
+        _shared = load(os.environ.get('MAHJONG_TABLES', DEFAULT_PATH))
+        _shared_loaded = True
+    return _shared
+
+
+def load(path=DEFAULT_PATH):
+    """映射表文件；文件不存在、损坏或与当前版本不符时返回 None"""
+    try:
+        file = open(path, 'rb')
+    except OSError:
+        return None
+    try:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        file.close()
+        return None
+    if len(mapped) >= HEADER.size:
+        magic, version, max_melds, record_size, count, _ = HEADER.unpack_from(mapped, 0)
+        if (magic == MAGIC and version == TABLE_VERSION and max_melds == MAX_MELDS and record_size == RECORD_SIZE
+                and count == PATTERNS and len(mapped) == HEADER.size + PATTERNS * RECORD_SIZE):
+            return suit_tables(path, file, mapped)
+    mapped.close()
+    file.close()
+    return None
+
+
+# ---------- 生成 (需要 numpy) ----------
+
+def build():
+    """
+    按总张数分层计算全部花色模式：拆掉几张牌后的子模式总张数更少，已经在前面的层里算好，
+    同一层内可以整体做数组运算。返回 (PATTERNS, RECORD_SIZE) 的 uint8 数组。
+    """
+    import numpy as np
+
+    neg = -99
+    powers = np.array(_POWERS, dtype=np.int64)
+    codes = np.arange(PATTERNS, dtype=np.int64)
+    digits = ((codes[:, None] // powers) % BASE).astype(np.int8)
+    totals = digits.sum(axis=1)
+    fit = np.full((PATTERNS, MAX_MELDS + 1, 2), neg, dtype=np.int16)
+    melds_cost = np.zeros(PATTERNS, dtype=np.int16)  # 全部拆成面子的代价
+    pair_cost = np.zeros(PATTERNS, dtype=np.int16)   # 面子 + 将的代价
+    fit[0] = 0
+    pair_cost[0] = 2
+
+    for total in range(1, int(totals.max()) + 1):
+        layer = codes[totals == total]
+        d = digits[layer].astype(np.int64)
+        rows = np.arange(len(layer))
+        first = (d > 0).argmax(axis=1)
+        n = d[rows, first]
+        p_first = powers[first]
+        has_second = (first + 1 < SUIT_SIZE) & (d[rows, np.minimum(first + 1, SUIT_SIZE - 1)] > 0)
+        has_third = (first + 2 < SUIT_SIZE) & (d[rows, np.minimum(first + 2, SUIT_SIZE - 1)] > 0)
+        p_second = powers[np.minimum(first + 1, SUIT_SIZE - 1)]
+        p_third = powers[np.minimum(first + 2, SUIT_SIZE - 1)]
+
+        # 用牌表
+        best = np.full((len(layer), MAX_MELDS + 1, 2), neg, dtype=np.int16)
+
+        def consider(valid, sub, used, melds, pairs):
+            sub_fit = fit[np.where(valid, sub, 0)]
+            value = np.full_like(best, neg)
+            value[:, melds:, pairs:] = used + sub_fit[:, :MAX_MELDS + 1 - melds, :2 - pairs]
+            value[~valid] = neg
+            np.maximum(best, value, out=best)
+
+        always = np.ones(len(layer), dtype=bool)
+        consider(always, layer - p_first, 0, 0, 0)
+        for used in (1, 2, 3):
+            consider(n >= used, layer - used * p_first, used, 1, 0)
+        for used in (1, 2):
+            consider(n >= used, layer - used * p_first, used, 0, 1)
+        consider(has_second, layer - p_first - p_second, 2, 1, 0)
+        consider(has_second & has_third, layer - p_first - p_second - p_third, 3, 1, 0)
+        consider(has_third, layer - p_first - p_third, 2, 1, 0)
+        fit[layer] = best
+
+        # 胡牌代价 (与 mahjong_hu._suit_entry 相同的分支)
+        inf = 99
+        cost = np.full(len(layer), inf, dtype=np.int16)
+        for used in (1, 2, 3):
+            ok = n >= used
+            sub = melds_cost[np.where(ok, layer - used * p_first, 0)] + 3 - used
+            cost = np.where(ok, np.minimum(cost, sub), cost)
+        sub = melds_cost[np.where(has_second, layer - p_first - p_second, 0)] + 1
+        cost = np.where(has_second, np.minimum(cost, sub), cost)
+        ok = has_second & has_third
+        sub = melds_cost[np.where(ok, layer - p_first - p_second - p_third, 0)]
+        cost = np.where(ok, np.minimum(cost, sub), cost)
+        sub = melds_cost[np.where(has_third, layer - p_first - p_third, 0)] + 1
+        cost = np.where(has_third, np.minimum(cost, sub), cost)
+        melds_cost[layer] = cost
+
+        with_pair = cost + 2
+        for i in range(SUIT_SIZE):
+            ok = d[:, i] >= 1
+            sub = melds_cost[np.where(ok, layer - powers[i], 0)] + 1
+            with_pair = np.where(ok, np.minimum(with_pair, sub), with_pair)
+            ok = d[:, i] >= 2
+            sub = melds_cost[np.where(ok, layer - 2 * powers[i], 0)]
+            with_pair = np.where(ok, np.minimum(with_pair, sub), with_pair)
+        pair_cost[layer] = with_pair
+
+    records = np.empty((PATTERNS, RECORD_SIZE), dtype=np.uint8)
+    records[:, :FIT_WIDTH] = fit.reshape(PATTERNS, FIT_WIDTH)
+    records[:, FIT_WIDTH] = melds_cost
+    records[:, FIT_WIDTH + 1] = pair_cost
+    return records
+
+
+def generate(path=DEFAULT_PATH):
+    """生成表文件；先写临时文件再改名，正在映射旧文件的进程不受影响"""
+    records = build()
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, TABLE_VERSION, MAX_MELDS, RECORD_SIZE, PATTERNS, 0))
+        f.write(records.tobytes())
+    os.replace(tmp, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成花色用牌表和胡牌代价表文件")
+    parser.add_argument('--output', default=DEFAULT_PATH)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    path = generate(args.output)
+    print(f"已生成 {path} ({os.path.getsize(path) / 1e6:.1f} MB)，耗时 {time.perf_counter() - start:.1f} 秒")
+
+
+if __name__ == '__main__':
+    main()
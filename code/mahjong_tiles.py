@@ -0,0 +1,273 @@
+"""
+牌的整数编码与计数向量手牌。
+
+34 种牌按 筒(o) 条(t) 万(w) 字牌 的顺序编码为 0~33，金牌 (joker) 不占槽位，
+单独计数。牌名只在输入输出时才与编码互相转换，判断吃碰杠胡都只做整数运算。
+"""
+
+import random
+from bisect import bisect_right
+from types import MappingProxyType
+
+TILE_NAMES = (
+    '1o', '2o', '3o', '4o', '5o', '6o', '7o', '8o', '9o',
+    '1t', '2t', '3t', '4t', '5t', '6t', '7t', '8t', '9t',
+    '1w', '2w', '3w', '4w', '5w', '6w', '7w', '8w', '9w',
+    'e', 's', 'w', 'n', 'b', 'f', 'z',
+)
+TILE_INDEX = {name: i for i, name in enumerate(TILE_NAMES)}
+NUM_KINDS = 34
+HONOR_START = 27
+JOKER = 'joker'
+JOKER_CODE = NUM_KINDS  # 金牌不占计数槽位，只在需要统一编码的地方 (听牌集合等) 使用
+
+
+def tile_code(tile):
+    """牌名 -> 编码，金牌返回 JOKER_CODE，未知牌返回 None"""
+    if tile == JOKER: return JOKER_CODE
+    return TILE_INDEX.get(tile)
+
+
+def tile_name(code):
+    return JOKER if code == JOKER_CODE else TILE_NAMES[code]
+
+
+def is_suited(code):
+    return code < HONOR_START
+
+
+class tile_index:
+    """
+    由一套牌序定义 (牌名 -> 牌序数值，如 mahjong_game.tile_definitions) 构建的只读索引。
+    同一门的相邻牌数值相差 1，不同门、字牌之间至少隔一个数，所以相邻关系只看数值。
+    """
+    __slots__ = ('value_of', 'name_of', 'prev_tile', 'next_tile', 'chow_pairs', 'chow_codes')
+
+    def __init__(self, rules_def):
+        value_of = {name: value for name, value in rules_def.items() if name != JOKER}
+        name_of = {value: name for name, value in value_of.items()}
+        prev_tile, next_tile, chow_pairs = {}, {}, {}
+        for name, value in value_of.items():
+            prev_tile[name] = name_of.get(value - 1)
+            next_tile[name] = name_of.get(value + 1)
+            pairs = []
+            # (tile-2, tile-1) + tile, (tile-1, tile+1) + tile, tile + (tile+1, tile+2)
+            for v1, v2 in ((value - 2, value - 1), (value - 1, value + 1), (value + 1, value + 2)):
+                if v1 in name_of and v2 in name_of:
+                    pairs.append((name_of[v1], name_of[v2]))
+            chow_pairs[name] = tuple(pairs)
+        # 计数向量用的编码版吃牌组合，只收录 34 种标准牌
+        chow_codes = [()] * NUM_KINDS
+        for name, pairs in chow_pairs.items():
+            code = TILE_INDEX.get(name)
+            if code is None: continue
+            chow_codes[code] = tuple((TILE_INDEX[a], TILE_INDEX[b]) for a, b in pairs
+                                     if a in TILE_INDEX and b in TILE_INDEX)
+        self.value_of = MappingProxyType(value_of)
+        self.name_of = MappingProxyType(name_of)
+        self.prev_tile = MappingProxyType(prev_tile)
+        self.next_tile = MappingProxyType(next_tile)
+        self.chow_pairs = MappingProxyType(chow_pairs)
+        self.chow_codes = tuple(chow_codes)
+
+    def __setattr__(self, key, value):
+        if hasattr(self, key): raise AttributeError("tile_index 是只读的")
+        object.__setattr__(self, key, value)
+
+
+_tile_indexes = {}
+
+
+def get_tile_index(rules_def):
+    """同一套牌序定义只构建一次索引"""
+    key = frozenset(rules_def.items())
+    index = _tile_indexes.get(key)
+    if index is None:
+        index = _tile_indexes[key] = tile_index(rules_def)
+    return index
+
+
+def insort_tile(tiles, tile, rules_def):
+    """把 tile 按牌序二分插入已经有序的牌名列表 tiles，返回插入位置"""
+    key = rules_def.get(tile, -1)
+    i = bisect_right(tiles, key, key=lambda t: rules_def.get(t, -1))
+    tiles.insert(i, tile)
+    return i
+
+
+class claim_index:
+    """
+    一个玩家对别人打出的牌的触发集合：能碰、能杠、能吃 (作为下家) 的牌编码。
+    手牌每变动一张只更新这张牌及其前后两张的状态，出牌时只需做集合成员判断。
+    """
+    __slots__ = ('pong', 'kong', 'chow', '_chow_codes')
+
+    def __init__(self, chow_codes):
+        self._chow_codes = chow_codes
+        self.pong = set()
+        self.kong = set()
+        self.chow = set()
+
+    def rebuild(self, hand):
+        self.pong.clear(); self.kong.clear(); self.chow.clear()
+        for code in range(NUM_KINDS):
+            self._update_count(hand, code)
+            self._update_chow(hand.counts, code)
+        self._update_count(hand, JOKER_CODE)
+
+    def update(self, hand, code):
+        """hand 中编码为 code 的牌张数变化后调用"""
+        self._update_count(hand, code)
+        if code == JOKER_CODE: return
+        counts = hand.counts
+        for t in range(max(code - 2, 0), min(code + 3, NUM_KINDS)):
+            self._update_chow(counts, t)
+
+    def _update_count(self, hand, code):
+        n = hand.jokers if code == JOKER_CODE else hand.counts[code]
+        if n >= 2: self.pong.add(code)
+        else: self.pong.discard(code)
+        if n >= 3: self.kong.add(code)
+        else: self.kong.discard(code)
+
+    def _update_chow(self, counts, code):
+        if any(counts[a] and counts[b] for a, b in self._chow_codes[code]):
+            self.chow.add(code)
+        else:
+            self.chow.discard(code)
+
+
+class mahjong_hand:
+    """
+    定长 34 槽计数向量 + 金牌计数。
+    counts[i] 为编码 i 的牌的张数，jokers 为金牌张数。
+    """
+    __slots__ = ('counts', 'jokers', 'size')
+
+    def __init__(self, tiles=()):
+        self.counts = bytearray(NUM_KINDS)
+        self.jokers = 0
+        self.size = 0
+        for tile in tiles:
+            self.add(tile)
+
+    def add(self, tile):
+        code = TILE_INDEX.get(tile)
+        if code is None:
+            if tile != JOKER: raise ValueError(f"未知的牌: {tile}")
+            self.jokers += 1
+        else:
+            self.counts[code] += 1
+        self.size += 1
+
+    def remove(self, tile, n=1):
+        code = TILE_INDEX.get(tile)
+        if code is None:
+            if tile != JOKER or self.jokers < n: raise ValueError(f"手牌中没有足够的 {tile}")
+            self.jokers -= n
+        else:
+            if self.counts[code] < n: raise ValueError(f"手牌中没有足够的 {tile}")
+            self.counts[code] -= n
+        self.size -= n
+
+    def count(self, tile):
+        code = TILE_INDEX.get(tile)
+        if code is None:
+            return self.jokers if tile == JOKER else 0
+        return self.counts[code]
+
+    def copy(self):
+        other = mahjong_hand()
+        other.counts[:] = self.counts
+        other.jokers = self.jokers
+        other.size = self.size
+        return other
+
+    def tiles(self):
+        """按编码顺序展开为牌名列表 (金牌在前)，仅用于显示和调试"""
+        result = [JOKER] * self.jokers
+        for code, n in enumerate(self.counts):
+            if n: result.extend([TILE_NAMES[code]] * n)
+        return result
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return f"mahjong_hand({self.tiles()})"
+
+
+class mahjong_wall:
+    """
+    预分配的牌墙：牌编码数组 + 头尾两个游标。
+    正常摸牌从头部取，杠后补张从尾部取，都是 O(1)，不移动数组。
+    """
+    __slots__ = ('codes', 'head', 'tail', 'golden_tile', 'seed', '_template')
+
+    def __init__(self, tile_names=TILE_NAMES, copies=4):
+        self._template = bytes(TILE_INDEX[name] for name in tile_names for _ in range(copies))
+        self.codes = bytearray(self._template)
+        self.head = 0
+        self.tail = len(self.codes)
+        self.golden_tile = None
+        self.seed = None
+
+    def setup(self, seed, has_joker=True, max_jokers=4):
+        """
+        一次完成洗牌、翻金牌、限制金牌数。seed 相同则牌墙完全相同。
+        翻金：从牌墙尾部数第 2~12 张 (再掷一次骰子) 作为金牌，所有同种牌都变成金牌，超出 max_jokers 的直接移出牌墙。
+        """
+        self.seed = seed
+        rng = random.Random(seed)
+        codes = self.codes
+        codes[:] = self._template  # 原地还原为固定顺序，同一种子得到同一牌墙，缓冲区可反复使用
+        rng.shuffle(codes)
+        self.head = 0
+        self.tail = len(codes)
+        self.golden_tile = None
+        if not has_joker:
+            return None
+
+        golden = codes[-rng.randint(2, 12)]
+        self.golden_tile = TILE_NAMES[golden]
+        jokers = 0
+        write = 0
+        for code in codes:
+            if code == golden:
+                if jokers >= max_jokers: continue
+                code = JOKER_CODE
+                jokers += 1
+            codes[write] = code
+            write += 1
+        self.tail = write  # 被移出的金牌留在 tail 之后，不再参与摸牌
+        return self.golden_tile
+
+    def draw(self):
+        """从头部摸一张，牌墙空时返回 None"""
+        if self.head >= self.tail: return None
+        code = self.codes[self.head]
+        self.head += 1
+        return tile_name(code)
+
+    def draw_back(self):
+        """杠后补张：从尾部摸一张"""
+        if self.head >= self.tail: return None
+        self.tail -= 1
+        return tile_name(self.codes[self.tail])
+
+    def deal(self, n):
+        """发牌：从头部连续取 n 张"""
+        n = min(n, self.tail - self.head)
+        tiles = [tile_name(code) for code in self.codes[self.head:self.head + n]]
+        self.head += n
+        return tiles
+
+    def count(self, tile):
+        return self.codes.count(tile_code(tile), self.head, self.tail)
+
+    def __len__(self):
+        return self.tail - self.head
+
+    def __iter__(self):
+        for i in range(self.head, self.tail):
+            yield tile_name(self.codes[i])
@@ -0,0 +1,136 @@
+"""
+服务器共用的分层时间轮 (出牌超时、响应窗口、开局倒计时)。
+
+原来每个定时都是一个 sleep 的绿色线程，不能取消，醒来后才检查是否还有效，房间越多空转的线程越多。
+这里所有房间的定时都挂在一个时间轮上，由一个后台任务每 tick 推进一次：
+
+    第 0 层 slots 个槽，每槽 tick 秒
+    第 L 层 slots 个槽，每槽 tick * slots**L 秒，轮到时把槽里的定时重新分配到更低的层
+
+登记、取消都是 O(1)，每 tick 只处理到期的槽，空闲定时的开销与定时总数无关。
+超过最高层跨度的延时按最大跨度处理 (默认 0.05 秒 * 64**4，约 9.7 天)。
+
+schedule() 返回可取消的句柄；句柄带调用方的序号 token (回合序号、响应窗口序号)，
+token 不为 None 时作为最后一个参数传给回调，回调据此判断定时是否已经过时。
+时间轮本身不依赖 eventlet，run() 接收 sleep 函数，服务器传入 sio.sleep。
+"""
+
+import logging
+import time
+
+TICK = 0.05
+SLOTS = 64
+LEVELS = 4
+
+
+class timer_handle:
+    """一个定时；cancel() 之后不会再触发"""
+    __slots__ = ('due', 'callback', 'args', 'token', 'cancelled', '_wheel')
+
+    def __init__(self, wheel, due, callback, args, token):
+        self._wheel = wheel
+        self.due = due
+        self.callback = callback
+        self.args = args
+        self.token = token
+        self.cancelled = False
+
+    def cancel(self):
+        """取消定时；已触发或已取消时什么也不做"""
+        if not self.cancelled:
+            self.cancelled = True
+            if self._wheel is not None:
+                self._wheel._count -= 1
+                self._wheel = None
+
+    @property
+    def active(self):
+        return not self.cancelled
+
+    def _fire(self):
+        self._wheel = None
+        self.cancelled = True  # 只触发一次，之后 cancel() 是空操作
+        if self.token is None:
+            self.callback(*self.args)
+        else:
+            self.callback(*self.args, self.token)
+
+
+class timer_wheel:
+    def __init__(self, tick=TICK, slots=SLOTS, levels=LEVELS, clock=time.monotonic):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.clock = clock
+        self.ticks = 0            # 已经处理过的 tick 数
+        self.start = clock()
+        self._wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self._spans = [slots ** (level + 1) for level in range(levels)]
+        self._count = 0           # 未触发、未取消的定时数
+
+    def __len__(self):
+        return self._count
+
+    def schedule(self, delay, callback, *args, token=None):
+        """delay 秒后调用 callback(*args[, token])，返回 timer_handle"""
+        now_tick = (self.clock() - self.start) / self.tick
+        due = max(int(now_tick + delay / self.tick + 0.999999), self.ticks + 1)
+        handle = timer_handle(self, due, callback, args, token)
+        self._count += 1
+        self._insert(handle)
+        return handle
+
+    def _insert(self, handle):
+        delta = handle.due - self.ticks
+        for level, span in enumerate(self._spans):
+            if delta < span or level == self.levels - 1:
+                unit = span // self.slots
+                due = min(handle.due, self.ticks + span - unit)  # 超出最高层跨度时放在最后一个槽
+                self._wheels[level][(due // unit) % self.slots].append(handle)
+                return
+
+    def _cascade(self, level):
+        """第 level 层的当前槽到期，把其中的定时重新分配到低层"""
+        unit = self._spans[level] // self.slots
+        slot = self._wheels[level][(self.ticks // unit) % self.slots]
+        handles = slot[:]
+        slot.clear()
+        for handle in handles:
+            if not handle.cancelled: self._insert(handle)
+
+    def advance(self, now=None):
+        """推进到 now (默认当前时间)，触发到期的定时，返回触发的个数"""
+        if now is None: now = self.clock()
+        target = int((now - self.start) / self.tick)
+        fired = 0
+        while self.ticks < target:
+            if not self._count:
+                self.ticks = target  # 没有定时时直接跳过
+                break
+            self.ticks += 1
+            for level in range(self.levels - 1, 0, -1):
+                if self.ticks % (self._spans[level] // self.slots) == 0:
+                    self._cascade(level)
+            slot = self._wheels[0][self.ticks % self.slots]
+            if not slot: continue
+            handles = slot[:]
+            slot.clear()
+            for handle in handles:
+                if handle.cancelled: continue
+                if handle.due > self.ticks:  # 被截断到最高层的长延时，还没到
+                    self._insert(handle)
+                    continue
+                self._count -= 1
+                fired += 1
+                try:
+                    handle._fire()
+                except Exception:
+                    logging.exception("定时回调出错")
+        return fired
+
+    def run(self, sleep):
+        """后台任务的主循环：按 tick 对齐睡眠并推进"""
+        while True:
+            elapsed = self.clock() - self.start
+            sleep(max(0.0, (int(elapsed / self.tick) + 1) * self.tick - elapsed))
+            self.advance()
@@ -0,0 +1,164 @@
+"""
+对局状态的 64 位 Zobrist 哈希。
+
+每个 (座位, 牌, 张数)、(座位, 第几个面子, 面子)、(座位, 第几张弃牌, 牌)、牌墙游标、剩余张数和轮到谁
+各对应一个固定的随机数，状态的哈希就是其中成立的那些键的异或。任何一步变动只需异或掉旧键、异或进新键，O(1) 更新。
+
+哈希分两部分：
+    public  只用其他玩家也看得到的内容：每家手牌张数、明牌面子、弃牌、牌墙剩余张数、轮到谁，
+            客户端可以用收到的公开状态 (public_state_hash) 算出同一个值，对比即可发现不同步
+    value   public 再加上每家手牌的计数和牌墙头部游标，用于缓存评估结果和搜索去重
+
+键由固定种子生成，服务器、客户端和模拟进程得到同一套键。mahjong_state.game_state 也使用这里的键。
+"""
+
+import random
+
+from mahjong_tiles import NUM_KINDS, JOKER_CODE, tile_code
+
+SEATS = 4
+MAX_MELDS = 6
+MAX_DISCARDS = 64   # 每家弃牌数上限
+MAX_WALL = 160
+MAX_COUNT = 8       # 计数键的上限 (金牌数不超过规则的 joker_count)
+MAX_HAND = 24
+
+# 面子类型 (与 mahjong_state 的着法类型编号一致)
+MELD_PONG = 3
+MELD_KONG = 4
+MELD_CHOW = 5
+_MELD_SLOTS = (MELD_CHOW + 1) * (NUM_KINDS + 1)
+
+_rng = random.Random(0x6D616A6F6E67)
+
+
+def _keys(n):
+    return [_rng.getrandbits(64) for _ in range(n)]
+
+
+HAND_KEYS = [[[0] + _keys(MAX_COUNT) for _ in range(NUM_KINDS + 1)] for _ in range(SEATS)]
+HAND_SIZE_KEYS = [_keys(MAX_HAND + 1) for _ in range(SEATS)]
+MELD_KEYS = [[_keys(_MELD_SLOTS) for _ in range(MAX_MELDS)] for _ in range(SEATS)]
+DISCARD_KEYS = [[_keys(NUM_KINDS + 1) for _ in range(MAX_DISCARDS)] for _ in range(SEATS)]
+HEAD_KEYS = _keys(MAX_WALL + 1)
+REMAIN_KEYS = _keys(MAX_WALL + 1)
+SEAT_KEYS = _keys(SEATS)
+
+
+def meld_slot(kind, code):
+    """面子在 MELD_KEYS[座位][第几个] 中的下标"""
+    return kind * (NUM_KINDS + 1) + code
+
+
+def meld_of(codes):
+    """一组明牌的编码 -> (面子类型, 最小的一张)"""
+    codes = sorted(codes)
+    if len(codes) == 4: return MELD_KONG, codes[0]
+    if codes[0] == codes[-1]: return MELD_PONG, codes[0]
+    return MELD_CHOW, codes[0]
+
+
+class zobrist_hash:
+    """
+    引擎持有的增量哈希。引擎在每次摸牌、出牌、吃碰杠和换人时调用对应的方法，
+    哈希自己记下每家的张数、面子数、弃牌数、牌墙游标和当前座位，调用方只需告诉它变化了什么。
+    """
+    __slots__ = ('value', 'public', 'sizes', 'meld_counts', 'discard_counts', 'head', 'tail', 'turn')
+
+    def __init__(self, head=0, tail=0, turn=0):
+        self.sizes = [0] * SEATS
+        self.meld_counts = [0] * SEATS
+        self.discard_counts = [0] * SEATS
+        self.reset(head, tail, turn)
+
+    def reset(self, head=0, tail=0, turn=0):
+        """复位为各家空手、没有面子和弃牌的状态 (新一局)，原地清零"""
+        for counts in (self.sizes, self.meld_counts, self.discard_counts):
+            counts[:] = (0,) * SEATS
+        self.head = head
+        self.tail = tail
+        self.turn = turn
+        public = REMAIN_KEYS[tail - head] ^ SEAT_KEYS[turn]
+        for seat in range(SEATS):
+            public ^= HAND_SIZE_KEYS[seat][0]
+        self.public = public
+        self.value = public ^ HEAD_KEYS[head]
+
+    def _public(self, key):
+        self.public ^= key
+        self.value ^= key
+
+    def tile(self, seat, code, old, new):
+        """seat 手里编码 code 的牌从 old 张变为 new 张"""
+        keys = HAND_KEYS[seat][code]
+        size = self.sizes[seat]
+        self.sizes[seat] = size + new - old
+        size_keys = HAND_SIZE_KEYS[seat]
+        self._public(size_keys[size] ^ size_keys[size + new - old])
+        self.value ^= keys[old] ^ keys[new]
+
+    def set_hand(self, seat, counts, jokers, old_counts=None, old_jokers=0):
+        """整手替换 (发牌)；old_counts 为 None 表示原来是空手"""
+        for code in range(NUM_KINDS):
+            old = old_counts[code] if old_counts is not None else 0
+            if old != counts[code]: self.tile(seat, code, old, counts[code])
+        if old_jokers != jokers: self.tile(seat, JOKER_CODE, old_jokers, jokers)
+
+    def meld(self, seat, codes):
+        """seat 亮出一组明牌 (牌编码)"""
+        index = self.meld_counts[seat]
+        self.meld_counts[seat] = index + 1
+        self._public(MELD_KEYS[seat][index][meld_slot(*meld_of(codes))])
+
+    def discard(self, seat, code):
+        index = self.discard_counts[seat]
+        self.discard_counts[seat] = index + 1
+        self._public(DISCARD_KEYS[seat][index][code])
+
+    def take_discard(self, seat, code):
+        """seat 最后一张弃牌被别人吃碰杠胡拿走"""
+        index = self.discard_counts[seat] - 1
+        self.discard_counts[seat] = index
+        self._public(DISCARD_KEYS[seat][index][code])
+
+    def wall(self, head, tail):
+        """牌墙游标移动 (摸牌、补张、发牌)"""
+        self._public(REMAIN_KEYS[self.tail - self.head] ^ REMAIN_KEYS[tail - head])
+        self.value ^= HEAD_KEYS[self.head] ^ HEAD_KEYS[head]
+        self.head = head
+        self.tail = tail
+
+    def set_turn(self, seat):
+        if seat != self.turn:
+            self._public(SEAT_KEYS[self.turn] ^ SEAT_KEYS[seat])
+            self.turn = seat
+
+    def hex(self):
+        """附在状态更新里的公开哈希 (16 位十六进制，避免 JSON 数字精度问题)"""
+        return format(self.public, '016x')
+
+
+def public_state_hash(public_state):
+    """
+    从服务器下发的公开状态字典算出公开哈希，与服务器端 zobrist_hash.public 相同的值。
+    需要 players[*].id / hand_count / locked / discarded、wall_count、playerindex。
+    """
+    h = REMAIN_KEYS[int(public_state.get('wall_count', 0))] ^ SEAT_KEYS[int(public_state.get('playerindex') or 0)]
+    for player in public_state.get('players', []):
+        seat = player['id']
+        h ^= HAND_SIZE_KEYS[seat][int(player.get('hand_count', 0))]
+        for i, group in enumerate(player.get('locked', [])):
+            h ^= MELD_KEYS[seat][i][meld_slot(*meld_of(tile_code(t) for t in group))]
+        for i, tile in enumerate(player.get('discarded', [])):
+            h ^= DISCARD_KEYS[seat][i][tile_code(tile)]
+    return h
+
+
+def state_matches(public_state):
+    """公开状态里带的哈希 ('state_hash') 与本地算出的是否一致；没带哈希时视为一致"""
+    expected = public_state.get('state_hash')
+    if expected is None: return True
+    try:
+        return int(expected, 16) == public_state_hash(public_state)
+    except (KeyError, IndexError, TypeError, ValueError):
+        return False
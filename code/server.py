@@ -1,21 +1,45 @@
+import os
+if os.environ.get('MAHJONG_BROKER'):
+    import eventlet
+    eventlet.monkey_patch()  # 多进程模式：连消息代理的阻塞读写要让给其他绿色线程，必须在其他导入之前
 import socketio
+import argparse
 import json
 import threading
 import time
 import uuid
 from datetime import datetime
 import eventlet
+from eventlet import tpool
+import multiprocessing
 import mahjong
-import os
 import random
+import subprocess
+import sys
 import logging
+from contextlib import contextmanager
+from mahjong_tiles import get_tile_index, insort_tile
+from mahjong_rules import compile_rules
+from mahjong_advisor import best_discard
+from mahjong_outcomes import outcome_recorder
+from mahjong_sync import state_channel
+from mahjong_timers import timer_wheel
+from mahjong_shards import hash_ring, broker, broker_client, broker_path, client_manager
 
 # 配置日志记录
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
+# 多进程部署 (见 mahjong_shards)：由 --workers 启动的工作进程通过环境变量拿到消息代理地址、自己的编号和全部进程的地址
+BROKER_URL = os.environ.get('MAHJONG_BROKER')   # 未设置时为单进程
+WORKER_INDEX = int(os.environ.get('MAHJONG_WORKER', 0))
+WORKER_URLS = [url for url in os.environ.get('MAHJONG_WORKER_URLS', '').split(',') if url]
+DEFAULT_BROKER = 'unix:///tmp/mahjong_broker.sock'
+shard_ring = hash_ring(range(len(WORKER_URLS))) if BROKER_URL else None
+_directory_publisher = None
+
 # 创建Socket.IO服务器
-sio = socketio.Server(cors_allowed_origins="*")
+sio = socketio.Server(cors_allowed_origins="*", client_manager=client_manager(BROKER_URL) if BROKER_URL else None)
 app = socketio.WSGIApp(sio)
 
 # 全局数据存储
@@ -31,6 +55,45 @@ _replacements = {
     'spring': '🀦', 'summer': '🀧', 'autumn': '🀨', 'winter': '🀩',
     'plum': '🀢', 'orchid': '🀣', 'bamboo': '🀤', 'chrysanthemum': '🀥'
 }
+CLAIM_PRIORITY = {'hu': 3, 'kong': 2, 'pong': 2, 'chow': 1}  # 同一张弃牌有多家响应时的优先级
+FLUSH_WINDOW = 0.02      # 不在逻辑操作内的状态更新，在这段时间内合并后再发送 (秒)
+ADVISOR_BUDGET = 0.05    # 托管出牌的计算时间上限 (秒)
+ADVISOR_PROCESSES = 2    # 模拟用的进程数
+_advisor_pool = None
+
+def get_advisor_pool():
+    """出牌建议的模拟放在独立进程里跑，不占用 eventlet 的事件循环"""
+    global _advisor_pool
+    if _advisor_pool is None:
+        _advisor_pool = multiprocessing.Pool(ADVISOR_PROCESSES)
+    return _advisor_pool
+
+TIMER_TICK = 0.05        # 定时的精度 (秒)
+COUNTDOWN_SECONDS = 3    # 全员准备后的开局倒计时
+LOBBY = 'lobby'          # 大厅的 socket.io 房间，只有不在房间里的用户订阅房间列表的变化
+ROOM_PAGE_SIZE = 20      # 房间列表每页的房间数
+_timer_wheel = None
+
+def get_timer_wheel():
+    """全服共用一个时间轮 (见 mahjong_timers)，第一次用到时启动推进它的后台任务"""
+    global _timer_wheel
+    if _timer_wheel is None:
+        _timer_wheel = timer_wheel(TIMER_TICK)
+        sio.start_background_task(_timer_wheel.run, sio.sleep)
+    return _timer_wheel
+
+OUTCOME_PATH = os.environ.get('MAHJONG_OUTCOMES', 'outcomes')  # 对局结果的列式存储目录
+if BROKER_URL:
+    OUTCOME_PATH = os.path.join(OUTCOME_PATH, f"worker_{WORKER_INDEX}")  # 每个目录只能有一个写入者
+_outcome_recorder = None
+
+def get_outcome_recorder():
+    """服务器上对局不多，每局结束立即写入文件"""
+    global _outcome_recorder
+    if _outcome_recorder is None:
+        _outcome_recorder = outcome_recorder(OUTCOME_PATH, flush_every=1)
+    return _outcome_recorder
+
 class NotAcceptTime(Exception): pass
 class AlreadyActed(Exception): pass
 
@@ -47,14 +110,33 @@ class mahjong_room:
         self.spectators = {}
         self.status = 'waiting'
         self.game_instance = None
+        self.engine_players = []  # 当前引擎对应的玩家名单，名单不变时下一局复用引擎
         self.created_time = datetime.now().isoformat()
         self.rules = { "rules": "classic", "max players": 4, "tiles number": 16, "golden tile": True, "golden tile number": 4, "three golden win": True, "allow seven pairs": False, "stand delay": 20, "special delay": 5, "items_to_remove": ['spring', 'summer', 'autumn', 'winter', 'plum', 'orchid', 'bamboo', 'chrysanthemum'] }
+        self.ruleset = compile_rules(self.rules)  # 编译后的规则，规则相同的房间共用一个实例
 
         # 游戏流程控制属性
         self.sid_to_player_id = {}
         self.player_id_to_sid = {}
         self.pending_claims = {}
         self.submitted_claims = {}
+        self.passed_claims = set()
+        # 响应窗口：每次出牌后有人可以吃碰杠胡时开一个新窗口，序号用来区分窗口，超时和最后一个响应只有先到的那个生效
+        self.claim_window = 0
+        self.claim_resolved = True
+        self._claim_timer = None
+        self.auto_discards = {}  # 玩家 id -> (回合序号, 超时时代打的牌名)，轮到该玩家时提前算好
+        self.turn_seq = 0        # 每次提示出牌加一，出牌超时的定时带着它，过时的定时不会误出牌
+        self._discard_timer = None
+        self.countdown = None    # 开局倒计时的定时
+        # 增量状态同步 (见 mahjong_sync)：公开状态一路，每个座位的私有状态各一路
+        self.public_channel = state_channel('public')
+        self.private_channels = {}
+        # 出站合并：一次逻辑操作 (或 FLUSH_WINDOW 内) 的状态变化只发一帧，播报收集成列表
+        self._reports = []
+        self._dirty = False
+        self._batch_depth = 0
+        self._flush_scheduled = False
 
     # --- 房间管理方法 (未改变) ---
     def add_member(self, sid, name):
@@ -70,29 +152,91 @@ class mahjong_room:
             sio.leave_room(sid, self.id)
             return True
         return False
+    def close(self):
+        """房间解散：取消房间的所有定时，对局作废 (不记录结果)，已经排队的回调和后台任务之后都不再推进"""
+        self.claim_resolved = True
+        self._cancel_claim_timer()
+        self._cancel_discard_timer()
+        if self.countdown is not None:
+            self.countdown.cancel()
+            self.countdown = None
+        self.status = 'finished'
+        self.turn_seq += 1  # 还在计算的托管出牌结果作废
+        self.sid_to_player_id = {}
+        self.player_id_to_sid = {}
     def get_members(self): return list(self.members.keys())
     def get_member(self, sid): return self.members.get(sid, None)
-    def is_full(self): return len(self.members) >= self.rules['max players']
+    def is_full(self): return len(self.members) >= self.ruleset.players_number
     def modify_rules(self, new_rules, sid):
-        self.rules.update(new_rules) # 简化规则更新
+        """先校验再合并，不认识的键或非法值抛 ValueError，房间规则保持不变"""
+        merged = {**self.rules, **new_rules}
+        self.ruleset = compile_rules(merged)
+        self.rules = merged
         self.log = f"{datetime.now().isoformat()} {self.members[sid]['name']} 修改了房间规则"
         print(f"✅ 房间 {self.name} 的规则已更新: {self.rules}")
         return self.rules
 
     # --- 游戏状态广播方法 ---
     def update_all_clients(self, log_message=None):
-        """更新客户端数据"""
+        """
+        登记一次状态变化，不立即发送：在 batch() 内时由最外层结束时统一发出，
+        否则在 FLUSH_WINDOW 后发出。同一帧里的播报按顺序收集成列表。
+        """
         if not self.game_instance: return
-        public_state = self.game_instance.getgamestate()
-        if log_message:
-            public_state['report'] = log_message
-        sio.emit('game_state_update', public_state, room=self.id)
+        if log_message: self._reports.append(log_message)
+        self._dirty = True
+        if self._batch_depth == 0 and not self._flush_scheduled:
+            self._flush_scheduled = True
+            sio.start_background_task(self._flush_later)
+
+    @contextmanager
+    def batch(self):
+        """一次逻辑操作 (出牌、处理吃碰杠、换人) 内的状态更新合并成一帧，最外层结束时发出"""
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0: self.flush_updates()
+
+    def _flush_later(self):
+        sio.sleep(FLUSH_WINDOW)
+        self._flush_scheduled = False
+        self.flush_updates()
+
+    def flush_updates(self):
+        """把登记的状态变化发出去：每一路状态开局时发关键帧，之后只发和上一帧的差异"""
+        if not self._dirty or not self.game_instance: return
+        reports, self._reports, self._dirty = self._reports, [], False
+        frame = self.public_channel.update(self.game_instance.getgamestate())
+        if reports:
+            frame['report'] = reports
+        self._attach_hash(frame)
+        sio.emit(_frame_event(frame), frame, room=self.id)
 
         for p in self.game_instance.players:
-            private_state = self.game_instance.getgamestate(playerid=p.id)
             player_sid = self.player_id_to_sid.get(p.id)
             if player_sid:
-                sio.emit('private_state_update', private_state, room=player_sid)
+                channel = self.private_channels.setdefault(p.id, state_channel('private'))
+                frame = channel.update(self.game_instance.getgamestate(playerid=p.id))
+                sio.emit(_frame_event(frame), frame, room=player_sid)
+
+    def _attach_hash(self, frame):
+        # 引擎维护了增量哈希时附上公开部分，客户端据此检查自己的状态是否与服务器一致
+        zobrist = getattr(self.game_instance, 'zobrist', None)
+        if zobrist is not None:
+            frame['state_hash'] = zobrist.hex()
+
+    def send_keyframe(self, sid, channel='public'):
+        """客户端发现序号不连续 (或刚重连) 时请求完整状态，只发给它自己"""
+        if channel == 'private':
+            source = self.private_channels.get(self.sid_to_player_id.get(sid))
+        else:
+            source = self.public_channel
+        frame = source.keyframe() if source is not None else None
+        if frame is None: return
+        if channel == 'public': self._attach_hash(frame)
+        sio.emit('state_keyframe', frame, room=sid)
 
     # --- 游戏核心逻辑 ---
     def start_game(self):
@@ -104,13 +248,24 @@ class mahjong_room:
         player_sids = list(self.members.keys())
         player_names = [self.members[sid]['name'] for sid in player_sids]
         
-        self.game_instance = mahjong.MahjongServer(playersnames=player_names)
+        engine = self.game_instance
+        if engine is not None and player_names == self.engine_players and hasattr(engine, 'reset'):
+            # 同一桌人连续开局：复位并复用引擎的玩家和牌墙，庄家按上一局结果连庄或轮庄
+            engine.reset()
+        else:
+            self.game_instance = mahjong.MahjongServer(playersnames=player_names)
+            self.engine_players = player_names
         self.status = 'playing'
+        self.game_started = time.perf_counter()
         self.sid_to_player_id = {sid: i for i, sid in enumerate(player_sids)}
         self.player_id_to_sid = {i: sid for sid, i in self.sid_to_player_id.items()}
+        self.public_channel.reset()  # 新一局的第一帧为关键帧
+        for channel in self.private_channels.values(): channel.reset()
 
         # 1. 初始化游戏引擎（洗牌、发牌、选金）
         self.game_instance.start(dice=random.randint(2, 12))
+        for p in self.game_instance.players:
+            p.sort_hands(self.game_instance.sort_rule)  # 发牌后整手排序一次，之后摸牌都二分插入
         
         # 2. 庄家摸开局第一张牌
         dealer = self.game_instance.players[self.game_instance.playerindex]
@@ -128,8 +283,9 @@ class mahjong_room:
                 }, room=player_sid)
 
         # 4. 最后，广播公共状态并通知庄家出牌
-        self.update_all_clients(f"游戏开始！金牌是 {_replacements.get(golden_tile, golden_tile)}。")
-        self._notify_player_to_discard(dealer.id)
+        with self.batch():
+            self.update_all_clients(f"游戏开始！金牌是 {_replacements.get(golden_tile, golden_tile)}。")
+            self._notify_player_to_discard(dealer.id)
 
     def handle_player_action(self, sid, data):
         """处理所有来自客户端的游戏内动作"""
@@ -138,12 +294,15 @@ class mahjong_room:
         if player_id is None: return
 
         try:
-            if action_type == 'discard':
-                self._handle_discard(player_id, data.get('tileindex'))
-            elif action_type in ['hu', 'pong', 'kong', 'chow']:
-                self._handle_claim(player_id, data)
-            else:
-                raise ValueError("未知的游戏操作")
+            with self.batch():
+                if action_type == 'discard':
+                    self._handle_discard(player_id, data.get('tileindex'))
+                elif action_type in ['hu', 'pong', 'kong', 'chow']:
+                    self._handle_claim(player_id, data)
+                elif action_type == 'pass':
+                    self._handle_pass(player_id)
+                else:
+                    raise ValueError("未知的游戏操作")
         except (ValueError, NotAcceptTime, AlreadyActed) as e:
             logging.warning(f"玩家 {player_id} 操作无效: {e}")
             sio.emit('game_action_result', {'success': False, 'message': str(e)}, room=sid)
@@ -154,9 +313,11 @@ class mahjong_room:
         
         player = game.players[player_id]
         discarded_tile = player.discard(tile_index)
+        self._cancel_discard_timer()
         if player.new:
-            player.integrate_new_tile()
-        player.sort_hands(game.sort_rule)
+            # 手牌在发牌和吃碰杠后排好序，新牌二分插入即可
+            insort_tile(player.hands, player.new, game.sort_rule)
+            player.new = None
         
         # 统一调用更新函数
         self.update_all_clients(f"玩家 {player.name} 打出了: {_replacements.get(discarded_tile, discarded_tile)}")
@@ -167,7 +328,7 @@ class mahjong_room:
 
         if self.pending_claims:
             self.update_all_clients(f"玩家 {player.name} 出牌后，等待其他玩家响应...")
-            sio.start_background_task(self._process_claims_after_delay) # 不会倒计时提醒客户端，只有在超时后才会处理
+            self._open_claim_window()
         else:
             sio.start_background_task(self._transition_to_next_turn)
 
@@ -185,21 +346,65 @@ class mahjong_room:
             discarding_player = self.game_instance.players[self.game_instance.playerindex]
             last_discarded_tile = discarding_player.discarded[-1]
             
-            possible_chows = self.game_instance.players[player_id].can_chow(
-                last_discarded_tile,
-                self.game_instance.sort_rule
-            )
-            if chow_pair not in possible_chows: raise ValueError("无效的吃牌组合。")
+            hands = self.game_instance.players[player_id].hands
+            possible_chows = get_tile_index(self.game_instance.sort_rule).chow_pairs.get(last_discarded_tile, ())
+            if chow_pair not in possible_chows or not all(t in hands for t in chow_pair):
+                raise ValueError("无效的吃牌组合。")
             claim_data = ('chow', chow_pair)
 
         self.submitted_claims[player_id] = claim_data
         logging.info(f"玩家 {self.game_instance.players[player_id].name} 提交了操作: {action_type}")
         sio.emit('game_action_result', {'success': True, 'message': '操作已提交，等待其他玩家...'}, room=self.player_id_to_sid[player_id])
+        if self._claims_decided():
+            self._resolve_claims(self.claim_window)
 
-    def _process_claims_after_delay(self):
-        """处理特殊动作"""
-        delay = self.rules.get('special delay', 5)
-        sio.sleep(delay)
+    def _handle_pass(self, player_id):
+        """放弃本次响应"""
+        if not any(player_id in players for players in self.pending_claims.values()):
+            raise NotAcceptTime("你当前不能执行此操作。")
+        if player_id in self.submitted_claims or player_id in self.passed_claims:
+            raise AlreadyActed("你已经提交过操作了。")
+        self.passed_claims.add(player_id)
+        sio.emit('game_action_result', {'success': True, 'message': '已选择过，等待其他玩家...'}, room=self.player_id_to_sid[player_id])
+        if self._claims_decided():
+            self._resolve_claims(self.claim_window)
+
+    def _open_claim_window(self):
+        """开一个新的响应窗口，special_delay 秒后超时处理 (所有人都表态后会提前处理)"""
+        self._cancel_claim_timer()
+        self.claim_window += 1
+        self.claim_resolved = False
+        self.passed_claims = set()
+        self._claim_timer = get_timer_wheel().schedule(self.ruleset.special_delay, self._resolve_claims,
+                                                       token=self.claim_window)
+
+    def _cancel_claim_timer(self):
+        if self._claim_timer is not None:
+            self._claim_timer.cancel()
+            self._claim_timer = None
+
+    def _claims_decided(self):
+        """
+        结果是否已经确定：每个能响应的玩家都已提交或选择过，
+        或者还没表态的玩家能做的操作都不比已提交的优先 (有人胡牌时立即确定)
+        """
+        responded = set(self.submitted_claims) | self.passed_claims
+        best = max((CLAIM_PRIORITY[c[0] if isinstance(c, tuple) else c] for c in self.submitted_claims.values()), default=0)
+        if best == CLAIM_PRIORITY['hu']: return True
+        for action_type, players in self.pending_claims.items():
+            if CLAIM_PRIORITY.get(action_type, 0) >= best and any(p not in responded for p in players):
+                return False
+        return True
+
+    def _resolve_claims(self, window):
+        """处理响应窗口；超时和最后一个响应都可能调用，同一个窗口只处理一次"""
+        if window != self.claim_window or self.claim_resolved or self.status != 'playing': return
+        self.claim_resolved = True
+        self._cancel_claim_timer()
+        with self.batch():
+            self._process_claims()
+
+    def _process_claims(self):
         game = self.game_instance
         
         action_type = None # 捕获动作类型
@@ -211,6 +416,7 @@ class mahjong_room:
         actor_id = game.processactions(self.submitted_claims)
         self.pending_claims = {}
         self.submitted_claims = {}
+        self.passed_claims = set()
 
         for player in game.players:
             player.actions = {} # 清空玩家的动作列表
@@ -222,6 +428,7 @@ class mahjong_room:
         if actor_id is not None:
             game.turntonext(actor_id=actor_id)
             actor_player = game.players[actor_id]
+            actor_player.sort_hands(game.sort_rule)  # 引擎吃碰杠时不保证顺序，重排一次
             if action_type == 'kong':
                 game.new_tile()
 
@@ -235,6 +442,11 @@ class mahjong_room:
                  self._transition_to_next_turn()      
 
     def _transition_to_next_turn(self):
+        if self.status != 'playing': return  # 排队期间对局已结束或房间已解散
+        with self.batch():
+            self._next_turn()
+
+    def _next_turn(self):
         game = self.game_instance
         if not game.wall:
             self.end_game_as_draw("牌墙已空，游戏荒庄！")
@@ -260,31 +472,89 @@ class mahjong_room:
         self.update_all_clients(f"轮到玩家 {next_player.name} 摸牌。")
         self._notify_player_to_discard(next_player_id)
 
-    def _start_discard_timer(self, timed_player_id, timeout):
-        """为出牌玩家启动倒计时"""
-        sio.sleep(timeout)
+    def _cancel_discard_timer(self):
+        if self._discard_timer is not None:
+            self._discard_timer.cancel()
+            self._discard_timer = None
+
+    def _discard_timeout(self, timed_player_id, turn):
+        """出牌超时；turn 是登记定时时的回合序号，之后又轮过一圈的旧定时直接忽略"""
+        if turn != self.turn_seq: return
+        self._discard_timer = None
         if self.status == 'playing' and self.game_instance.playerindex == timed_player_id:
             logging.info(f"⏰ 玩家 {self.game_instance.players[timed_player_id].name} 出牌超时，系统自动出牌。")
             try:
-                # 自动打出新摸的牌 (tile_index=None)
-                self._handle_discard(timed_player_id, None)
+                # 打出提前算好的建议牌，没算出来时打出新摸的牌 (tile_index=None)
+                with self.batch():
+                    self._handle_discard(timed_player_id, self._auto_discard_index(timed_player_id))
             except Exception as e:
                 logging.error(f"自动出牌时发生错误: {e}")
         
     def _notify_player_to_discard(self, player_id, can_hu=False):
         """通知玩家出牌, 未来会添加掉线重连逻辑，掉线或者托管的玩家的 timeout 为 1s"""
+        self.flush_updates()  # 先让客户端拿到最新状态，再提示出牌
         player_sid = self.player_id_to_sid.get(player_id)
         if player_sid:
-            timeout = self.rules.get('stand delay', 20)
+            timeout = self.ruleset.stand_delay
             message = f"请在 {timeout} 秒内出牌"
             if can_hu: message += "，或者选择自摸胡牌"
             sio.emit('your_turn_to_discard', {'message': message}, room=player_sid)
             sio.emit('refresh_countdown', {'timeout': timeout}, room=player_sid)    # 提醒客户端倒计时
-            sio.start_background_task(self._start_discard_timer, player_id, timeout)
+            self._cancel_discard_timer()
+            self.turn_seq += 1
+            sio.start_background_task(self._prepare_auto_discard, player_id, self.turn_seq)
+            self._discard_timer = get_timer_wheel().schedule(timeout, self._discard_timeout, player_id,
+                                                             token=self.turn_seq)
+
+    def _prepare_auto_discard(self, player_id, turn):
+        """轮到玩家出牌时就在线程池里算好托管出牌，保证倒计时结束前结果已经就绪；结果记在算它的回合序号下"""
+        game = self.game_instance
+        player = game.players[player_id]
+        tiles = list(player.hands) + ([player.new] if player.new else [])
+        visible = []
+        for p in game.players:
+            visible.extend(p.discarded)
+            for meld in p.locked: visible.extend(meld)
+        try:
+            tile = tpool.execute(best_discard, tiles, visible, self.ruleset, game.golden_tile,
+                                 ADVISOR_BUDGET, get_advisor_pool())
+        except Exception as e:
+            logging.error(f"计算托管出牌时发生错误: {e}")
+            return
+        if turn == self.turn_seq:  # 算完时已经换了回合，结果作废
+            self.auto_discards[player_id] = (turn, tile)
+
+    def _auto_discard_index(self, player_id):
+        """把算好的牌名换成出牌序号；手牌已经变了或没有结果时返回 None (打出新摸的牌)"""
+        turn, tile = self.auto_discards.pop(player_id, (None, None))
+        if turn != self.turn_seq: tile = None
+        player = self.game_instance.players[player_id]
+        if tile is None or tile == player.new or tile not in player.hands:
+            return None
+        return player.hands.index(tile)
+
+    def _record_outcome(self):
+        """把本局结果追加到列式存储 (见 mahjong_outcomes)，写入失败不影响结束流程"""
+        game = self.game_instance
+        winner = game.winner_id
+        jokers = game.players[winner].hands.count('joker') if winner is not None else 0
+        win_type = getattr(game, 'win_type', None)
+        if winner is not None and win_type is None:
+            win_type = 'zimo' if winner == game.playerindex else 'dianpao'
+        try:
+            get_outcome_recorder().record(
+                self.ruleset, winner, win_type, getattr(game, 'turn_count', 0), jokers, len(game.wall),
+                time.perf_counter() - self.game_started, getattr(game, 'dealer', None),
+            )
+        except (OSError, ValueError) as e:
+            logging.warning(f"对局结果写入失败: {e}")
 
     def end_game_as_draw(self, reason):
         if self.status == 'finished': return
         logging.info(reason)
+        self.claim_resolved = True
+        self._cancel_claim_timer()
+        self._cancel_discard_timer()
         
         winner_name = "荒庄"
         if self.game_instance.winner_id is not None:
@@ -292,18 +562,115 @@ class mahjong_room:
         
         self.game_instance.endgame(reason=reason)
         self.status = 'finished'
-        self.update_all_clients(f"游戏结束！{reason}。胜利者: {winner_name}")
-
+        lobby_update(self.id)
+        self._record_outcome()
+        with self.batch():
+            self.update_all_clients(f"游戏结束！{reason}。胜利者: {winner_name}")
+
+
+def _frame_event(frame):
+    return 'state_keyframe' if 'state' in frame else 'state_patch'
+
+
+# --- 大厅：分页查询房间列表，房间变化时只向大厅里的用户发送变化的字段 ---
+room_directory = {}  # 房间 id -> 最后一次发给大厅的房间摘要；多进程模式下包括其他进程的房间
+
+def room_summary(r):
+    return {'id': r.id, 'name': r.name, 'game': r.game, 'owner': r.owner, 'members': len(r.members), 'max_members': r.ruleset.players_number, 'has_password': bool(r.password), 'status': r.status}
+
+def get_room_list(page=1, page_size=ROOM_PAGE_SIZE, waiting=False, not_full=False, no_password=False):
+    """按条件过滤后的一页房间摘要；页码从 1 开始"""
+    page_size = max(1, min(int(page_size), 100))
+    matched = [r for r in room_directory.values()
+               if (not waiting or r['status'] == 'waiting') and (not not_full or r['members'] < r['max_members'])
+               and (not no_password or not r['has_password'])]
+    pages = max(1, -(-len(matched) // page_size))
+    page = max(1, min(int(page), pages))
+    start = (page - 1) * page_size
+    return {'rooms': matched[start:start + page_size], 'page': page, 'pages': pages,
+            'total': len(matched), 'page_size': page_size,
+            'filters': {'waiting': waiting, 'not_full': not_full, 'no_password': no_password}}
+
+def _room_query(data):
+    data = data or {}
+    try:
+        return {'page': int(data.get('page', 1)), 'page_size': int(data.get('page_size', ROOM_PAGE_SIZE)),
+                'waiting': bool(data.get('waiting')), 'not_full': bool(data.get('not_full')),
+                'no_password': bool(data.get('no_password'))}
+    except (TypeError, ValueError):
+        return {'page': 1, 'page_size': ROOM_PAGE_SIZE, 'waiting': False, 'not_full': False, 'no_password': False}
+
+def enter_lobby(sid):
+    """用户回到大厅：订阅房间变化，并按上次的查询条件发一页列表 (不在大厅时错过的变化由这一页补上)"""
+    sio.enter_room(sid, LOBBY)
+    query = users[sid].setdefault('lobby_query', _room_query(None))
+    sio.emit('room_list_page', get_room_list(**query), room=sid)
+
+def lobby_update(room_id):
+    """房间新建、变化或删除后调用：与上次发出的摘要比较，只把变化的字段发给大厅"""
+    room = rooms.get(room_id)
+    old = room_directory.get(room_id)
+    if room is None:
+        if old is not None:
+            del room_directory[room_id]
+            sio.emit('room_removed', {'id': room_id}, room=LOBBY)
+            _publish_directory('del', room_id)
+        return
+    summary = room_summary(room)
+    if old is None:
+        sio.emit('room_added', summary, room=LOBBY)
+    else:
+        changed = {k: v for k, v in summary.items() if old.get(k) != v}
+        if not changed: return
+        sio.emit('room_updated', {'id': room_id, **changed}, room=LOBBY)
+    room_directory[room_id] = summary
+    _publish_directory('set', room_id, summary)
+
+# --- 多进程：房间目录同步和房间归属 ---
+def _publish_directory(op, room_id=None, summary=None):
+    """把本进程房间的变化告诉其他进程 (大厅事件已经经客户端管理器发出，这里只同步目录)"""
+    if _directory_publisher is not None:
+        _directory_publisher.publish('rooms', (op, WORKER_INDEX, room_id, summary))
+
+def _directory_listener():
+    """接收其他进程的房间变化；新启动的进程先请求一次全部房间"""
+    client = broker_client(broker_path(BROKER_URL))
+    client.subscribe('rooms')
+    client.publish('rooms', ('sync', WORKER_INDEX, None, None))  # 同一个连接发出，其他进程的回复一定收得到
+    for op, worker, room_id, summary in client.listen():
+        if worker == WORKER_INDEX: continue
+        if op == 'set':
+            room_directory[room_id] = summary
+        elif op == 'del':
+            room_directory.pop(room_id, None)
+        elif op == 'sync':
+            for local_id in rooms:
+                if local_id in room_directory: _publish_directory('set', local_id, room_directory[local_id])
+
+def start_directory_sync():
+    global _directory_publisher
+    if BROKER_URL and _directory_publisher is None:
+        _directory_publisher = broker_client(broker_path(BROKER_URL))
+        sio.start_background_task(_directory_listener)
+
+def room_owner(room_id):
+    """房间所属的进程编号；单进程时总是本进程"""
+    return WORKER_INDEX if shard_ring is None else shard_ring.owner(room_id)
+
+def new_room_id():
+    """生成归本进程所有的房间 id (n 个进程时平均试 n 次)"""
+    while True:
+        room_id = str(uuid.uuid4())
+        if room_owner(room_id) == WORKER_INDEX: return room_id
 
 # --- 全局服务器事件 (大部分未改变) ---
-def get_room_list():
-    return [{'id': r.id, 'name': r.name, 'game': r.game, 'owner': r.owner, 'members': len(r.members), 'max_members': r.rules['max players'], 'has_password': bool(r.password), 'status': r.status} for r in rooms.values()]
 def broadcast_room_state(room_id, log=None):
     if room_id not in rooms: return
     if log: rooms[room_id].log = log
     room = rooms[room_id]
     room_state = {'game': room.game, 'name': room.name, 'id': room.id, 'owner': room.owner, 'members': room.members, 'rules': room.rules, 'status': room.status, 'log': room.log}
     sio.emit('room_state_update', room_state, room=room_id)
+    lobby_update(room_id)
 
 @sio.event
 def connect(sid, environ):
@@ -324,7 +691,8 @@ def join_server(sid, data):
         sio.emit('join_server_result', {'success': False, 'message': '用户名不能为空'}, room=sid)
         return
     users[sid]['name'] = name; users[sid]['status'] = 'online'
-    sio.emit('join_server_result', {'success': True, 'message': '连接成功', 'room_list': get_room_list()}, room=sid)
+    sio.emit('join_server_result', {'success': True, 'message': '连接成功'}, room=sid)
+    enter_lobby(sid)
     logging.info(f"✅ 用户 {name} 成功加入服务器")
 @sio.event
 def create_room(sid, data):
@@ -333,11 +701,11 @@ def create_room(sid, data):
     if not room_name:
         sio.emit('create_room_result', {'success': False, 'message': '房间名不能为空'}, room=sid)
         return
-    room_id = str(uuid.uuid4())
+    room_id = new_room_id()
     rooms[room_id] = mahjong_room(room_name, data.get('password', ''), room_id)
     rooms[room_id].owner = users[sid]['name']
     sio.emit('create_room_result', {'success': True, 'message': '房间创建成功', 'room_id': room_id, 'password': data.get('password', '')}, room=sid)
-    sio.emit('room_list_update', get_room_list())
+    lobby_update(room_id)
     logging.info(f"🏠 用户 {users[sid]['name']} 创建了房间: {room_name}")
 @sio.event
 def join_room(sid, data):
@@ -345,7 +713,13 @@ def join_room(sid, data):
     room_id = data.get('room_id')
     password = data.get('password', '')
     if room_id not in rooms:
-        sio.emit('join_room_result', {'success': False, 'message': '房间不存在'}, room=sid)
+        owner = room_owner(room_id)
+        if owner != WORKER_INDEX:
+            # 房间在另一个进程上：让客户端改连过去再加入
+            sio.emit('join_room_result', {'success': False, 'message': '房间在另一个服务器进程上，正在转接...',
+                                          'redirect': WORKER_URLS[owner], 'room_id': room_id, 'password': password}, room=sid)
+        else:
+            sio.emit('join_room_result', {'success': False, 'message': '房间不存在'}, room=sid)
         return
     room = rooms[room_id]
     if room.is_full():
@@ -355,10 +729,10 @@ def join_room(sid, data):
         sio.emit('join_room_result', {'success': False, 'message': '密码错误'}, room=sid)
         return
     room.add_member(sid, users[sid]['name'])
+    sio.leave_room(sid, LOBBY)
     users[sid]['room_id'] = room_id; users[sid]['status'] = 'in_room'
     sio.emit('join_room_result', {'success': True, 'message': '成功加入房间', 'id': room_id}, room=sid)
     broadcast_room_state(room_id)
-    sio.emit('room_list_update', get_room_list())
     logging.info(f"🚪 用户 {users[sid]['name']} 加入了房间: {room.name}")
 def handle_leave_room(sid, room_id):
     if room_id not in rooms: return
@@ -367,17 +741,31 @@ def handle_leave_room(sid, room_id):
     room.remove_member(sid)
     if room.owner == user_name:
         sio.emit('room_deleted', {'message': '房主离开，房间已解散'}, room=room_id)
+        room.close()
         del rooms[room_id]
+        for member_sid in list(room.members):
+            # 其余成员随房间解散回到大厅
+            room.remove_member(member_sid)
+            if member_sid in users:
+                users[member_sid]['room_id'] = None; users[member_sid]['status'] = 'online'
+                enter_lobby(member_sid)
         logging.info(f"🏠 房间 {room.name} 已删除")
     else:
         broadcast_room_state(room_id, f"{datetime.now().isoformat()} {user_name} 离开房间")
     users[sid]['room_id'] = None; users[sid]['status'] = 'online'
-    sio.emit('room_list_update', get_room_list())
+    lobby_update(room_id)
 @sio.event
 def leave_room(sid, data):
     if sid in users and users[sid].get('room_id'):
         handle_leave_room(sid, users[sid]['room_id'])
         sio.emit('leave_room_result', {'success': True, 'message': '已离开房间'}, room=sid)
+        enter_lobby(sid)
+@sio.event
+def request_room_list(sid, data):
+    """分页查询房间列表，可按 waiting / not_full / no_password 过滤；查询条件记下来，回到大厅时沿用"""
+    if sid not in users: return
+    users[sid]['lobby_query'] = _room_query(data)
+    sio.emit('room_list_page', get_room_list(**users[sid]['lobby_query']), room=sid)
 @sio.event
 def chat_message(sid, data):
     room_id = users[sid].get('room_id')
@@ -393,27 +781,42 @@ def player_ready(sid, data):
     room.members[sid]['ready'] = data.get('ready', False)
     room.log = f"{datetime.now().isoformat()} {room.members[sid]['name']} {'准备' if room.members[sid]['ready'] else '取消准备'}"
     broadcast_room_state(room_id)
-    if sum(1 for m in room.members.values() if m['ready']) == room.rules['max players']:
-        sio.start_background_task(start_game_countdown, room_id)
+    if sum(1 for m in room.members.values() if m['ready']) == room.ruleset.players_number:
+        start_game_countdown(room_id)
 def start_game_countdown(room_id):
-    """游戏开始倒计时"""
+    """游戏开始倒计时；重复触发 (有人取消又准备) 时重新计时，不会开两局"""
     if room_id not in rooms: return
     room = rooms[room_id]
     if room.status == 'playing': return
-    
+    if room.countdown is not None: room.countdown.cancel()
     logging.info(f"房间 {room.name} 准备开始倒计时...")
-    for i in range(3, 0, -1):
-        broadcast_room_state(room_id, f"所有玩家已准备，游戏还有 {i} 秒开始")
-        sio.sleep(1)
-    
+    _countdown_step(room_id, COUNTDOWN_SECONDS)
+def _countdown_step(room_id, remaining):
+    """倒计时的每一秒由时间轮调用"""
+    room = rooms.get(room_id)
+    if room is None or room.status == 'playing': return
+    if remaining:
+        broadcast_room_state(room_id, f"所有玩家已准备，游戏还有 {remaining} 秒开始")
+        room.countdown = get_timer_wheel().schedule(1, _countdown_step, room_id, remaining - 1)
+        return
+    room.countdown = None
+
     # 再次检查状态
-    if len(room.members) != room.rules['max players'] or not all(m['ready'] for m in room.members.values()):
+    if len(room.members) != room.ruleset.players_number or not all(m['ready'] for m in room.members.values()):
         broadcast_room_state(room_id, "有玩家取消准备或离开，游戏开始已取消")
         return
     
     room.start_game()
     broadcast_room_state(room_id, "游戏开始！")
 
+@sio.event
+def request_keyframe(sid, data):
+    """客户端状态序号不连续时请求重新同步"""
+    if sid not in users: return
+    room_id = users[sid].get('room_id')
+    if not room_id or room_id not in rooms: return
+    rooms[room_id].send_keyframe(sid, (data or {}).get('channel', 'public'))
+
 @sio.event
 def game_action(sid, data):
     """游戏操作的统一入口"""
@@ -427,7 +830,33 @@ def game_action(sid, data):
     # 将动作全权委托给房间实例处理
     room.handle_player_action(sid, data)
 
+def run_workers(workers, host, port, broker_url):
+    """启动本地消息代理和 workers 个工作进程 (端口 port ~ port + workers - 1)，房间按 id 分给各进程"""
+    hub = broker(broker_path(broker_url))
+    hub.start()
+    urls = [f"http://{host}:{port + i}" for i in range(workers)]
+    processes = []
+    for i in range(workers):
+        env = {**os.environ, 'MAHJONG_BROKER': broker_url, 'MAHJONG_WORKER': str(i), 'MAHJONG_WORKER_URLS': ','.join(urls)}
+        processes.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), '--host', host, '--port', str(port + i)], env=env))
+    print(f"🚀 已启动 {workers} 个工作进程: {', '.join(urls)}")
+    try:
+        for process in processes: process.wait()
+    except KeyboardInterrupt:
+        for process in processes: process.terminate()
+
 if __name__ == '__main__':
-    print("🚀 Socket.IO 服务器启动中...")
-    print("📡 监听端口: 5000")
-    eventlet.wsgi.server(eventlet.listen(('127.0.0.1', 5000)), app)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="麻将 Socket.IO 服务器")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=1, help="工作进程数，大于 1 时按房间分片")
+    parser.add_argument('--broker', default=DEFAULT_BROKER, help="多进程模式的消息代理地址 (unix:///路径)")
+    args = parser.parse_args()
+    if args.workers > 1 and not BROKER_URL:
+        run_workers(args.workers, args.host, args.port, args.broker)
+        sys.exit(0)
+    print("🚀 Socket.IO 服务器启动中..." + (f" (工作进程 {WORKER_INDEX})" if BROKER_URL else ""))
+    print(f"📡 监听端口: {args.port}")
+    start_directory_sync()
+    get_advisor_pool()  # 先启动模拟进程，避免第一次托管出牌时才 fork
+    eventlet.wsgi.server(eventlet.listen((args.host, args.port)), app)
\ No newline at end of file
@@ -0,0 +1,41 @@
+"""mahjong_advisor.rank_discards 在向听数和有效牌相同时先打关联度低的牌，与模拟里的贪心出牌一致"""
+
+import random
+
+from mahjong_advisor import _greedy_discard, rank_discards, tile_counts
+from mahjong_shanten import isolation
+from mahjong_tiles import NUM_KINDS
+
+
+def test_lone_honor_before_connected_tile():
+    counts, jokers = tile_counts('1o 2o 5o 5o 6o 7o 9o 8t 4w 6w 7w 7w 9w z'.split())
+    ranked = rank_discards(counts, jokers)
+    assert ranked[0]['tile'] == 'z'
+    assert ranked[0]['isolation'] < ranked[1]['isolation']
+
+
+def test_ties_break_towards_least_connected():
+    rng = random.Random(2024)
+    ties = 0
+    for _ in range(1500):
+        wall = [code for code in range(NUM_KINDS) for _ in range(4)]
+        counts = bytearray(NUM_KINDS)
+        for code in rng.sample(wall, 14):
+            counts[code] += 1
+        ranked = rank_discards(counts, 0)
+        for r in ranked:
+            after = bytearray(counts)
+            after[r['code']] -= 1
+            assert r['isolation'] == isolation(after, r['code'])
+        for a, b in zip(ranked, ranked[1:]):
+            if (a['shanten'], a['live']) == (b['shanten'], b['live']):
+                ties += 1
+                assert a['isolation'] <= b['isolation']
+        # 只看向听数时，第一名也是贪心出牌会选的牌 (关联度相同的牌之间不分先后)
+        best = _greedy_discard(bytearray(counts), 0, False)
+        lowest = min(r['shanten'] for r in ranked)
+        first = min(r['isolation'] for r in ranked if r['shanten'] == lowest)
+        after = bytearray(counts)
+        after[best] -= 1
+        assert isolation(after, best) == first
+    assert ties
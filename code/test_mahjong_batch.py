@@ -0,0 +1,74 @@
+"""mahjong_batch.evaluate_hands 与逐手的 can_hu / waiting_tiles 结果完全一致"""
+
+import itertools
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import mahjong_batch
+from mahjong_tiles import NUM_KINDS
+
+RULES = [{'three_jokers_win': t, 'allow_all_pairs': p} for t, p in itertools.product((False, True), repeat=2)]
+
+
+def _near_wins(n, tiles, seed):
+    """拼出接近胡牌的手牌 (面子 + 将 再随机换掉几张)，金牌数 0~4 轮流取"""
+    rng = random.Random(seed)
+    counts = np.zeros((n, NUM_KINDS), dtype=np.int16)
+    jokers = np.zeros(n, dtype=np.int16)
+    i = 0
+    while i < n:
+        j = i % 5
+        hand = []
+        while len(hand) < tiles - j:
+            if rng.random() < 0.5:
+                start = rng.randrange(3) * 9 + rng.randrange(7)
+                hand.extend(range(start, start + 3))
+            else:
+                hand.extend([rng.randrange(NUM_KINDS)] * rng.choice((2, 3)))
+        hand = hand[:tiles - j]
+        for _ in range(rng.randrange(3)):
+            hand[rng.randrange(len(hand))] = rng.randrange(NUM_KINDS)
+        row = np.bincount(hand, minlength=NUM_KINDS)
+        if row.max() > 4: continue
+        counts[i], jokers[i] = row, j
+        i += 1
+    return counts, jokers
+
+
+def _check(counts, jokers, rules):
+    wins, waits = mahjong_batch.evaluate_hands(counts, jokers, rules)
+    scalar_wins, scalar_waits = mahjong_batch._scalar(counts, jokers, rules)
+    expected = np.zeros_like(waits)
+    for i, codes in enumerate(scalar_waits):
+        expected[i, list(codes)] = True
+    assert wins.tolist() == scalar_wins
+    assert (waits == expected).all()
+    return wins, waits
+
+
+@pytest.mark.parametrize('rules', RULES)
+def test_matches_scalar_on_random_hands(rules):
+    for tiles in (16, 17):
+        counts, jokers = mahjong_batch.random_hands(2000, tiles=tiles, seed=tiles)
+        _check(counts, jokers, rules)
+
+
+@pytest.mark.parametrize('rules', RULES)
+def test_matches_scalar_on_near_wins(rules):
+    for tiles, seed in ((16, 1), (17, 2), (5, 3), (8, 4)):
+        counts, jokers = _near_wins(2000, tiles, seed)
+        wins, waits = _check(counts, jokers, rules)
+        for j in range(5):
+            assert (jokers == j).any()
+        if tiles % 3 == 2:
+            assert wins.any() and not wins.all()
+        else:
+            assert waits.any()
+
+
+def test_empty_batch():
+    wins, waits = mahjong_batch.evaluate_hands(np.zeros((0, NUM_KINDS), dtype=np.int16), np.zeros(0, dtype=np.int16))
+    assert wins.shape == (0,) and waits.shape == (0, NUM_KINDS + 1)
@@ -0,0 +1,168 @@
+"""
+查表式 can_hu 与原来的递归回溯判断 (mahjong_players._can_form_all_melds) 的差分测试。
+
+参考实现按原代码逐分支移植到 34 槽计数向量上，并修正原代码的三个错误：
+    - 以 8、9 开头的顺子整个跳过，金牌不能当 7 (或 7、8) 与 8 9 / 9 组成顺子
+    - 不考虑两张金牌单独做将
+    - 一张真牌加一张金牌做将时 del remaining_counts[pair_tile] 删掉了这种牌的全部张数
+修正后的参考实现必须与 can_hu 完全一致；未修正的原实现能胡的牌 can_hu 也必须能胡，
+反过来原实现判为不能胡、can_hu 判为能胡的牌就是上面三个错误造成的差异 (新判断有意接受的牌)。
+枚举的 98351 手单门花色牌中这样的牌有 753 手 (不允许对子胡；允许时 666 手)，都带 1~4 张金牌。
+"""
+
+import random
+
+import pytest
+
+from mahjong_hu import can_hu
+from mahjong_offline import mahjong_players
+from mahjong_rules import TILE_DEFINITIONS
+from mahjong_tiles import HONOR_START, JOKER, NUM_KINDS
+
+SUITED_PATTERNS_MAX = 8  # 单门花色枚举到 8 张真牌
+
+
+def _baseline_melds(counts, jokers, patched):
+    first = next((i for i, c in enumerate(counts) if c), None)
+    if first is None:
+        return True
+    # 刻子：3 张真牌、2 张真牌 + 1 金、1 张真牌 + 2 金
+    for used in (3, 2, 1):
+        if counts[first] >= used and jokers >= 3 - used:
+            counts[first] -= used
+            ok = _baseline_melds(counts, jokers - (3 - used), patched)
+            counts[first] += used
+            if ok: return True
+    if first >= HONOR_START:
+        return False
+    # 顺子：first 是这门花色里最小的真牌，顺子中比它小的位置只能是金牌
+    pos = first % 9
+    starts = (pos - 2, pos - 1, pos) if patched else ((pos,) if pos < 7 else ())
+    for start in starts:
+        if start < 0 or start + 2 > 8: continue
+        window = [first - pos + start + k for k in range(3)]
+        real = [t for t in window if counts[t] > 0]
+        need = 3 - len(real)
+        if jokers < need: continue
+        for t in real: counts[t] -= 1
+        ok = _baseline_melds(counts, jokers - need, patched)
+        for t in real: counts[t] += 1
+        if ok: return True
+    return False
+
+
+def baseline_can_hu(counts, jokers, three_jokers_win=False, allow_all_pairs=True, patched=True):
+    """原 mahjong_players.can_hu 的逐分支移植；patched=False 时保留原代码的错误"""
+    counts = list(counts)
+    if three_jokers_win and jokers >= 3:
+        return True
+    hand_size = sum(counts) + jokers
+    if allow_all_pairs and hand_size % 2 == 0:
+        holes = sum(c % 2 for c in counts)
+        if jokers >= holes and (jokers - holes) % 2 == 0:
+            return True
+    if (hand_size - 2) % 3 != 0:
+        return False
+    for tile in range(NUM_KINDS):
+        c = counts[tile]
+        if c >= 2:
+            counts[tile] -= 2
+            ok = _baseline_melds(counts, jokers, patched)
+            counts[tile] += 2
+            if ok: return True
+        if c >= 1 and jokers > 0:
+            counts[tile] = c - 1 if patched else 0
+            ok = _baseline_melds(counts, jokers - 1, patched)
+            counts[tile] = c
+            if ok: return True
+    if patched and jokers >= 2 and _baseline_melds(counts, jokers - 2, patched):
+        return True
+    return False
+
+
+def _suit_patterns(max_tiles):
+    """单门花色里每种牌 0~4 张、总数不超过 max_tiles 的全部模式"""
+    def rec(i, left, prefix):
+        if i == 9:
+            yield prefix
+            return
+        for c in range(min(4, left) + 1):
+            yield from rec(i + 1, left - c, prefix + [c])
+    yield from rec(0, max_tiles, [])
+
+
+def _random_hand(rng, jokers, size=17):
+    """随机拼出接近胡牌的手牌 (面子 + 将 再随机换掉几张)，让能胡和不能胡的牌都足够多"""
+    counts = [0] * NUM_KINDS
+    tiles = []
+    while len(tiles) < size - jokers - 2:
+        if rng.random() < 0.5:
+            suit, pos = rng.randrange(3), rng.randrange(7)
+            meld = [suit * 9 + pos + k for k in range(3)]
+        else:
+            meld = [rng.randrange(NUM_KINDS)] * 3
+        tiles.extend(meld)
+    tiles = tiles[:size - jokers - 2] + [rng.randrange(NUM_KINDS)] * 2
+    for _ in range(rng.randrange(3)):
+        tiles[rng.randrange(len(tiles))] = rng.randrange(NUM_KINDS)
+    for t in tiles:
+        counts[t] += 1
+    if max(counts) > 4:
+        return None
+    return counts
+
+
+def _compare(hands, rules):
+    newly_accepted = 0
+    for counts, jokers in hands:
+        expected = baseline_can_hu(counts, jokers, **rules)
+        assert can_hu(bytes(counts), jokers, **rules) == expected, (counts, jokers, rules)
+        if expected and not baseline_can_hu(counts, jokers, patched=False, **rules):
+            newly_accepted += 1
+        elif not expected:
+            assert not baseline_can_hu(counts, jokers, patched=False, **rules)
+    return newly_accepted
+
+
+def _enumerated_hands():
+    """单门花色 (放在条子、字牌两种位置) 的全部模式，配 0~4 张金牌，总张数满足 3n+2 或偶数"""
+    for pattern in _suit_patterns(SUITED_PATTERNS_MAX):
+        for jokers in range(5):
+            size = sum(pattern) + jokers
+            if size == 0 or ((size - 2) % 3 and size % 2): continue
+            yield [0] * 9 + pattern + [0] * (NUM_KINDS - 18), jokers
+            if all(c <= 4 for c in pattern[:7]) and not any(pattern[7:]):
+                yield [0] * HONOR_START + pattern[:7], jokers
+
+
+def test_matches_patched_baseline_on_enumerated_suits():
+    hands = list(_enumerated_hands())
+    newly = _compare(hands, {'three_jokers_win': False, 'allow_all_pairs': False})
+    assert newly > 0  # 修正的三个错误确实改变了结果
+    _compare(hands, {'three_jokers_win': False, 'allow_all_pairs': True})
+
+
+def test_matches_patched_baseline_on_random_hands():
+    rng = random.Random(2024)
+    for jokers in range(5):
+        hands = []
+        while len(hands) < 1500:
+            counts = _random_hand(rng, jokers)
+            if counts is not None: hands.append((counts, jokers))
+        for rules in ({'three_jokers_win': False, 'allow_all_pairs': False},
+                      {'three_jokers_win': True, 'allow_all_pairs': True}):
+            _compare(hands, rules)
+        assert any(can_hu(bytes(c), j) for c, j in hands)
+
+
+def test_player_rejects_unknown_tile_names():
+    """未知的牌名不能当金牌算，与 mahjong_hand 一样抛 ValueError"""
+    player = mahjong_players(0, 'test', TILE_DEFINITIONS)
+    player.tiles = '1w 2w 3w 4w 5w 6w 7w 8w 9w 1o 2o 3o e e e 5t'.split()
+    assert player.can_hu('5t') and player.can_hu(JOKER)
+    assert not player.can_hu('4t')
+    for name in ('spring', 'xx'):
+        with pytest.raises(ValueError):
+            player.can_hu(name)
+        with pytest.raises(ValueError):
+            player.solve_hu(name)
@@ -0,0 +1,48 @@
+"""本地消息代理和一致性哈希环"""
+
+import os
+import tempfile
+import threading
+import uuid
+
+from mahjong_shards import broker, broker_client, hash_ring
+
+
+def test_ring_moves_about_one_nth_on_add():
+    ring = hash_ring(range(4))
+    ids = [str(uuid.UUID(int=i)) for i in range(4000)]
+    before = {i: ring.owner(i) for i in ids}
+    ring.add(4)
+    moved = [i for i in ids if ring.owner(i) != before[i]]
+    assert all(ring.owner(i) == 4 for i in moved)
+    assert 0.1 < len(moved) / len(ids) < 0.3
+
+
+def test_concurrent_publishers_do_not_interleave_frames():
+    path = os.path.join(tempfile.mkdtemp(), 'broker.sock')
+    hub = broker(path)
+    hub.start()
+    try:
+        listener = broker_client(path)
+        listener.subscribe('rooms')
+        listener.publish('rooms', 'ready')  # 同一个连接发出，收到它说明订阅已生效
+        messages = listener.listen()
+        assert next(messages) == 'ready'
+
+        def publish(key):
+            client = broker_client(path)
+            for i in range(10):
+                client.publish('rooms', (key, i, bytes([key]) * 300000))
+            client.close()
+
+        threads = [threading.Thread(target=publish, args=(key,)) for key in (1, 2, 3)]
+        for t in threads: t.start()
+        listener.sock.settimeout(10)
+        received = [next(messages) for _ in range(30)]
+        for t in threads: t.join()
+        assert all(payload == bytes([key]) * 300000 for key, _, payload in received)
+        for key in (1, 2, 3):
+            assert [i for k, i, _ in received if k == key] == list(range(10))
+    finally:
+        hub.shutdown()
+        hub.server_close()
@@ -0,0 +1,27 @@
+"""mahjong_sim 复用对局对象时的结果与新建对局一致"""
+
+import mahjong_sim
+from mahjong_offline import mahjong_game
+
+
+def _strip(result):
+    return {k: v for k, v in result.items() if k != 'duration'}
+
+
+def test_reused_game_matches_fresh_game():
+    game = mahjong_game(seed=0, verbose=False)
+    for seed in range(8):
+        dealer = seed % 4
+        fresh = mahjong_sim.play_game(seed, dealer=dealer)
+        reused = mahjong_sim.play_game(seed, dealer=dealer, game=game)
+        assert _strip(reused) == _strip(fresh)
+        assert reused['dealer_streak'] == 0
+
+
+def test_reused_match_matches_fresh_match():
+    game = mahjong_game(seed=0, verbose=False)
+    for seed in range(3):
+        fresh = mahjong_sim.play_match(seed, 4, dealer=seed % 4)
+        reused = mahjong_sim.play_match(seed, 4, dealer=seed % 4, game=game)
+        assert [_strip(r) for r in reused] == [_strip(r) for r in fresh]
+        assert fresh[0]['dealer_streak'] == 0